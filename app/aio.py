@@ -0,0 +1,111 @@
+"""asyncio front end for the engine.
+
+    async for result in watermark_batch(paths, wm, exp, concurrency=4):
+        ...
+
+Each item is read and written on an I/O thread pool and decoded, watermarked and
+encoded on ``executor`` (a private thread pool by default; pass a ProcessPoolExecutor
+to keep pure-Python work off the GIL). At most ``concurrency`` items are in flight, and
+results are yielded as they finish, so the event loop is never blocked by the engine.
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+from .engine import (
+    WatermarkSettings, ExportSettings, atomic_output, check_output_folder, export_bytes, output_base_name,
+)
+
+
+@dataclass
+class AsyncExportResult:
+    index: int  # position in the input sequence
+    path: str
+    ok: bool
+    outputs: List[str] = field(default_factory=list)
+    error: str = ""
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _encode(data: bytes, wm: WatermarkSettings, exp: ExportSettings) -> List[Tuple[str, bytes]]:
+    # bytes copies: results may cross a process boundary, and memoryviews do not pickle
+    return [(o.name_tail, o.data.tobytes()) for o in export_bytes(data, wm, exp)]
+
+
+def _write(path: str, encoded: List[Tuple[str, bytes]], exp: ExportSettings) -> List[str]:
+    base_name = output_base_name(path, exp)
+    out_paths = []
+    for tail, data in encoded:
+        out_path = os.path.join(exp.output_dir, base_name + tail)
+        with atomic_output(out_path) as f:
+            f.write(data)
+        out_paths.append(out_path)
+    return out_paths
+
+
+async def export_one(path: str, wm: WatermarkSettings, exp: ExportSettings,
+                     executor: Optional[Executor] = None, io_executor: Optional[Executor] = None) -> List[str]:
+    """Async equivalent of engine.export_renditions; raises on failure."""
+    loop = asyncio.get_running_loop()
+    check_output_folder(path, exp)
+    data = await loop.run_in_executor(io_executor, _read, path)
+    encoded = await loop.run_in_executor(executor, _encode, data, wm, exp)
+    return await loop.run_in_executor(io_executor, _write, path, encoded, exp)
+
+
+async def watermark_batch(paths: Iterable[str], wm: WatermarkSettings, exp: ExportSettings,
+                          concurrency: int = 4, executor: Optional[Executor] = None
+                          ) -> AsyncIterator[AsyncExportResult]:
+    """Export ``paths`` with at most ``concurrency`` in flight, yielding results in completion order.
+
+    ``paths`` is consumed lazily, so a long generator does not create one task per file
+    up front. Leaving the loop early cancels the items not yet started. An exception
+    raised by ``paths`` itself is re-raised here once it occurs.
+    """
+    concurrency = max(1, concurrency)
+    loop = asyncio.get_running_loop()
+    io_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wm-io")
+    cpu_pool = executor or ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="wm-cpu")
+    results: "asyncio.Queue[Optional[AsyncExportResult]]" = asyncio.Queue()
+    todo = iter(enumerate(paths))
+
+    async def worker():
+        try:
+            for index, path in todo:  # shared iterator: each item goes to exactly one worker
+                try:
+                    outs = await export_one(path, wm, exp, cpu_pool, io_pool)
+                    result = AsyncExportResult(index, path, True, outs)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    result = AsyncExportResult(index, path, False, error=str(e))
+                await results.put(result)
+        finally:
+            # also when ``paths`` raises: the consumer waits for one sentinel per worker
+            results.put_nowait(None)
+
+    workers: List["asyncio.Future"] = []
+    try:
+        await loop.run_in_executor(io_pool, lambda: os.makedirs(exp.output_dir, exist_ok=True))
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        running = len(workers)
+        while running:
+            result = await results.get()
+            if result is None:
+                running -= 1
+                for w in workers:  # the worker that posted it is done by now
+                    if w.done() and not w.cancelled() and w.exception() is not None:
+                        raise w.exception()
+            else:
+                yield result
+    finally:
+        for w in workers:
+            w.cancel()
+        io_pool.shutdown(wait=False, cancel_futures=True)
+        if executor is None:
+            cpu_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,193 @@
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from .engine import WatermarkSettings, ExportSettings, check_output_folder, cache_stats
+from .journal import ExportJournal, settings_fingerprint
+from .scheduler import AdmissionController, export_parallel, plan_jobs
+from .sinks import OutputSink, open_sink
+
+# current, total, path, ok, message_or_out — same shape as ExportWorker.progress
+ProgressCallback = Callable[[int, int, str, bool, str], None]
+# message prefix of files skipped because the journal lists them as exported
+RESUMED_MESSAGE = "已完成，跳过: "
+
+
+@dataclass
+class BatchResult:
+    success: int = 0
+    total: int = 0
+    resumed: int = 0  # skipped because the journal shows them already exported
+    # text watermark tile cache lookups during the batch (the preview shares the cache)
+    text_tile_hits: int = 0
+    text_tile_misses: int = 0
+    # content-identical inputs; the first path of each group was rendered, the rest linked
+    duplicate_groups: List[List[str]] = field(default_factory=list)
+    # (path, ok, message_or_out) per input, in input order whatever order they ran in
+    outcomes: List[Tuple[str, bool, str]] = field(default_factory=list)
+    workers: int = 0  # most exports that ran at once
+    peak_memory_estimate: int = 0  # bytes; highest admitted total of the estimates in flight
+    stopped: bool = False  # should_stop() ended the run early
+    pending: List[str] = field(default_factory=list)  # inputs not processed because of the stop
+
+    @property
+    def failures(self) -> List[Tuple[str, str]]:
+        """(path, error) of every failed input, in input order; ``pending`` inputs never ran."""
+        pending = set(self.pending)
+        return [(p, msg) for p, ok, msg in self.outcomes if not ok and p not in pending]
+
+    @property
+    def text_tile_hit_rate(self) -> float:
+        total = self.text_tile_hits + self.text_tile_misses
+        return self.text_tile_hits / total if total else 0.0
+
+
+def run_batch(files: List[str], wm: WatermarkSettings, exp: ExportSettings,
+              on_progress: Optional[ProgressCallback] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> BatchResult:
+    """Export ``files``, reporting each through ``on_progress`` as it finishes.
+
+    Up to ``exp.export_workers`` exports run at once, largest first, admitted by
+    estimated peak memory against ``exp.memory_budget_mb`` (see scheduler.py). Progress
+    follows that plan rather than completion order, so the same inputs always report in
+    the same order; ``BatchResult.outcomes`` is in input order.
+
+    With ``exp.dedup_inputs`` the inputs are grouped by content first: each unique
+    source is rendered once and the other names get hard links (or copies) of its outputs.
+    Finished items are journaled in the output folder; with ``exp.resume_export`` a later
+    run over the same folder and settings skips them. With ``exp.archive_format`` every
+    output goes into one archive in the output folder instead (see sinks.py); if it
+    cannot be completed, the items written to it are reported as failed. If the output
+    folder or archive cannot be opened at all, every input is reported as failed.
+
+    When ``should_stop()`` turns True, no further export starts; the running ones finish
+    and are reported, and the inputs never started are listed in ``pending``.
+    """
+    result = BatchResult(total=len(files), outcomes=[(p, False, "") for p in files])
+    rep_of: Dict[str, str] = {}
+    if exp.dedup_inputs and len(files) > 1:
+        from .dedup import group_duplicates, duplicate_groups
+        groups = group_duplicates(files)
+        result.duplicate_groups = duplicate_groups(groups)
+        rep_of = {p: g[0] for g in result.duplicate_groups for p in g[1:]}
+
+    fingerprint = settings_fingerprint(wm, exp)
+    journal = ExportJournal(exp.output_dir, fingerprint)
+    try:
+        journal.open()  # clears stale temp files, so before the sink creates its own
+        sink = open_sink(exp, fingerprint, journal.temp_tag)
+    except Exception as e:
+        # unusable output folder or archive: no input can be exported
+        journal.close()
+        for i, p in enumerate(files):
+            result.outcomes[i] = (p, False, str(e))
+            if on_progress:
+                on_progress(i + 1, result.total, p, False, str(e))
+        return result
+    tiles_before = cache_stats()["text_tile"]
+    rendered: Dict[str, Tuple[bool, List[str], str]] = {}  # representative -> ok, outputs, error
+    resumed: Dict[int, List[str]] = {}
+    try:
+        if exp.resume_export:
+            for i, p in enumerate(files):
+                done = journal.completed(p, sink.size_of)
+                if done is not None:
+                    resumed[i] = done
+        to_render = [i for i, p in enumerate(files) if i not in resumed and p not in rep_of]
+        controller = AdmissionController.for_settings(exp)
+        plan = plan_jobs([files[i] for i in to_render], exp, controller)
+
+        # report order: resumed items, then the renders in plan order, each followed by
+        # its duplicates. It depends only on the inputs, not on which export finishes first.
+        followers: Dict[str, List[int]] = {}
+        for i, p in enumerate(files):
+            if i not in resumed and p in rep_of:
+                followers.setdefault(rep_of[p], []).append(i)
+        sequence: List[int] = []
+        for i in sorted(resumed) + [to_render[k] for k, _ in plan]:
+            sequence.append(i)
+            sequence.extend(followers.pop(files[i], []))
+        for dups in followers.values():  # representative not in this batch's plan
+            sequence.extend(dups)
+        rendering = set(to_render)
+        finished: Dict[int, Tuple[bool, List[str], str]] = {}
+        reported = 0
+
+        def report_ready():
+            nonlocal reported
+            while reported < len(sequence) and (sequence[reported] not in rendering
+                                                or sequence[reported] in finished):
+                i = sequence[reported]
+                p = files[i]
+                reported += 1
+                done = resumed.get(i)
+                if done is not None:
+                    ok, outs, msg = True, done, RESUMED_MESSAGE + "; ".join(done)
+                    result.resumed += 1
+                elif p in rep_of:
+                    ok, outs, msg = _export_duplicate(p, rep_of[p], rendered.get(rep_of[p]), exp, sink)
+                else:
+                    ok, outs, msg = finished.pop(i)
+                rendered[p] = (ok, outs, "" if ok else msg)
+                result.outcomes[i] = (p, ok, msg)
+                if ok:
+                    result.success += 1
+                    if done is None:
+                        _record(journal, p, outs, sink)
+                if on_progress:
+                    on_progress(reported, result.total, p, ok, msg)
+
+        report_ready()
+        for k, outcome in export_parallel([job for _, job in plan], wm, exp, controller, should_stop, sink):
+            finished[to_render[plan[k][0]]] = outcome
+            report_ready()
+        if reported < len(sequence):
+            # stopped: report what did finish (and its duplicates); the rest stays pending
+            result.stopped = True
+            pending = {i for i in sequence[reported:] if i in rendering and i not in finished}
+            not_started = {files[i] for i in pending}
+            pending |= {i for i in sequence[reported:] if rep_of.get(files[i]) in not_started}
+            sequence = sequence[:reported] + [i for i in sequence[reported:] if i not in pending]
+            report_ready()
+            result.pending = [files[i] for i in sorted(pending)]
+        result.workers = controller.max_running
+        result.peak_memory_estimate = controller.peak_in_use
+    except BaseException:
+        sink.abort()
+        raise
+    finally:
+        journal.close()
+        tiles_after = cache_stats()["text_tile"]
+        result.text_tile_hits = int(tiles_after["hits"] - tiles_before["hits"])
+        result.text_tile_misses = int(tiles_after["misses"] - tiles_before["misses"])
+    try:
+        sink.close()
+    except Exception as e:
+        # nothing written this run reached the archive
+        for i, (p, ok, _) in enumerate(result.outcomes):
+            if ok and i not in resumed:
+                result.outcomes[i] = (p, False, str(e))
+                result.success -= 1
+    return result
+
+
+def _record(journal: ExportJournal, path: str, outs: List[str], sink: OutputSink) -> None:
+    try:
+        journal.record(path, outs, sink.size_of)
+    except OSError:
+        pass  # the export itself succeeded; this item just won't be skipped on resume
+
+
+def _export_duplicate(path: str, rep: str, rep_result, exp: ExportSettings,
+                      sink: OutputSink) -> Tuple[bool, List[str], str]:
+    from .dedup import alias_outputs
+    if rep_result is None or not rep_result[0]:
+        err = rep_result[2] if rep_result else "representative was not exported"
+        return False, [], f"与 {os.path.basename(rep)} 内容相同，其导出失败: {err}"
+    try:
+        check_output_folder(path, exp)
+        outs = alias_outputs(rep, rep_result[1], path, exp)
+        for src, dst in zip(rep_result[1], outs):
+            sink.alias(src, dst)
+    except Exception as e:
+        return False, [], str(e)
+    return True, outs, "; ".join(outs) + f"（与 {os.path.basename(rep)} 内容相同）"
@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from PIL import Image
+from .engine import load_source, _LANCZOS
+from .metadata import SourceMetadata
+
+CacheKey = Tuple[str, int, int, int]  # abspath, mtime_ns, file size, max_side (0 = full resolution)
+CacheEntry = Tuple[Image.Image, SourceMetadata]
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def _image_bytes(im: Image.Image) -> int:
+    return im.width * im.height * len(im.getbands())
+
+
+class DecodedImageCache:
+    """Memory-bounded LRU of decoded, upright source images.
+
+    Entries are keyed by file identity (path, mtime, size) and the requested
+    ``max_side``, so an edited file is never served stale. Cached images are
+    shared between threads: callers must treat them as read-only.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # keys being decoded right now; concurrent requests wait instead of decoding twice
+        self._loading: Dict[CacheKey, threading.Event] = {}
+        self._prefetcher = None  # ThreadPoolExecutor, created on the first prefetch
+        self._prefetch_gen = 0
+
+    @staticmethod
+    def _key(path: str, max_side: Optional[int]) -> Optional[CacheKey]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), st.st_mtime_ns, st.st_size, max_side or 0
+
+    def peek(self, path: str, max_side: Optional[int] = None) -> Optional[CacheEntry]:
+        """Cached entry for ``path`` or None; never decodes."""
+        key = self._key(path, max_side)
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+    def get(self, path: str, max_side: Optional[int] = None) -> CacheEntry:
+        """Decoded image for ``path`` reduced to ``max_side`` (None = full resolution)."""
+        key = self._key(path, max_side)
+        if key is None:
+            return load_source(path, max_side)  # raises the usual open error
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                pending = self._loading.get(key)
+                if pending is None:
+                    self._loading[key] = threading.Event()
+                    self.misses += 1
+                    full = self._entries.get(key[:3] + (0,)) if max_side else None
+                    break
+            pending.wait()
+        try:
+            if full is not None:
+                # a full-resolution decode is already here: downscaling beats decoding again
+                im = full[0].copy()
+                im.thumbnail((max_side, max_side), _LANCZOS)
+                entry = (im, full[1])
+            else:
+                im, meta = load_source(path, max_side)
+                im.load()
+                entry = (im, meta)
+            self._store(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _store(self, key: CacheKey, entry: CacheEntry) -> None:
+        size = _image_bytes(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= _image_bytes(old)
+
+    def prefetch(self, paths: Iterable[str], max_side: Optional[int] = None) -> None:
+        """Decode ``paths`` in the background; supersedes any earlier prefetch still queued."""
+        with self._lock:
+            self._prefetch_gen += 1
+            gen = self._prefetch_gen
+            if self._prefetcher is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        for p in paths:
+            self._prefetcher.submit(self._prefetch_one, gen, p, max_side)
+
+    def _prefetch_one(self, gen: int, path: str, max_side: Optional[int]) -> None:
+        if gen != self._prefetch_gen:
+            return
+        try:
+            self.get(path, max_side)
+        except Exception:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# Shared by the preview and the export path
+shared_cache = DecodedImageCache()
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+# Inputs are grouped in three passes, each only over files the previous pass could not
+# tell apart: file size, a hash of a few sampled chunks, and finally the whole file.
+CHUNK_SIZE = 64 * 1024
+_SAMPLES = 3  # head, middle, tail
+
+
+def _sample_hash(path: str, size: int) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= CHUNK_SIZE * _SAMPLES:
+            h.update(f.read())
+        else:
+            for off in (0, (size - CHUNK_SIZE) // 2, size - CHUNK_SIZE):
+                f.seek(off)
+                h.update(f.read(CHUNK_SIZE))
+    return h.digest()
+
+
+def _full_hash(path: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.digest()
+
+
+def _split(paths: List[str], key) -> List[List[str]]:
+    buckets: "OrderedDict[object, List[str]]" = OrderedDict()
+    for p in paths:
+        try:
+            k = key(p)
+        except OSError:
+            k = ("unreadable", p)  # left on its own; the export reports the error
+        buckets.setdefault(k, []).append(p)
+    return list(buckets.values())
+
+
+def group_duplicates(paths: List[str]) -> List[List[str]]:
+    """Group ``paths`` by identical content, preserving input order.
+
+    Every path appears in exactly one group; the first path of a group is the one
+    to render. Groups of one are files with no duplicate.
+    """
+    sizes: Dict[str, int] = {}
+
+    def size_of(p: str) -> int:
+        sizes[p] = os.path.getsize(p)
+        return sizes[p]
+
+    groups: List[List[str]] = []
+    for by_size in _split(paths, size_of):
+        if len(by_size) == 1:
+            groups.append(by_size)
+            continue
+        size = sizes[by_size[0]]
+        for by_sample in _split(by_size, lambda p: _sample_hash(p, size)):
+            if len(by_sample) == 1 or size <= CHUNK_SIZE * _SAMPLES:
+                groups.append(by_sample)  # small files were hashed whole already
+            else:
+                groups.extend(_split(by_sample, _full_hash))
+    order = {p: i for i, p in reversed(list(enumerate(paths)))}
+    groups.sort(key=lambda g: order[g[0]])
+    return groups
+
+
+def duplicate_groups(groups: List[List[str]]) -> List[List[str]]:
+    return [g for g in groups if len(g) > 1]
+
+
+def alias_outputs(rep_src: str, rep_outputs: List[str], dup_src: str, exp) -> List[str]:
+    """Output paths ``dup_src`` would have had, given what ``rep_src`` produced.
+
+    Output names are ``base_name + suffix + ext``, so swapping the base name keeps
+    every rendition suffix and extension.
+    """
+    from .engine import output_base_name
+    rep_base = output_base_name(rep_src, exp)
+    dup_base = output_base_name(dup_src, exp)
+    aliased = []
+    for out in rep_outputs:
+        name = os.path.basename(out)
+        rest = name[len(rep_base):] if name.startswith(rep_base) else os.path.splitext(name)[1]
+        aliased.append(os.path.join(os.path.dirname(out), dup_base + rest))
+    return aliased
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """Hard-link ``dst`` to ``src``, copying when links are unsupported; returns "link" or "copy"."""
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return "link"
+    if os.path.lexists(dst):
+        os.remove(dst)  # exports overwrite, and os.link refuses an existing target
+    try:
+        os.link(src, dst)
+        return "link"
+    except OSError:
+        from .engine import atomic_output
+        with open(src, "rb") as fsrc, atomic_output(dst) as fdst:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+        shutil.copystat(src, dst)
+        return "copy"
+
+
+def summarize(groups: List[List[str]], limit: int = 10) -> Tuple[int, str]:
+    """(number of skipped renders, human-readable grouping) for the export summary."""
+    dups = duplicate_groups(groups)
+    skipped = sum(len(g) - 1 for g in dups)
+    lines = [
+        f"{os.path.basename(g[0])} = " + ", ".join(os.path.basename(p) for p in g[1:])
+        for g in dups[:limit]
+    ]
+    if len(dups) > limit:
+        lines.append(f"… 另有 {len(dups) - limit} 组")
+    return skipped, "\n".join(lines)
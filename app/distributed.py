@@ -0,0 +1,343 @@
+"""Split one export across machines through a shared directory (e.g. a NAS mount).
+
+    python -m app.distributed submit SHARED_DIR FILES... [--template NAME] [--chunk 8] [--spawn N]
+    python -m app.distributed worker JOB_DIR [--id NAME]
+    python -m app.distributed status JOB_DIR
+
+A job is a folder under the shared directory:
+
+    job.json            settings snapshot (templates.serialize layout) and item count
+    todo/000042.json    one work item: a few source paths
+    claimed/000042.json@<worker>   being processed; its mtime is the worker's heartbeat
+    status/000042.json  per-source results written by the worker that finished the item
+    done/000042.json    finished item
+
+Workers claim items by renaming them from todo/ into claimed/ under a name that
+includes their id. A rename within one file system is atomic, so exactly one worker
+wins each item. Claims whose heartbeat is older than ``stale_after`` seconds are
+renamed back to todo/ by any worker, and an item abandoned ``max_attempts`` times is
+closed as failed. Sources and the output folder must be reachable under the same paths
+on every machine, and machine clocks should be roughly in sync (NTP).
+"""
+import argparse
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from .engine import WatermarkSettings, ExportSettings, atomic_output, export_renditions
+
+JOB_FILE = "job.json"
+DEFAULT_STALE_AFTER = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+_DIRS = ("todo", "claimed", "status", "done")
+
+
+def _write_json(path: str, data) -> None:
+    with atomic_output(path) as f:
+        f.write(json.dumps(data, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _item_id(name: str) -> str:
+    return name.split(".", 1)[0]
+
+
+def _is_item(name: str) -> bool:
+    # item files and claims, not the hidden temp files atomic writes leave while in progress
+    return not name.startswith(".") and (name.endswith(".json") or ".json@" in name)
+
+
+def _items(job_dir: str, d: str) -> List[str]:
+    try:
+        return sorted(n for n in os.listdir(os.path.join(job_dir, d)) if _is_item(n))
+    except OSError:
+        return []
+
+
+# ---------------------------------------------------------------- coordinator
+
+def submit_job(shared_dir: str, files: List[str], wm: WatermarkSettings, exp: ExportSettings,
+               chunk: int = 8, job_id: Optional[str] = None) -> str:
+    """Write a job for ``files`` into ``shared_dir``; returns the job folder."""
+    from . import templates as tmpl
+    job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    job_dir = os.path.join(shared_dir, job_id)
+    for d in _DIRS:
+        os.makedirs(os.path.join(job_dir, d), exist_ok=True)
+    chunk = max(1, chunk)
+    items = [files[i:i + chunk] for i in range(0, len(files), chunk)]
+    for n, sources in enumerate(items):
+        _write_json(os.path.join(job_dir, "todo", f"{n:06d}.json"),
+                    {"item": n, "first_index": n * chunk, "sources": sources, "attempts": 0})
+    # job.json last: workers treat a job without it as not yet submitted
+    _write_json(os.path.join(job_dir, JOB_FILE), {
+        "job_id": job_id,
+        "settings": tmpl.serialize(wm, exp),
+        "items": len(items),
+        "files": len(files),
+        "created": time.time(),
+    })
+    return job_dir
+
+
+def job_status(job_dir: str) -> Dict[str, int]:
+    counts = {d: len(_items(job_dir, d)) for d in _DIRS}
+    results = collect_results(job_dir)
+    counts["files_ok"] = sum(1 for r in results if r["ok"])
+    counts["files_failed"] = sum(1 for r in results if not r["ok"])
+    return counts
+
+
+def collect_results(job_dir: str) -> List[Dict]:
+    """Per-source results of finished items, in submission order."""
+    results = []
+    status_dir = os.path.join(job_dir, "status")
+    for name in _items(job_dir, "status"):
+        if name.endswith(".json"):
+            try:
+                results.extend(_read_json(os.path.join(status_dir, name))["results"])
+            except (OSError, ValueError, KeyError):
+                continue
+    results.sort(key=lambda r: r["index"])
+    return results
+
+
+def requeue_stale(job_dir: str, stale_after: float = DEFAULT_STALE_AFTER,
+                  max_attempts: int = DEFAULT_MAX_ATTEMPTS, by: str = "coordinator") -> int:
+    """Return stale claims to todo/ (or close them as failed); returns how many were handled."""
+    claimed_dir = os.path.join(job_dir, "claimed")
+    now = time.time()
+    handled = 0
+    for name in _items(job_dir, "claimed"):
+        path = os.path.join(claimed_dir, name)
+        try:
+            if now - os.stat(path).st_mtime < stale_after:
+                continue
+        except OSError:
+            continue
+        item_id = _item_id(name)
+        # take the stale claim over with a rename, so only one worker requeues it
+        mine = os.path.join(claimed_dir, f"{item_id}.json@requeue-{by}")
+        try:
+            os.rename(path, mine)
+            os.utime(mine, None)
+            item = _read_json(mine)
+        except (OSError, ValueError):
+            continue
+        item["attempts"] = item.get("attempts", 0) + 1
+        try:
+            if item["attempts"] >= max_attempts:
+                _finish_item(job_dir, item_id, mine, [
+                    _result(item, i, src, False, error=f"abandoned by workers {item['attempts']} times")
+                    for i, src in enumerate(item["sources"])
+                ], worker=by)
+            else:
+                # write the bumped copy first, then drop the claim: a crash in between
+                # leaves a claim that goes stale and is requeued again, not a lost item
+                _write_json(os.path.join(job_dir, "todo", item_id + ".json"), item)
+                os.remove(mine)
+            handled += 1
+        except (OSError, KeyError, TypeError):
+            continue
+    return handled
+
+
+# ---------------------------------------------------------------- worker
+
+def _result(item: Dict, i: int, src: str, ok: bool, outputs=None, error: str = "") -> Dict:
+    return {"index": item["first_index"] + i, "src": src, "ok": ok, "outputs": outputs or [], "error": error}
+
+
+def _finish_item(job_dir: str, item_id: str, claim_path: str, results: List[Dict], worker: str) -> None:
+    # the claim first: if it was taken over meanwhile this raises, and no status claims
+    # results for an item that someone else now owns
+    os.replace(claim_path, os.path.join(job_dir, "done", item_id + ".json"))
+    _write_json(os.path.join(job_dir, "status", item_id + ".json"),
+                {"item": item_id, "worker": worker, "finished": time.time(), "results": results})
+
+
+def _claim(job_dir: str, worker_id: str) -> Optional[Tuple[str, str]]:
+    """Claim one todo item; returns (item id, claim path) or None when todo/ is empty."""
+    todo_dir = os.path.join(job_dir, "todo")
+    for name in _items(job_dir, "todo"):
+        claim_path = os.path.join(job_dir, "claimed", f"{name}@{worker_id}")
+        try:
+            os.rename(os.path.join(todo_dir, name), claim_path)
+        except OSError:
+            continue  # another worker won this one
+        # on network file systems a retried rename can report success to both
+        # clients; only the holder of the claim-named file owns the item
+        if os.path.exists(claim_path):
+            os.utime(claim_path, None)  # heartbeat starts now, not at submit time
+            return _item_id(name), claim_path
+    return None
+
+
+class _Heartbeat(threading.Thread):
+    """Touches the claim file while an item is processed, so it is not seen as stale."""
+
+    def __init__(self, path: str, interval: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                os.utime(self.path, None)
+            except OSError:
+                return  # requeued under us; finishing will notice
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _load_job(job_dir: str, poll: float, wait: float):
+    """Settings of the job at ``job_dir``, or None if job.json stays unreadable for ``wait`` seconds.
+
+    A job being submitted has no job.json yet, and one being removed loses it; neither
+    is worth crashing a worker over.
+    """
+    from . import templates as tmpl
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            return tmpl.deserialize(_read_json(os.path.join(job_dir, JOB_FILE))["settings"])
+        except (OSError, ValueError, KeyError, TypeError):
+            if not os.path.isdir(job_dir) or time.monotonic() >= deadline:
+                return None
+        time.sleep(poll)
+
+
+def run_worker(job_dir: str, worker_id: Optional[str] = None, poll: float = 1.0,
+               stale_after: float = DEFAULT_STALE_AFTER, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+               log=print) -> int:
+    """Process items of the job at ``job_dir`` until none are left; returns items finished.
+
+    Returns 0 without claiming anything when the job's job.json cannot be read.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    settings = _load_job(job_dir, poll, stale_after)
+    if settings is None:
+        log(f"[{worker_id}] {job_dir}: no readable {JOB_FILE}, skipping the job")
+        return 0
+    wm, exp = settings
+    heartbeat_every = max(1.0, stale_after / 5)
+    finished = 0
+    while True:
+        requeue_stale(job_dir, stale_after, max_attempts, by=worker_id)
+        claimed = _claim(job_dir, worker_id)
+        if claimed is None:
+            if not _items(job_dir, "todo") and not _items(job_dir, "claimed"):
+                return finished
+            time.sleep(poll)  # others still busy; their items may come back if they die
+            continue
+        item_id, claim_path = claimed
+        try:
+            item = _read_json(claim_path)
+            sources = item["sources"]
+        except (OSError, ValueError, KeyError, TypeError):
+            continue  # unreadable claim: it goes stale and is requeued or closed
+        beat = _Heartbeat(claim_path, heartbeat_every)
+        beat.start()
+        results = []
+        try:
+            for i, src in enumerate(sources):
+                try:
+                    results.append(_result(item, i, src, True, outputs=export_renditions(src, wm, exp)))
+                except Exception as e:
+                    results.append(_result(item, i, src, False, error=str(e)))
+        finally:
+            beat.stop()
+        try:
+            _finish_item(job_dir, item_id, claim_path, results, worker_id)
+            finished += 1
+            ok = sum(r["ok"] for r in results)
+            log(f"[{worker_id}] item {item_id}: {ok}/{len(results)} ok")
+        except OSError:
+            # the claim was requeued while we worked; outputs are written atomically,
+            # so whoever processes it again just rewrites identical files
+            log(f"[{worker_id}] item {item_id}: claim lost, leaving it to the new owner")
+
+
+# ---------------------------------------------------------------- command line
+
+def _spawn_local_workers(job_dir: str, n: int, stale_after: float) -> int:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+    procs = [
+        subprocess.Popen([sys.executable, "-m", "app.distributed", "worker", job_dir,
+                          "--id", f"local{i}", "--stale-after", str(stale_after)], env=env)
+        for i in range(n)
+    ]
+    return max(p.wait() for p in procs)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Distributed export through a shared directory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("submit", help="create a job")
+    p.add_argument("shared_dir")
+    p.add_argument("files", nargs="+")
+    p.add_argument("--template", help="saved template name (default: last GUI settings)")
+    p.add_argument("--output", help="override the output folder")
+    p.add_argument("--chunk", type=int, default=8, help="sources per work item")
+    p.add_argument("--spawn", type=int, default=0, help="also run N local workers and wait")
+    p.add_argument("--stale-after", type=float, default=DEFAULT_STALE_AFTER)
+
+    p = sub.add_parser("worker", help="process items of a job")
+    p.add_argument("job_dir")
+    p.add_argument("--id", default=None)
+    p.add_argument("--poll", type=float, default=1.0)
+    p.add_argument("--stale-after", type=float, default=DEFAULT_STALE_AFTER)
+    p.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    p = sub.add_parser("status", help="show job progress")
+    p.add_argument("job_dir")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "submit":
+        from . import templates as tmpl
+        loaded = tmpl.load_template(args.template) if args.template else tmpl.load_last()
+        if args.template and loaded is None:
+            print(f"unknown template: {args.template}", file=sys.stderr)
+            return 2
+        wm, exp = loaded or (WatermarkSettings(), ExportSettings())
+        if args.output:
+            exp.output_dir = args.output
+        if not exp.output_dir:
+            print("no output folder: pass --output", file=sys.stderr)
+            return 2
+        # cmd.exe passes wildcards through unexpanded
+        files = [os.path.abspath(f) for pat in args.files
+                 for f in (sorted(glob.glob(pat)) if glob.has_magic(pat) else [pat])]
+        exp.output_dir = os.path.abspath(exp.output_dir)
+        job_dir = submit_job(args.shared_dir, files, wm, exp, args.chunk)
+        print(job_dir)
+        if args.spawn:
+            _spawn_local_workers(job_dir, args.spawn, args.stale_after)
+            print(json.dumps(job_status(job_dir)))
+        return 0
+    if args.cmd == "worker":
+        n = run_worker(args.job_dir, args.id, args.poll, args.stale_after, args.max_attempts)
+        print(f"worker finished {n} items")
+        return 0
+    print(json.dumps(job_status(args.job_dir), indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,22 @@
 from __future__ import annotations
+import io
+import math
 import os
-from dataclasses import dataclass, field
-from typing import Optional, Tuple, Literal
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Literal, Union
+from PIL import Image
+from .inputs import MemoryReader, open_image, release_mapping
+from .metadata import SourceMetadata, read_metadata, apply_orientation, save_kwargs
+
+# ImageDraw/ImageFont/ImageEnhance are imported on first use to keep GUI startup light
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from PIL import ImageFont
+    from .sinks import OutputSink
 
 # Pillow resampling compatibility (Pillow 9/10+)
 try:
@@ -53,6 +67,23 @@ class WatermarkSettings:
     free_pos_norm: Optional[Tuple[float, float]] = None
 
 
+ResizeMode = Literal["none", "width", "height", "percent", "long_edge"]
+OutputFormat = Literal["JPEG", "PNG", "WEBP"]
+
+OUTPUT_EXTS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+
+@dataclass
+class Rendition:
+    """An extra output written next to the primary one, e.g. a WebP or a thumbnail."""
+    suffix: str = ""  # appended to the output name, e.g. "_1600"
+    out_format: OutputFormat = "JPEG"
+    quality: int = 90  # 0-100, JPEG and WEBP
+    resize_mode: ResizeMode = "none"
+    resize_value: int = 0
+    target_size_kb: int = 0  # JPEG only, see ExportSettings.target_size_kb
+
+
 @dataclass
 class ExportSettings:
     output_dir: str = ""
@@ -60,10 +91,41 @@ class ExportSettings:
     naming_mode: Literal["keep", "prefix", "suffix"] = "suffix"
     prefix: str = "wm_"
     suffix: str = "_watermarked"
-    out_format: Literal["JPEG", "PNG"] = "JPEG"
+    out_format: OutputFormat = "JPEG"
     jpeg_quality: int = 90  # 0-100
-    resize_mode: Literal["none", "width", "height", "percent"] = "none"
-    resize_value: int = 0  # px for width/height, percent for percent
+    resize_mode: ResizeMode = "none"
+    resize_value: int = 0  # px for width/height/long_edge, percent for percent
+    # JPEG byte budget in KB; >0 searches the highest quality (<= jpeg_quality) that fits
+    target_size_kb: int = 0
+    # JPEG->JPEG without resizing: composite only the MCU blocks under the watermark, then
+    # re-encode the whole image with the source quantization tables and subsampling (so
+    # unchanged blocks lose very little, though not nothing); other inputs take the normal path
+    jpeg_region_reencode: bool = False
+    keep_metadata: bool = True  # copy EXIF/ICC bytes from the source
+    strip_gps: bool = False  # scrub the GPS block from copied EXIF
+    # render content-identical inputs once and hard-link (or copy) the outputs to the other names
+    dedup_inputs: bool = False
+    # skip sources the output folder's export journal lists as finished with these settings
+    # (and continue an existing archive); off by default so a re-export redoes every file
+    resume_export: bool = False
+    # parallel exports in a batch; 0 = one per CPU
+    export_workers: int = 0
+    # estimated peak memory of the exports in flight, in MB; 0 = half of the free memory
+    memory_budget_mb: int = 0
+    # "zip"/"tar": a batch writes its outputs into one archive in output_dir, named
+    # archive_name plus the extension, instead of separate files (see sinks.py)
+    archive_format: Literal["", "zip", "tar"] = ""
+    archive_name: str = "watermarked"
+    # extra outputs rendered from the same decode and watermark pass as the primary output
+    renditions: List[Rendition] = field(default_factory=list)
+
+    def all_renditions(self) -> List[Rendition]:
+        primary = Rendition(
+            suffix="", out_format=self.out_format, quality=self.jpeg_quality,
+            resize_mode=self.resize_mode, resize_value=self.resize_value,
+            target_size_kb=self.target_size_kb,
+        )
+        return [primary] + list(self.renditions)
 
 
 DEFAULT_FONT_CANDIDATES = [
@@ -75,6 +137,7 @@ DEFAULT_FONT_CANDIDATES = [
 
 
 def load_font(path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
+    from PIL import ImageFont
     if path and os.path.exists(path):
         try:
             return ImageFont.truetype(path, size)
@@ -88,24 +151,30 @@ def load_font(path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
     return ImageFont.load_default()
 
 
-def apply_resize(im: Image.Image, exp: ExportSettings) -> Image.Image:
-    if exp.resize_mode == "none":
+def resized_size(size: Tuple[int, int], spec: Union[ExportSettings, Rendition]) -> Tuple[int, int]:
+    """Output size for ``spec.resize_mode``/``spec.resize_value``; ``size`` when no resize applies."""
+    w, h = size
+    value = spec.resize_value
+    if value <= 0:
+        return size
+    if spec.resize_mode == "width":
+        return value, max(1, int(h * value / w))
+    if spec.resize_mode == "height":
+        return max(1, int(w * value / h)), value
+    if spec.resize_mode == "long_edge":
+        ratio = value / max(w, h)
+        return max(1, int(w * ratio)), max(1, int(h * ratio))
+    if spec.resize_mode == "percent":
+        ratio = value / 100.0
+        return max(1, int(w * ratio)), max(1, int(h * ratio))
+    return size
+
+
+def apply_resize(im: Image.Image, exp: Union[ExportSettings, Rendition]) -> Image.Image:
+    new_size = resized_size(im.size, exp)
+    if new_size == im.size:
         return im
-    w, h = im.size
-    if exp.resize_mode == "width" and exp.resize_value > 0:
-        new_w = exp.resize_value
-        ratio = new_w / w
-        new_h = max(1, int(h * ratio))
-        return im.resize((new_w, new_h), _LANCZOS)
-    if exp.resize_mode == "height" and exp.resize_value > 0:
-        new_h = exp.resize_value
-        ratio = new_h / h
-        new_w = max(1, int(w * ratio))
-        return im.resize((new_w, new_h), _LANCZOS)
-    if exp.resize_mode == "percent" and exp.resize_value > 0:
-        ratio = exp.resize_value / 100.0
-        return im.resize((max(1, int(w * ratio)), max(1, int(h * ratio))), _LANCZOS)
-    return im
+    return im.resize(new_size, _LANCZOS)
 
 
 def compute_anchor(base_size: Tuple[int, int], wm_size: Tuple[int, int], preset: PositionPreset, offset=(10, 10)) -> Tuple[int, int]:
@@ -126,74 +195,205 @@ def compute_anchor(base_size: Tuple[int, int], wm_size: Tuple[int, int], preset:
     return mapping.get(preset, mapping["bottom-right"])
 
 
-def render_text_watermark(base: Image.Image, settings: WatermarkSettings) -> Image.Image:
+PreparedWatermark = Tuple[Image.Image, Tuple[int, int]]
+
+
+def _rotate_about(point: Tuple[float, float], center: Tuple[float, float], degrees: float) -> Tuple[float, float]:
+    # same direction as Image.rotate: counter-clockwise on screen (y axis points down)
+    rad = math.radians(degrees)
+    dx, dy = point[0] - center[0], point[1] - center[1]
+    return (center[0] + dx * math.cos(rad) + dy * math.sin(rad),
+            center[1] - dx * math.sin(rad) + dy * math.cos(rad))
+
+
+class _TileCache:
+    """Thread-safe LRU of rendered watermark tiles, bounded by entry count and bytes.
+
+    Cached tiles are shared by every caller and must be treated as read-only;
+    composite_tile only reads them.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(value: tuple) -> int:
+        tile = value[0]
+        return tile.width * tile.height * 4 if tile is not None else 0
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key: tuple, value: tuple) -> None:
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= self._size(old)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# Text tiles depend only on the text, its style and the rotation, not on the base image,
+# so a batch rasterizes and rotates the text once and every image just places it.
+_text_tiles = _TileCache()
+# Logo watermarks: the decoded logo file, and the tile scaled to a base size with opacity
+# and rotation applied; same-size photos in a batch or a watch folder reuse the tile.
+_logo_sources = _TileCache(max_entries=8)
+_logo_tiles = _TileCache()
+
+
+def cache_stats() -> Dict[str, Dict[str, float]]:
+    """Engine-level cache counters, e.g. ``cache_stats()["text_tile"]["hit_rate"]``."""
+    return {"text_tile": _text_tiles.stats(), "logo_tile": _logo_tiles.stats()}
+
+
+# rendered tile (None when there is no ink), ink box relative to the text origin, text size
+_TextTile = Tuple[Optional[Image.Image], Tuple[int, int, int, int], Tuple[int, int]]
+
+
+def _text_tile(settings: WatermarkSettings) -> _TextTile:
     txt = settings.text or ""
     style = settings.text_style
-    font = load_font(style.font_path, style.font_size)
+    key = (txt, style.font_path, style.font_size, tuple(style.color), style.opacity, style.stroke_width,
+           tuple(style.stroke_color), style.shadow, tuple(style.shadow_offset), round(settings.rotation or 0.0, 4))
+    cached = _text_tiles.get(key)
+    if cached is not None:
+        return cached
 
-    # Create transparent layer for text
-    layer = Image.new("RGBA", base.size, (0, 0, 0, 0))
-    draw = ImageDraw.Draw(layer)
+    from PIL import ImageDraw
+    font = load_font(style.font_path, style.font_size)
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
 
     # measure text
     try:
-        bbox = draw.textbbox((0, 0), txt, font=font, stroke_width=style.stroke_width)
+        bbox = measure.textbbox((0, 0), txt, font=font, stroke_width=style.stroke_width)
         tw, th = bbox[2] - bbox[0], bbox[3] - bbox[1]
     except Exception:
         # Fallback for very old Pillow
         tw, th = font.getsize(txt)
+        bbox = (0, 0, tw, th)
+
+    # ink extent relative to the text origin, including the shadow copy
+    sdx, sdy = style.shadow_offset if style.shadow else (0, 0)
+    ink = (bbox[0] + min(0, sdx), bbox[1] + min(0, sdy), bbox[2] + max(0, sdx), bbox[3] + max(0, sdy))
+    tile = None
+    if ink[2] > ink[0] and ink[3] > ink[1]:
+        tile = Image.new("RGBA", (ink[2] - ink[0], ink[3] - ink[1]), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(tile)
+        tx, ty = -ink[0], -ink[1]
+
+        # shadow
+        if style.shadow:
+            draw.text((tx + sdx, ty + sdy), txt, font=font, fill=(0, 0, 0, int(255 * style.opacity / 100)),
+                      stroke_width=style.stroke_width, stroke_fill=(0, 0, 0, int(255 * style.opacity / 100)))
+
+        # main text
+        r, g, b = style.color
+        alpha = int(255 * style.opacity / 100)
+        draw.text((tx, ty), txt, font=font, fill=(r, g, b, alpha),
+                  stroke_width=style.stroke_width,
+                  stroke_fill=(*style.stroke_color, alpha))
+
+        # rotation
+        if settings.rotation:
+            tile = tile.rotate(settings.rotation, resample=_BICUBIC, expand=1)
+    value = (tile, ink, (tw, th))
+    _text_tiles.put(key, value)
+    return value
+
+
+def prepare_text_watermark(base_size: Tuple[int, int], settings: WatermarkSettings) -> Optional[PreparedWatermark]:
+    """Text watermark tile, just big enough for its ink, and its position on a base of ``base_size``.
+
+    Rotation turns the text about the base image centre, as a full-frame layer would.
+    The tile comes from a shared cache and must not be modified.
+    """
+    tile, ink, (tw, th) = _text_tile(settings)
+    if tile is None:
+        return None
 
     # position
+    bw, bh = base_size
     if settings.free_pos_norm:
-        x = int(settings.free_pos_norm[0] * (base.size[0] - tw))
-        y = int(settings.free_pos_norm[1] * (base.size[1] - th))
+        x = int(settings.free_pos_norm[0] * (bw - tw))
+        y = int(settings.free_pos_norm[1] * (bh - th))
     else:
-        x, y = compute_anchor(base.size, (tw, th), settings.position, settings.offset)
-
-    # shadow
-    if style.shadow:
-        sx = x + style.shadow_offset[0]
-        sy = y + style.shadow_offset[1]
-        draw.text((sx, sy), txt, font=font, fill=(0, 0, 0, int(255 * style.opacity / 100)),
-                  stroke_width=style.stroke_width, stroke_fill=(0, 0, 0, int(255 * style.opacity / 100)))
-
-    # main text
-    r, g, b = style.color
-    alpha = int(255 * style.opacity / 100)
-    draw.text((x, y), txt, font=font, fill=(r, g, b, alpha),
-              stroke_width=style.stroke_width,
-              stroke_fill=(*style.stroke_color, alpha))
+        x, y = compute_anchor(base_size, (tw, th), settings.position, settings.offset)
+    left, top = x + ink[0], y + ink[1]
 
-    # rotation
     if settings.rotation:
-        layer = layer.rotate(settings.rotation, resample=_BICUBIC, expand=1)
-        # after rotation, we need to re-anchor the rotated layer onto base centered
-        bg = Image.new("RGBA", base.size, (0, 0, 0, 0))
-        # paste centered
-        bx, by = (base.size[0] - layer.size[0]) // 2, (base.size[1] - layer.size[1]) // 2
-        bg.alpha_composite(layer, (bx, by))
-        layer = bg
-
-    out = base.copy()
-    out.alpha_composite(layer)
-    return out
+        center = (left + (ink[2] - ink[0]) / 2, top + (ink[3] - ink[1]) / 2)
+        cx, cy = _rotate_about(center, (bw / 2, bh / 2), settings.rotation)
+        return tile, (int(round(cx - tile.width / 2)), int(round(cy - tile.height / 2)))
+    return tile, (left, top)
 
 
-def render_image_watermark(base: Image.Image, settings: WatermarkSettings) -> Image.Image:
+def _logo_tile(base_size: Tuple[int, int], settings: WatermarkSettings) -> Optional[Image.Image]:
     style = settings.image_style
-    if not style.path or not os.path.exists(style.path):
-        return base.copy()
-    wm = Image.open(style.path).convert("RGBA")
+    if not style.path:
+        return None
+    try:
+        st = os.stat(style.path)
+    except OSError:
+        return None
+    # keyed by file identity, so replacing the logo file takes effect immediately
+    ident = (os.path.abspath(style.path), st.st_mtime_ns, st.st_size)
+    source = _logo_sources.get(ident)
+    if source is None:
+        with Image.open(style.path) as f:
+            source = (f.convert("RGBA"),)
+        _logo_sources.put(ident, source)
+    logo = source[0]
+
     # scale relative to min dimension
-    bw, bh = base.size
+    bw, bh = base_size
     target = int(min(bw, bh) * max(0.01, min(5.0, style.scale)))
     # keep aspect ratio: scale so that wm width equals target
-    ratio = target / wm.width if wm.width else 1.0
-    new_size = (max(1, int(wm.width * ratio)), max(1, int(wm.height * ratio)))
-    wm = wm.resize(new_size, _LANCZOS)
+    ratio = target / logo.width if logo.width else 1.0
+    new_size = (max(1, int(logo.width * ratio)), max(1, int(logo.height * ratio)))
+    key = ident + (new_size, style.opacity, round(settings.rotation or 0.0, 4))
+    cached = _logo_tiles.get(key)
+    if cached is not None:
+        return cached[0]
+    wm = logo.resize(new_size, _LANCZOS)
 
     # opacity
     if style.opacity < 100:
+        from PIL import ImageEnhance
         alpha = wm.split()[3]
         alpha = ImageEnhance.Brightness(alpha).enhance(style.opacity / 100.0)  # type: ignore
         wm.putalpha(alpha)
@@ -201,6 +401,15 @@ def render_image_watermark(base: Image.Image, settings: WatermarkSettings) -> Im
     # rotation
     if settings.rotation:
         wm = wm.rotate(settings.rotation, resample=_BICUBIC, expand=1)
+    _logo_tiles.put(key, (wm,))
+    return wm
+
+
+def prepare_image_watermark(base_size: Tuple[int, int], settings: WatermarkSettings) -> Optional[PreparedWatermark]:
+    wm = _logo_tile(base_size, settings)
+    if wm is None:
+        return None
+    bw, bh = base_size
 
     # position
     if settings.free_pos_norm:
@@ -208,53 +417,618 @@ def render_image_watermark(base: Image.Image, settings: WatermarkSettings) -> Im
         y = int(settings.free_pos_norm[1] * (bh - wm.height))
     else:
         x, y = compute_anchor((bw, bh), wm.size, settings.position, settings.offset)
+    return wm, (x, y)
+
 
-    layer = Image.new("RGBA", base.size, (0, 0, 0, 0))
-    layer.alpha_composite(wm, (x, y))
+def prepare_watermark(base_size: Tuple[int, int], settings: WatermarkSettings) -> Optional[PreparedWatermark]:
+    """Watermark tile and its position for a base of ``base_size``; None when nothing is drawn."""
+    if settings.mode == "text":
+        return prepare_text_watermark(base_size, settings)
+    return prepare_image_watermark(base_size, settings)
 
+
+def watermark_bbox(base_size: Tuple[int, int], prepared: Optional[PreparedWatermark]) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box of ``prepared`` clipped to the base, or None if it falls outside."""
+    if prepared is None:
+        return None
+    tile, (x, y) = prepared
+    box = (max(0, x), max(0, y), min(base_size[0], x + tile.width), min(base_size[1], y + tile.height))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        return None
+    return box
+
+
+def composite_tile(base: Image.Image, tile: Image.Image, pos: Tuple[int, int]) -> None:
+    """Alpha-composite ``tile`` onto RGBA ``base`` in place; parts outside the base are clipped."""
+    x, y = pos
+    if x >= base.width or y >= base.height or x + tile.width <= 0 or y + tile.height <= 0:
+        return
+    base.alpha_composite(tile, (max(0, x), max(0, y)), (max(0, -x), max(0, -y)))
+
+
+def render_text_watermark(base: Image.Image, settings: WatermarkSettings) -> Image.Image:
     out = base.copy()
-    out.alpha_composite(layer)
+    prepared = prepare_text_watermark(base.size, settings)
+    if prepared:
+        composite_tile(out, *prepared)
+    return out
+
+
+def render_image_watermark(base: Image.Image, settings: WatermarkSettings) -> Image.Image:
+    out = base.copy()
+    prepared = prepare_image_watermark(base.size, settings)
+    if prepared:
+        composite_tile(out, *prepared)
     return out
 
 
 def apply_watermark(img: Image.Image, wm: WatermarkSettings) -> Image.Image:
-    base = img.convert("RGBA")
-    if wm.mode == "text":
-        return render_text_watermark(base, wm)
+    # convert() always returns a new image, so composite onto it rather than a second copy
+    out = img.convert("RGBA")
+    prepared = prepare_watermark(out.size, wm)
+    if prepared:
+        composite_tile(out, *prepared)
+    return out
+
+
+# Accept a search result once it uses at least this fraction of the byte budget
+_FIT_TOLERANCE = 0.92
+_MIN_JPEG_QUALITY = 5
+# Quality chosen for earlier images, keyed by (pixel-count bucket, aspect bucket, budget)
+_QUALITY_HINTS: Dict[Tuple[int, int, int], int] = {}
+
+
+def _encode_jpeg(rgb: Image.Image, quality: int, **kwargs) -> bytes:
+    buf = io.BytesIO()
+    rgb.save(buf, "JPEG", quality=quality, **kwargs)
+    return buf.getvalue()
+
+
+def _quality_hint_key(size: Tuple[int, int], max_bytes: int) -> Tuple[int, int, int]:
+    w, h = size
+    # half-octave buckets: images within ~40% pixel count of each other share a hint
+    return int(round(math.log2(max(1, w * h)) * 2)), int(round(math.log2(w / h) * 4)), max_bytes
+
+
+def encode_jpeg_to_size(im: Image.Image, max_bytes: int, max_quality: int = 95, **kwargs) -> Tuple[bytes, int]:
+    """Encode ``im`` as JPEG at the highest quality <= ``max_quality`` whose output fits ``max_bytes``.
+
+    Binary search over quality, encoding into memory. The search starts from the
+    quality that worked for a previous image of similar dimensions and stops as
+    soon as a result fills the budget closely enough. Raises ValueError when even
+    the lowest quality does not fit. Extra ``kwargs`` (e.g. exif) go to every encode.
+    """
+    rgb = im if im.mode == "RGB" else im.convert("RGB")
+    lo, hi = _MIN_JPEG_QUALITY, max(_MIN_JPEG_QUALITY, min(100, max_quality))
+    key = _quality_hint_key(rgb.size, max_bytes)
+    q = min(hi, max(lo, _QUALITY_HINTS.get(key, (lo + hi) // 2)))
+    best: Optional[Tuple[bytes, int]] = None
+    while lo <= hi:
+        data = _encode_jpeg(rgb, q, **kwargs)
+        if len(data) <= max_bytes:
+            best = (data, q)
+            if len(data) >= max_bytes * _FIT_TOLERANCE:
+                break
+            lo = q + 1
+        else:
+            hi = q - 1
+        q = (lo + hi) // 2
+    if best is None:
+        raise ValueError(f"cannot fit {rgb.size[0]}x{rgb.size[1]} image into {max_bytes} bytes "
+                         f"even at JPEG quality {_MIN_JPEG_QUALITY}")
+    _QUALITY_HINTS[key] = best[1]
+    return best
+
+
+# Cascade a downscale from an earlier rendition only if that one is at least this
+# many times larger per side; closer sizes resample twice and visibly soften.
+_CASCADE_MIN_RATIO = 2.0
+
+
+def render_renditions(im: Image.Image, renditions: List[Rendition]) -> List[Image.Image]:
+    """Resize the watermarked full-size ``im`` for each rendition, in input order.
+
+    Larger outputs are produced first so smaller ones can be downscaled from them
+    instead of from the full-size image.
+    """
+    targets = [resized_size(im.size, r) for r in renditions]
+    results: List[Optional[Image.Image]] = [None] * len(renditions)
+    available = [im]  # full-size first, then produced renditions, largest to smallest
+    for idx in sorted(range(len(renditions)), key=lambda i: -(targets[i][0] * targets[i][1])):
+        tw, th = targets[idx]
+        src = im
+        for cand in available:
+            if cand.size == (tw, th):
+                src = cand
+                break
+            if cand.width >= tw * _CASCADE_MIN_RATIO and cand.height >= th * _CASCADE_MIN_RATIO:
+                src = cand
+        out = src if src.size == (tw, th) else src.resize((tw, th), _LANCZOS)
+        results[idx] = out
+        if out is not im:
+            available.append(out)
+    return results  # type: ignore[return-value]
+
+
+def output_base_name(src_path: str, exp: ExportSettings) -> str:
+    name, _ = os.path.splitext(os.path.basename(src_path))
+    if exp.naming_mode == "keep":
+        return name
+    if exp.naming_mode == "prefix":
+        return f"{exp.prefix}{name}"
+    return f"{name}{exp.suffix}"
+
+
+def load_source(src_path: Union[str, BinaryIO], max_side: Optional[int] = None) -> Tuple[Image.Image, SourceMetadata]:
+    """Open ``src_path`` (a path or binary stream) upright: the EXIF Orientation is applied with a transpose.
+
+    With ``max_side`` the image is reduced to fit a ``max_side`` square; thumbnail()
+    lets JPEGs decode at a reduced DCT scale, which is much faster than a full decode.
+    ``meta.size`` always reports the full-resolution size.
+    """
+    im = open_image(src_path) if isinstance(src_path, str) else Image.open(src_path)
+    meta = read_metadata(im)
+    if max_side and max(im.size) > max_side:
+        # reducing_gap=1.0 lets draft() pick the smallest DCT scale still >= max_side
+        im.thumbnail((max_side, max_side), _LANCZOS, reducing_gap=1.0)
+    upright = apply_orientation(im, meta.orientation)
+    # a memory-mapped source is decoded now so the mapping is not held by cached images
+    release_mapping(im)
+    return upright, meta
+
+
+@dataclass
+class FrameSequence:
+    """An animated (GIF/WebP/PNG) or multi-page (TIFF) source, kept open for seeking.
+
+    Frames come out as full canvases: the decoder has already applied each frame's
+    disposal and blending, so writing whole frames reproduces the animation as shown.
+    """
+    image: Image.Image  # open source; frames are decoded in order by seeking
+    n_frames: int
+    animated: bool  # timed animation frames rather than pages
+    loop: int  # animation plays, 0 = forever
+
+    def frames(self, orientation: int = 1) -> Iterator[Tuple[Image.Image, int]]:
+        """Each frame upright, with its duration in ms; the source is closed afterwards."""
+        try:
+            for i in range(self.n_frames):
+                self.image.seek(i)
+                frame = self.image.copy()  # loads the frame; WebP sets its duration on load
+                yield apply_orientation(frame, orientation), int(self.image.info.get("duration") or 0)
+        finally:
+            # seeking reads from a memory-mapped source, so it is released only now
+            release_mapping(self.image)
+            self.image.close()
+
+
+ExportSource = Union[Image.Image, FrameSequence]
+
+
+def load_export_source(src_path: Union[str, BinaryIO]) -> Tuple[ExportSource, SourceMetadata]:
+    """Full-resolution source for export: load_source's upright image, or a FrameSequence
+    when the source has several frames (``meta.orientation`` then applies to each)."""
+    im = open_image(src_path) if isinstance(src_path, str) else Image.open(src_path)
+    meta = read_metadata(im)
+    if meta.n_frames > 1:
+        animated = im.format != "TIFF"
+        return FrameSequence(im, meta.n_frames, animated, int(im.info.get("loop", 1))), meta
+    upright = apply_orientation(im, meta.orientation)
+    release_mapping(im)
+    return upright, meta
+
+
+def scale_watermark_settings(wm: WatermarkSettings, factor: float) -> WatermarkSettings:
+    """Copy of ``wm`` whose pixel sizes are scaled by ``factor``, for rendering on a reduced base.
+
+    Image watermarks already scale with the base; normalized free positions need no change.
+    """
+    ts = wm.text_style
+    return replace(
+        wm,
+        text_style=replace(
+            ts,
+            font_size=max(1, int(round(ts.font_size * factor))),
+            stroke_width=int(round(ts.stroke_width * factor)),
+            shadow_offset=(int(round(ts.shadow_offset[0] * factor)), int(round(ts.shadow_offset[1] * factor))),
+        ),
+        offset=(int(round(wm.offset[0] * factor)), int(round(wm.offset[1] * factor))),
+    )
+
+
+# Outputs are written to a hidden sibling temp file and renamed over the target once
+# complete, so an interrupted export never leaves a truncated image under the real name.
+PARTIAL_SUFFIX = ".part"
+
+
+def _read_umask() -> int:
+    # the umask can only be read by setting it, which affects every thread; so this
+    # runs once, at import, before any export thread exists
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# mkstemp creates 0600 files; outputs should get the usual umask-derived mode
+_FILE_MODE = 0o666 & ~_read_umask()
+
+
+@contextmanager
+def atomic_output(out_path: str, temp_tag: str = "") -> Iterator[BinaryIO]:
+    """Binary file that replaces ``out_path`` only after it has been fully written and synced.
+
+    ``temp_tag`` starts the temp file's name, so that its owner (see ExportJournal) can
+    tell its own leftovers from an interrupted run apart from other exports' temp files.
+    """
+    out_dir, name = os.path.split(out_path)
+    fd, tmp = tempfile.mkstemp(prefix="." + temp_tag + name + ".", suffix=PARTIAL_SUFFIX, dir=out_dir or ".")
+    try:
+        os.chmod(tmp, _FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, out_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def encode_rendition(im: Image.Image, r: Rendition, fp: BinaryIO, meta_kwargs: Optional[Dict[str, bytes]] = None) -> None:
+    """Encode ``im`` as rendition ``r`` into the binary stream ``fp``."""
+    extra = meta_kwargs or {}
+    if r.out_format == "JPEG" and r.target_size_kb > 0:
+        data, _ = encode_jpeg_to_size(im, r.target_size_kb * 1024, r.quality, **extra)
+        fp.write(data)
+    elif r.out_format == "JPEG":
+        im.convert("RGB").save(fp, "JPEG", quality=max(0, min(100, r.quality)), **extra)
+    elif r.out_format == "WEBP":
+        im.save(fp, "WEBP", quality=max(0, min(100, r.quality)), **extra)
     else:
-        return render_image_watermark(base, wm)
+        im.save(fp, "PNG", **extra)
+
+
+def save_rendition(im: Image.Image, r: Rendition, out_path: str, meta_kwargs: Optional[Dict[str, bytes]] = None) -> None:
+    with atomic_output(out_path) as f:
+        encode_rendition(im, r, f, meta_kwargs)
+
+
+def _region_reencode_params(im: Image.Image, meta: SourceMetadata, exp: ExportSettings) -> Optional[Dict]:
+    """JPEG save parameters reproducing the source encoding, or None if region mode does not apply."""
+    if not exp.jpeg_region_reencode or exp.renditions or exp.out_format != "JPEG" or exp.target_size_kb > 0:
+        return None
+    if im.format != "JPEG" or im.mode not in ("RGB", "L") or meta.orientation != 1:
+        return None
+    if resized_size(im.size, exp) != im.size:
+        return None
+    qtables = getattr(im, "quantization", None)
+    layers = getattr(im, "layer", None)
+    if not qtables or not layers:
+        return None
+    from PIL import JpegImagePlugin
+    sampling = JpegImagePlugin.get_sampling(im)
+    if sampling < 0:
+        return None
+    params = {"qtables": qtables, "subsampling": sampling}
+    if im.info.get("progressive"):
+        params["progressive"] = True
+    return params
+
+
+def watermark_jpeg_region(im: Image.Image, wm: WatermarkSettings) -> None:
+    """Watermark a decoded JPEG in place, compositing only the MCU-aligned box under the watermark.
+
+    The caller still re-encodes the whole image; saving with _region_reencode_params keeps
+    the source quantization, so blocks outside the box come out close to, not identical to,
+    the original.
+    """
+    prepared = prepare_watermark(im.size, wm)
+    box = watermark_bbox(im.size, prepared)
+    if prepared is None or box is None:
+        return
+    # MCU size follows the largest sampling factor (16x16 for 4:2:0)
+    mcu_w = 8 * max(layer[1] for layer in im.layer)
+    mcu_h = 8 * max(layer[2] for layer in im.layer)
+    box = (box[0] // mcu_w * mcu_w, box[1] // mcu_h * mcu_h,
+           min(im.width, -(-box[2] // mcu_w) * mcu_w), min(im.height, -(-box[3] // mcu_h) * mcu_h))
+    region = im.crop(box).convert("RGBA")
+    tile, (x, y) = prepared
+    composite_tile(region, tile, (x - box[0], y - box[1]))
+    im.paste(region.convert(im.mode), box[:2])
+
+
+OutputEncoder = Callable[[BinaryIO], None]
+
+# Output formats that hold a whole animation. Animations in other formats, and every
+# output of a multi-page source, are written as one numbered file per frame.
+ANIMATED_OUTPUT_FORMATS = ("PNG", "WEBP")
+
+
+def frame_window(n_frames: int) -> int:
+    """Frames of one multi-frame export being watermarked at once (see render_frame_outputs)."""
+    return max(1, min(n_frames, os.cpu_count() or 1))
+
+
+def _render_frame(frame: Image.Image, prepared: Optional[PreparedWatermark],
+                  renditions: List[Rendition]) -> List[Image.Image]:
+    out = frame.convert("RGBA")
+    if prepared:
+        composite_tile(out, *prepared)
+    return render_renditions(out, renditions)
+
+
+def encode_animation(frames: List[Image.Image], durations: List[int], loop: int, r: Rendition,
+                     fp: BinaryIO, meta_kwargs: Optional[Dict[str, bytes]] = None) -> None:
+    """Encode ``frames`` as one animated rendition ``r`` (PNG or WEBP) into ``fp``."""
+    params = dict(save_all=True, append_images=frames[1:], duration=durations, loop=loop, **(meta_kwargs or {}))
+    if r.out_format == "WEBP":
+        frames[0].save(fp, "WEBP", quality=max(0, min(100, r.quality)), **params)
+    else:
+        frames[0].save(fp, "PNG", **params)
+
+
+def _rendered_frames(seq: FrameSequence, meta: SourceMetadata, wm: WatermarkSettings,
+                     renditions: List[Rendition], executor: Optional["Executor"]
+                     ) -> Iterator[Tuple[List[Image.Image], int]]:
+    """(renditions, duration) of each frame in order, at most frame_window() frames in flight.
+
+    Frames go to ``executor`` when given. It is usually the pool this export itself runs
+    on, so a frame nobody has started by the time it is needed is taken back and
+    rendered on this thread: waiting on a pool whose threads all wait the same way
+    would never end.
+    """
+    from collections import deque
+    prepared: Dict[Tuple[int, int], Optional[PreparedWatermark]] = {}
+    window = frame_window(seq.n_frames) if executor is not None else 1
+    pending = deque()  # (future or None, args, duration)
+
+    def take():
+        fut, args, duration = pending.popleft()
+        if fut is None or fut.cancel():
+            return _render_frame(*args), duration
+        return fut.result(), duration
+
+    frames = seq.frames(meta.orientation)
+    try:
+        for frame, duration in frames:
+            if frame.size not in prepared:
+                prepared[frame.size] = prepare_watermark(frame.size, wm)
+            args = (frame, prepared[frame.size], renditions)
+            pending.append((executor.submit(_render_frame, *args) if executor is not None else None, args, duration))
+            if len(pending) >= window:
+                yield take()
+        while pending:
+            yield take()
+    finally:
+        for fut, _, _ in pending:
+            if fut is not None:
+                fut.cancel()
+        frames.close()  # releases the source even when the consumer stops early
+
+
+def render_frame_outputs(seq: FrameSequence, meta: SourceMetadata, wm: WatermarkSettings,
+                         exp: ExportSettings, executor: Optional["Executor"] = None
+                         ) -> Iterator[Tuple[str, str, OutputEncoder]]:
+    """render_outputs for a multi-frame source, as a stream.
+
+    Frames are decoded in order (seeking is sequential), watermarked and resized a few
+    at a time (on ``executor`` if given), and the watermark is prepared once per frame
+    size. Renditions written one file per frame are yielded as each frame is ready and
+    dropped once encoded; only the frames of animated renditions are kept, since the
+    animation is encoded in one go after the last frame.
+    """
+    meta_kwargs = save_kwargs(meta, exp.strip_gps) if exp.keep_metadata else {}
+    renditions = exp.all_renditions()
+    animated = [seq.animated and r.out_format in ANIMATED_OUTPUT_FORMATS for r in renditions]
+    kept: List[List[Image.Image]] = [[] for _ in renditions]
+    durations: List[int] = []
+    for k, (images, duration) in enumerate(_rendered_frames(seq, meta, wm, renditions, executor)):
+        durations.append(duration)
+        for i, (r, fim) in enumerate(zip(renditions, images)):
+            if animated[i]:
+                kept[i].append(fim)
+            else:
+                yield (f"{r.suffix}_{k + 1:03d}{OUTPUT_EXTS.get(r.out_format, '.png')}", r.out_format,
+                       lambda fp, r=r, fim=fim: encode_rendition(fim, r, fp, meta_kwargs))
+        del images
+    for i, r in enumerate(renditions):
+        if animated[i]:
+            frames, kept[i] = kept[i], []
+            yield (r.suffix + OUTPUT_EXTS.get(r.out_format, ".png"), r.out_format,
+                   lambda fp, r=r, frames=frames: encode_animation(frames, durations, seq.loop, r, fp, meta_kwargs))
+
+
+def render_outputs(im: ExportSource, meta: SourceMetadata, wm: WatermarkSettings, exp: ExportSettings,
+                   executor: Optional["Executor"] = None) -> Iterable[Tuple[str, str, OutputEncoder]]:
+    """Watermark the upright source ``im`` and return one (name tail, format, encoder) per output.
+
+    The name tail (rendition suffix + extension) follows output_base_name(); each encoder
+    writes its output, in the Pillow format named next to it, to a binary stream. Region
+    mode edits ``im`` in place. A FrameSequence goes through render_frame_outputs (frames
+    on ``executor``), whose outputs come lazily: run each encoder before taking the next.
+    """
+    if isinstance(im, FrameSequence):
+        return render_frame_outputs(im, meta, wm, exp, executor)
+    meta_kwargs = save_kwargs(meta, exp.strip_gps) if exp.keep_metadata else {}
+    region_params = _region_reencode_params(im, meta, exp)
+    if region_params is not None:
+        watermark_jpeg_region(im, wm)
+        return [(OUTPUT_EXTS["JPEG"], "JPEG", lambda fp: im.save(fp, "JPEG", **region_params, **meta_kwargs))]
+
+    im = apply_watermark(im, wm)
+    renditions = exp.all_renditions()
+    images = render_renditions(im, renditions)
+    return [
+        (r.suffix + OUTPUT_EXTS.get(r.out_format, ".png"), r.out_format,
+         lambda fp, r=r, rim=rim: encode_rendition(rim, r, fp, meta_kwargs))
+        for r, rim in zip(renditions, images)
+    ]
+
+
+# ---- in-memory API: bytes in, bytes out, no temporary files
+
+ImageInput = Union[bytes, bytearray, memoryview, BinaryIO]
+
+
+@dataclass
+class EncodedOutput:
+    name_tail: str  # rendition suffix + extension, appended to output_base_name()
+    out_format: str
+    data: memoryview  # view into the output buffer; bytes(data) for an independent copy
+
+
+class _OutputBuffer(io.RawIOBase):
+    """Writable seekable stream over a caller-supplied bytearray, grown only when needed.
+
+    Outputs are written back to back; ``start()`` begins a new one so that an encoder's
+    seek(0) refers to the start of its own output.
+    """
+
+    def __init__(self, buf: Optional[bytearray] = None):
+        self.buf = buf if buf is not None else bytearray()
+        self._base = 0
+        self._pos = 0
+        self._end = 0
+
+    def start(self) -> int:
+        self._base = self._pos = self._end
+        return self._base
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        with memoryview(b) as mv:
+            n = mv.nbytes
+            end = self._pos + n
+            if end > len(self.buf):
+                self.buf.extend(bytes(max(end - len(self.buf), len(self.buf))))  # grow geometrically
+            self.buf[self._pos:end] = mv.cast("B")
+        self._pos = end
+        self._end = max(self._end, end)
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: self._base, io.SEEK_CUR: self._pos, io.SEEK_END: self._end}[whence]
+        self._pos = max(self._base, base + offset)
+        return self._pos - self._base
+
+    def tell(self) -> int:
+        return self._pos - self._base
+
+    def end(self) -> int:
+        return self._end
+
+
+def _as_stream(source: ImageInput) -> BinaryIO:
+    if isinstance(source, bytes):
+        return io.BytesIO(source)  # shares the bytes object until written to
+    if isinstance(source, (bytearray, memoryview)):
+        return MemoryReader(source)  # type: ignore[return-value]
+    return source
+
+
+def encode_into(im: ExportSource, meta: SourceMetadata, wm: WatermarkSettings, exp: ExportSettings,
+                out: Optional[bytearray] = None, executor: Optional["Executor"] = None) -> List[EncodedOutput]:
+    """Watermark the upright source ``im`` and encode every output back to back into ``out``.
+
+    Pass a preallocated ``out`` to reuse it across calls; it is only extended when an
+    output does not fit. The returned views must be released (or dropped) before ``out``
+    is reused, since a bytearray with live views cannot grow. ``executor`` may take the
+    frames of a multi-frame source (see render_frame_outputs).
+    """
+    writer = _OutputBuffer(out)
+    spans = []
+    outputs = render_outputs(im, meta, wm, exp, executor)
+    try:
+        for tail, fmt, encode in outputs:
+            start = writer.start()
+            encode(writer)
+            spans.append((tail, fmt, start, writer.end()))
+    finally:
+        if hasattr(outputs, "close"):
+            outputs.close()  # a frame stream stopped by an error releases its source now
+    view = memoryview(writer.buf)
+    return [EncodedOutput(tail, fmt, view[s:e]) for tail, fmt, s, e in spans]
+
+
+def export_bytes(source: ImageInput, wm: WatermarkSettings, exp: ExportSettings,
+                 out: Optional[bytearray] = None) -> List[EncodedOutput]:
+    """Watermark an encoded image held in memory and encode every output, without touching disk.
+
+    ``source`` may be bytes, a bytearray/memoryview (read in place) or a binary stream.
+    ``exp.output_dir`` and the naming settings are ignored. Raises on failure.
+    """
+    im, meta = load_export_source(_as_stream(source))
+    return encode_into(im, meta, wm, exp, out)
+
+
+def check_output_folder(src_path: str, exp: ExportSettings) -> None:
+    # prevent overwrite into original folder
+    if exp.prevent_overwrite_original:
+        src_dir = os.path.abspath(os.path.dirname(src_path))
+        out_dir = os.path.abspath(exp.output_dir)
+        if src_dir == out_dir:
+            raise ValueError(f"Output folder must differ from source folder for {src_path}")
+
+
+_OUTPUT_BUFFER_BYTES = 8 * 1024 * 1024
+_local = threading.local()
+
+
+def _thread_output_buffer() -> bytearray:
+    # one reusable encode buffer per exporting thread; outputs are written out before reuse
+    buf = getattr(_local, "output_buffer", None)
+    if buf is None:
+        buf = _local.output_buffer = bytearray(_OUTPUT_BUFFER_BYTES)
+    return buf
+
+
+def export_renditions(src_path: str, wm: WatermarkSettings, exp: ExportSettings,
+                      sink: Optional["OutputSink"] = None, executor: Optional["Executor"] = None) -> List[str]:
+    """Decode and watermark ``src_path`` once and write every rendition; returns output paths.
+
+    Outputs go to ``sink`` (see sinks.py), by default straight into ``exp.output_dir``;
+    the returned paths are the sink's locations. The frames of an animated or multi-page
+    source are watermarked on ``executor`` when given (normally the pool running this
+    export), otherwise on this thread. Raises on failure; see export_image
+    for the (ok, message) wrapper.
+    """
+    check_output_folder(src_path, exp)
+
+    # reuse a full-resolution decode the preview already holds; region mode needs the
+    # JPEG file object itself and edits it in place, so it always opens the file
+    cached = None
+    if not exp.jpeg_region_reencode:
+        from .cache import shared_cache
+        cached = shared_cache.peek(src_path)
+        if cached and cached[1].n_frames > 1:
+            cached = None  # the cache holds only the first frame
+    im, meta = cached if cached else load_export_source(src_path)
+    base_name = output_base_name(src_path, exp)
+    if sink is None:
+        from .sinks import DirectorySink
+        sink = DirectorySink(exp.output_dir)
+
+    out_paths = []
+    outputs = encode_into(im, meta, wm, exp, _thread_output_buffer(), executor)
+    try:
+        for o in outputs:
+            out_paths.append(sink.write(base_name + o.name_tail, o.data))
+    finally:
+        for o in outputs:
+            o.data.release()
+    return out_paths
 
 
 def export_image(src_path: str, wm: WatermarkSettings, exp: ExportSettings) -> Tuple[bool, str]:
     try:
-        im = Image.open(src_path).convert("RGBA")
-        im = apply_watermark(im, wm)
-        im = apply_resize(im, exp)
-
-        # naming
-        name, ext = os.path.splitext(os.path.basename(src_path))
-        if exp.naming_mode == "keep":
-            out_name = name
-        elif exp.naming_mode == "prefix":
-            out_name = f"{exp.prefix}{name}"
-        else:
-            out_name = f"{name}{exp.suffix}"
-        # format extension
-        out_ext = ".jpg" if exp.out_format == "JPEG" else ".png"
-        out_path = os.path.join(exp.output_dir, out_name + out_ext)
-
-        # prevent overwrite into original folder
-        if exp.prevent_overwrite_original:
-            src_dir = os.path.abspath(os.path.dirname(src_path))
-            out_dir = os.path.abspath(exp.output_dir)
-            if src_dir == out_dir:
-                return False, f"Output folder must differ from source folder for {src_path}"
-
-        os.makedirs(exp.output_dir, exist_ok=True)
-        if exp.out_format == "JPEG":
-            im.convert("RGB").save(out_path, "JPEG", quality=max(0, min(100, exp.jpeg_quality)))
-        else:
-            im.save(out_path, "PNG")
-        return True, out_path
+        return True, "; ".join(export_renditions(src_path, wm, exp))
     except Exception as e:
         return False, str(e)
@@ -1,28 +1,163 @@
-from typing import List, Tuple
-from PyQt5.QtCore import QThread, pyqtSignal
-from .engine import WatermarkSettings, ExportSettings, export_image
+from typing import List, Optional, Tuple
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal
+from .batch import BatchResult, run_batch
+from .engine import WatermarkSettings, ExportSettings
+from .jobqueue import JobQueue, ExportJob
+from .progress import ProgressAggregator, DEFAULT_INTERVAL
+from .scheduler import lower_thread_priority
 
 class ExportWorker(QThread):
-    progress = pyqtSignal(int, int, str, bool, str)  # current, total, path, ok, message_or_out
+    # ProgressSnapshot, about once per progress_interval seconds (also while one long
+    # file is exporting) plus once at the end; per-file failures are in
+    # result().failures after the run
+    progress = pyqtSignal(object)
     finished = pyqtSignal(int, int)  # success_count, total
 
-    def __init__(self, files: List[str], wm: WatermarkSettings, exp: ExportSettings):
+    def __init__(self, files: List[str], wm: WatermarkSettings, exp: ExportSettings,
+                 progress_interval: float = DEFAULT_INTERVAL, background: bool = False):
         super().__init__()
         self.files = files
         self.wm = wm
         self.exp = exp
-        self._success = 0
+        self.progress_interval = progress_interval
+        self.background = background  # run below normal priority so the GUI stays responsive
+        self._stop_requested = False
+        self._result = BatchResult(total=len(files))
+        self._agg: Optional[ProgressAggregator] = None
+        # lives on the creating (GUI) thread; refreshes progress between per-file updates
+        self._heartbeat = QTimer()
+        self._heartbeat.setInterval(max(1, int(progress_interval * 1000)))
+        self._heartbeat.timeout.connect(self._on_heartbeat)
+        self.started.connect(self._heartbeat.start)
+        self.finished.connect(self._heartbeat.stop)
 
     def run(self):
-        total = len(self.files)
-        self._success = 0
-        for idx, p in enumerate(self.files, start=1):
-            ok, out = export_image(p, self.wm, self.exp)
-            if ok:
-                self._success += 1
-            self.progress.emit(idx, total, p, ok, out)
-        self.finished.emit(self._success, total)
+        # an exception escaping QThread.run aborts the process, and without `finished`
+        # a queued job would stay running; report it as every file failing instead
+        try:
+            if self.background:
+                lower_thread_priority()
+            agg = self._agg = ProgressAggregator(self.files, self.progress.emit, self.progress_interval)
+            self._result = run_batch(self.files, self.wm, self.exp, agg.update, lambda: self._stop_requested)
+            agg.finish()
+        except Exception as e:
+            self._result = BatchResult(total=len(self.files), outcomes=[(p, False, str(e)) for p in self.files])
+        finally:
+            self.finished.emit(self._result.success, self._result.total)
+
+    def _on_heartbeat(self):
+        agg = self._agg
+        if agg is not None:
+            agg.heartbeat()
+
+    def stop(self):
+        """Start no further exports; the running ones finish, then the thread ends."""
+        self._stop_requested = True
 
     def success_count(self) -> int:
-        return self._success
+        return self._result.success
+
+    def resumed_count(self) -> int:
+        return self._result.resumed
+
+    def result(self) -> BatchResult:
+        return self._result
+
+    def duplicate_groups(self) -> List[List[str]]:
+        return self._result.duplicate_groups
+
+    def failures(self) -> List[Tuple[str, str]]:
+        return self._result.failures
+
+
+class ExportQueueRunner(QObject):
+    """Runs the jobs of a JobQueue one at a time on background-priority ExportWorkers.
+
+    A queued job with a higher priority than the running one preempts it: the running
+    job stops after its in-flight images and goes back to the queue with the rest.
+    """
+    changed = pyqtSignal()  # queue contents or states changed
+    progress = pyqtSignal(object, object)  # ExportJob, ProgressSnapshot
+    job_finished = pyqtSignal(object, object)  # ExportJob, BatchResult of this run
+
+    def __init__(self, queue: JobQueue, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.queue = queue
+        self.worker: Optional[ExportWorker] = None
+        self.job: Optional[ExportJob] = None
+        self._pause_running = False  # stop requested by pause(), as opposed to preemption
+
+    def enqueue(self, files: List[str], wm: WatermarkSettings, exp: ExportSettings,
+                priority: int = 0, label: str = "") -> ExportJob:
+        job = self.queue.add(files, wm, exp, priority, label)
+        self.changed.emit()
+        self.schedule()
+        return job
+
+    def pause(self, job_id: str) -> None:
+        if self.job is not None and self.job.job_id == job_id:
+            self._pause_running = True
+            self.worker.stop()
+        else:
+            self.queue.pause(job_id)
+        self.changed.emit()
+
+    def resume(self, job_id: str) -> None:
+        self.queue.resume(job_id)
+        self.changed.emit()
+        self.schedule()
+
+    def set_priority(self, job_id: str, priority: int) -> None:
+        self.queue.set_priority(job_id, priority)
+        self.changed.emit()
+        self.schedule()
+
+    def remove(self, job_id: str) -> bool:
+        removed = self.queue.remove(job_id)
+        if removed:
+            self.changed.emit()
+        return removed
+
+    def schedule(self) -> None:
+        """Start the next queued job, or preempt the running one for a higher priority."""
+        nxt = self.queue.next_job()
+        if nxt is None:
+            return
+        if self.worker is not None:
+            if nxt.priority > self.job.priority and not self._pause_running:
+                self.worker.stop()
+            return
+        wm, exp = nxt.settings_pair()
+        if nxt.processed:
+            # a paused or preempted job continues its own archive instead of replacing it
+            exp.resume_export = True
+        self.job = nxt
+        self._pause_running = False
+        self.worker = ExportWorker(nxt.files, wm, exp, background=True)
+        self.worker.progress.connect(lambda snap, job=nxt: self.progress.emit(job, snap))
+        self.worker.finished.connect(self._on_worker_finished)
+        self.queue.mark_running(nxt)
+        self.changed.emit()
+        self.worker.start()
+
+    def _on_worker_finished(self, success: int, total: int) -> None:
+        job, worker = self.job, self.worker
+        result = worker.result()
+        worker.wait()
+        self.queue.mark_stopped(job, success, result.failures, result.pending,
+                                requeue=result.stopped and not self._pause_running)
+        self.job = self.worker = None
+        self._pause_running = False
+        self.changed.emit()
+        self.job_finished.emit(job, result)
+        self.schedule()
+
+    def is_busy(self) -> bool:
+        return self.worker is not None
 
+    def shutdown(self) -> None:
+        """Stop the running job (its rest stays in the queue) and wait for the thread."""
+        if self.worker is not None:
+            self._pause_running = True
+            self.worker.stop()
+            self.worker.wait()
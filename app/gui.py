@@ -1,23 +1,96 @@
 import os
 from typing import List, Optional
-from PIL import Image
-from PyQt5.QtCore import Qt, QTimer, QSize
-from PyQt5.QtGui import QIcon, QPixmap, QColor
+from PyQt5.QtCore import Qt, QTimer, QSize, QRect, QRectF, QPoint
+from PyQt5.QtGui import QIcon, QPixmap, QColor, QPainter
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QMainWindow, QFileDialog, QListWidget, QListWidgetItem,
     QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSplitter, QGroupBox, QLineEdit,
     QSpinBox, QSlider, QColorDialog, QComboBox, QCheckBox, QMessageBox, QStylePainter, QStyleOption, QStyle
 )
 
-from .utils import is_image_file, make_thumbnail, qpixmap_from_pil
+from .utils import is_image_file, make_thumbnail, qpixmap_from_pil, SUPPORTED_OUTPUT_FORMATS
 from .engine import (
-    WatermarkSettings, ExportSettings, TextStyle, ImageStyle,
-    apply_watermark
+    WatermarkSettings, ExportSettings, TextStyle, ImageStyle, Rendition
 )
-from .exporter import ExportWorker
+from .preview import PreviewRenderer
+from .pyramid import MAX_ZOOM
+from .cache import shared_cache
 from . import templates as tmpl
 
 
+# size field of a rendition entry: "1600" long edge, "w800" width, "h600" height,
+# "50%" percent, "full" no resize
+_SIZE_PREFIXES = {"width": "w", "height": "h"}
+
+
+def _format_size(r: Rendition) -> str:
+    if r.resize_mode == "long_edge":
+        return str(r.resize_value)
+    if r.resize_mode == "percent":
+        return f"{r.resize_value}%"
+    if r.resize_mode in _SIZE_PREFIXES:
+        return f"{_SIZE_PREFIXES[r.resize_mode]}{r.resize_value}"
+    return "full"
+
+
+def _parse_size(token: str):
+    token = token.lower()
+    if token == "full":
+        return "none", 0
+    mode = "long_edge"
+    if token.endswith("%"):
+        mode, token = "percent", token[:-1]
+    elif token[:1] in ("w", "h"):
+        mode, token = ("width" if token[0] == "w" else "height"), token[1:]
+    value = int(token)  # ValueError for anything else
+    if value <= 0:
+        raise ValueError(token)
+    return mode, value
+
+
+def _default_suffix(size: str) -> str:
+    return "_" + size.replace("%", "pct")
+
+
+def _format_renditions(renditions: List[Rendition]) -> Optional[str]:
+    """Text form of ``renditions``, or None when parsing it back would not give them exactly."""
+    parts = []
+    for r in renditions:
+        size = _format_size(r)
+        fields = [size, r.out_format, str(r.quality)]
+        if r.target_size_kb:
+            fields.append(f"kb={r.target_size_kb}")
+        if r.suffix != _default_suffix(size):
+            fields.append(f"suffix={r.suffix}")
+        parts.append("/".join(fields))
+    text = "; ".join(parts)
+    return text if _parse_renditions(text) == renditions else None
+
+
+def _parse_renditions(spec: str) -> List[Rendition]:
+    # "尺寸/格式/质量[/kb=上限][/suffix=后缀]; ..." e.g. "1600/WEBP/85; w400/JPEG/80/kb=60";
+    # malformed entries are skipped
+    out = []
+    for part in spec.split(";"):
+        fields = [f.strip() for f in part.split("/")]
+        if len(fields) < 3:
+            continue
+        try:
+            mode, size = _parse_size(fields[0])
+            quality = int(fields[2])
+            options = {k.strip().lower(): v.strip() for k, v in (f.split("=", 1) for f in fields[3:])}
+            target_kb = max(0, int(options.pop("kb", 0)))
+        except ValueError:
+            continue
+        suffix = options.pop("suffix", _default_suffix(fields[0].lower()))
+        fmt = fields[1].upper()
+        if fmt not in SUPPORTED_OUTPUT_FORMATS or options or not suffix:
+            continue
+        out.append(Rendition(suffix=suffix, out_format=fmt, quality=max(0, min(100, quality)),
+                             resize_mode=mode, resize_value=size, target_size_kb=target_kb))
+    return out
+
+
 class ImageListWidget(QListWidget):
     def __init__(self):
         super().__init__()
@@ -60,45 +133,184 @@ class ImageListWidget(QListWidget):
 
 
 class PreviewWidget(QWidget):
+    """Watermark preview, fitted to the widget or zoomed up to MAX_ZOOM.
+
+    Wheel or +/- zooms around the cursor, 1 shows 100 % and 0 fits the image again;
+    the right or middle button pans while zoomed. A left click or drag places the
+    watermark in either mode.
+    """
+    ZOOM_STEP = 1.25  # per wheel notch or key press
+
     def __init__(self):
         super().__init__()
         self.current_path: Optional[str] = None
+        # rendered by PreviewRenderer at the widget's display size, so it is usually drawn 1:1
         self.pixmap: Optional[QPixmap] = None
+        # watermark box inside self.pixmap (device pixels), for partial repaints while dragging
+        self._wm_box: Optional[tuple] = None
+        # display-scaled copy of self.pixmap for sizes the renderer has not caught up with;
+        # invalidated only on resize or new content
+        self._scaled: Optional[QPixmap] = None
         self.wm_settings: Optional[WatermarkSettings] = None
         self.setMinimumSize(400, 300)
         self.setMouseTracking(True)
+        self.setFocusPolicy(Qt.WheelFocus)
         self._dragging = False
+        # None = whole image fitted to the widget; otherwise device pixels per source pixel
+        self._zoom: Optional[float] = None
+        self._center = (0.0, 0.0)  # view center in full-resolution source pixels while zoomed
+        self._pan_from: Optional[QPoint] = None
+        # full-resolution size of the source, and the view self.pixmap shows (None = fitted)
+        self._source_size: Optional[tuple] = None
+        self._pixmap_view: Optional[tuple] = None
+        # bumped on every request; results from older generations are dropped
+        self._generation = 0
+        self._renderer = PreviewRenderer(self)
+        self._renderer.rendered.connect(self._on_rendered)
+        self._renderer.start()
 
     def set_watermark_settings(self, wm: WatermarkSettings):
         self.wm_settings = wm
 
     def set_image_path(self, path: Optional[str]):
+        if path != self.current_path:
+            self._zoom = None
         self.current_path = path
         self.update_preview()
 
     def update_preview(self):
+        self._generation += 1
         if not self.current_path:
-            self.pixmap = None
+            self._renderer.cancel(self._generation)
+            self._set_pixmap(None, None)
             self.update()
             return
-        try:
-            with Image.open(self.current_path) as im:
-                im = im.convert("RGBA")
-                if self.wm_settings:
-                    im = apply_watermark(im, self.wm_settings)
-                self.pixmap = qpixmap_from_pil(im)
-        except Exception:
-            self.pixmap = None
-        self.update()
+        dpr = self.devicePixelRatioF()
+        box = (max(1, int(self.width() * dpr)), max(1, int(self.height() * dpr)))
+        view = (self._zoom,) + self._center if self._zoom is not None else None
+        self._renderer.request(self._generation, self.current_path, self.wm_settings, self.display_max_side(), box, view)
+
+    def display_max_side(self) -> int:
+        # rounded up so small window resizes keep hitting the same cache entries
+        side = max(self.width(), self.height()) * self.devicePixelRatioF()
+        return int(-(-side // 256) * 256)
+
+    def resizeEvent(self, e):
+        super().resizeEvent(e)
+        self._scaled = None
+        if self._zoom is not None:
+            self._clamp_center()
+        if self.current_path:
+            self.update_preview()
+
+    def zoom(self) -> Optional[float]:
+        """Device pixels per source pixel, or None while the image is fitted."""
+        return self._zoom
+
+    def set_zoom(self, zoom: Optional[float], anchor: Optional[QPoint] = None):
+        """Zoom to ``zoom`` (None or anything below the fitted size = fit), keeping the
+        source point under ``anchor`` (default: the widget center) in place."""
+        if not self.current_path or not self._source_size:
+            return
+        if anchor is None:
+            anchor = QPoint(self.width() // 2, self.height() // 2)
+        if zoom is None or zoom <= self._fit_zoom() * 1.001:
+            self._zoom = None
+        else:
+            sx, sy = self._source_from_widget(anchor.x(), anchor.y())
+            self._zoom = min(zoom, MAX_ZOOM)
+            dpr = self.devicePixelRatioF()
+            self._center = (sx - (anchor.x() - self.width() / 2) * dpr / self._zoom,
+                            sy - (anchor.y() - self.height() / 2) * dpr / self._zoom)
+            self._clamp_center()
+        self.update_preview()
+        self.update()  # the current pixmap, rescaled, until the new view arrives
+
+    def _fit_zoom(self) -> float:
+        w, h = self._source_size
+        dpr = self.devicePixelRatioF()
+        return min(self.width() * dpr / w, self.height() * dpr / h)
+
+    def _clamp_center(self):
+        """Keep the image covering the view; an axis smaller than the view is centered."""
+        dpr = self.devicePixelRatioF()
+        center = []
+        for c, size, extent in zip(self._center, self._source_size, (self.width(), self.height())):
+            half = extent * dpr / self._zoom / 2
+            center.append(size / 2 if size <= 2 * half else min(max(c, half), size - half))
+        self._center = tuple(center)
+
+    def _source_transform(self) -> tuple:
+        """(scale, ox, oy) mapping source pixel (sx, sy) to widget point (ox + sx * scale, oy + sy * scale)."""
+        w, h = self._source_size
+        if self._zoom is None:
+            s = min(self.width() / w, self.height() / h)
+            return s, (self.width() - w * s) / 2, (self.height() - h * s) / 2
+        s = self._zoom / self.devicePixelRatioF()
+        return s, self.width() / 2 - self._center[0] * s, self.height() / 2 - self._center[1] * s
+
+    def _source_from_widget(self, x: float, y: float) -> tuple:
+        s, ox, oy = self._source_transform()
+        return (x - ox) / s, (y - oy) / s
+
+    def _set_pixmap(self, pm: Optional[QPixmap], wm_box: Optional[tuple]):
+        self.pixmap = pm
+        self._wm_box = wm_box
+        self._scaled = None
+
+    def _on_rendered(self, generation: int, qimg, wm_box, info):
+        if generation != self._generation:
+            return
+        source_size, view = info
+        if source_size and source_size[0] and source_size[1]:
+            self._source_size = source_size
+        old_pm, old_box, old_view = self.pixmap, self._wm_box, self._pixmap_view
+        pm = QPixmap.fromImage(qimg) if qimg is not None else None
+        if pm is not None:
+            pm.setDevicePixelRatio(self.devicePixelRatioF())
+        self._set_pixmap(pm, wm_box)
+        self._pixmap_view = view
+        same_frame = (pm is not None and old_pm is not None and old_pm.size() == pm.size()
+                      and old_box is not None and wm_box is not None and old_view is None and view is None)
+        if same_frame and self._display_rect()[2:] == self._logical_size(pm):
+            # only the watermark moved: repaint its old and new bounds
+            self.update(self._widget_rect(old_box).united(self._widget_rect(wm_box)))
+        else:
+            self.update()
 
-    def _norm_from_event(self, event) -> Optional[tuple]:
-        if not self.pixmap:
-            return None
+    def shutdown(self):
+        self._renderer.stop()
+
+    @staticmethod
+    def _logical_size(pm: QPixmap) -> tuple:
+        dpr = pm.devicePixelRatioF()
+        return int(round(pm.width() / dpr)), int(round(pm.height() / dpr))
+
+    def _display_rect(self) -> tuple:
+        """(x, y, w, h) of the pixmap inside the widget, scaled to fit."""
         w, h = self.width(), self.height()
-        pm_w, pm_h = self.pixmap.width(), self.pixmap.height()
+        pm_w, pm_h = self._logical_size(self.pixmap)
         scale = min(w / pm_w, h / pm_h)
         disp_w, disp_h = int(pm_w * scale), int(pm_h * scale)
-        off_x, off_y = (w - disp_w) // 2, (h - disp_h) // 2
+        return (w - disp_w) // 2, (h - disp_h) // 2, disp_w, disp_h
+
+    def _widget_rect(self, box: tuple) -> QRect:
+        x, y, disp_w, disp_h = self._display_rect()
+        sx, sy = disp_w / self.pixmap.width(), disp_h / self.pixmap.height()
+        # a couple of pixels of margin for smooth-filtered edges
+        return QRect(QPoint(int(x + box[0] * sx) - 2, int(y + box[1] * sy) - 2),
+                     QPoint(int(x + box[2] * sx) + 2, int(y + box[3] * sy) + 2))
+
+    def _norm_from_event(self, event) -> Optional[tuple]:
+        if not self.pixmap:
+            return None
+        if self._zoom is not None:
+            w, h = self._source_size
+            sx, sy = self._source_from_widget(event.x(), event.y())
+            if 0 <= sx <= w and 0 <= sy <= h:
+                return sx / w, sy / h
+            return None
+        off_x, off_y, disp_w, disp_h = self._display_rect()
         x = event.x() - off_x
         y = event.y() - off_y
         if 0 <= x <= disp_w and 0 <= y <= disp_h:
@@ -108,6 +320,10 @@ class PreviewWidget(QWidget):
         return None
 
     def mousePressEvent(self, event):
+        if event.button() in (Qt.RightButton, Qt.MiddleButton) and self._zoom is not None:
+            self._pan_from = event.pos()
+            self.setCursor(Qt.ClosedHandCursor)
+            return
         if not self.pixmap or not self.wm_settings:
             return
         if event.button() == Qt.LeftButton:
@@ -118,6 +334,15 @@ class PreviewWidget(QWidget):
                 self.update_preview()
 
     def mouseMoveEvent(self, event):
+        if self._pan_from is not None:
+            delta = event.pos() - self._pan_from
+            self._pan_from = event.pos()
+            step = self.devicePixelRatioF() / self._zoom
+            self._center = (self._center[0] - delta.x() * step, self._center[1] - delta.y() * step)
+            self._clamp_center()
+            self.update_preview()
+            self.update()
+            return
         if self._dragging and self.wm_settings and self.pixmap:
             norm = self._norm_from_event(event)
             if norm:
@@ -127,6 +352,30 @@ class PreviewWidget(QWidget):
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.LeftButton:
             self._dragging = False
+        elif self._pan_from is not None and event.button() in (Qt.RightButton, Qt.MiddleButton):
+            self._pan_from = None
+            self.unsetCursor()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if not steps or not self.pixmap or not self._source_size:
+            super().wheelEvent(event)
+            return
+        current = self._zoom if self._zoom is not None else self._fit_zoom()
+        self.set_zoom(current * self.ZOOM_STEP ** steps, event.pos())
+        event.accept()
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key == Qt.Key_1:
+            self.set_zoom(1.0)
+        elif key == Qt.Key_0:
+            self.set_zoom(None)
+        elif key in (Qt.Key_Plus, Qt.Key_Equal, Qt.Key_Minus) and self._source_size:
+            current = self._zoom if self._zoom is not None else self._fit_zoom()
+            self.set_zoom(current * (self.ZOOM_STEP if key != Qt.Key_Minus else 1 / self.ZOOM_STEP))
+        else:
+            super().keyPressEvent(event)
 
     def paintEvent(self, e):
         opt = QStyleOption()
@@ -138,14 +387,50 @@ class PreviewWidget(QWidget):
         if not self.pixmap:
             return
         painter = QStylePainter(self)
-        w, h = self.width(), self.height()
-        pm_w, pm_h = self.pixmap.width(), self.pixmap.height()
-        scale = min(w / pm_w, h / pm_h)
-        disp_w, disp_h = int(pm_w * scale), int(pm_h * scale)
-        x, y = (w - disp_w) // 2, (h - disp_h) // 2
-        painter.drawPixmap(x, y, self.pixmap.scaled(disp_w, disp_h, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        painter.setClipRegion(e.region())
+        if self._zoom is None and self._pixmap_view is None:
+            x, y, disp_w, disp_h = self._display_rect()
+            painter.drawPixmap(x, y, self._scaled_pixmap(disp_w, disp_h))
+        elif self._source_size:
+            self._draw_view(painter)
         painter.end()
 
+    def _draw_view(self, painter: QPainter):
+        """Draw self.pixmap where the part of the source it shows lies in the current view.
+
+        A rendered view lands 1:1; while a newer view is being rendered the previous
+        one is scaled and shifted into place, so zooming and panning respond at once.
+        """
+        pm = self.pixmap
+        if self._pixmap_view is None:
+            x0, y0 = 0.0, 0.0
+            x1, y1 = self._source_size
+        else:
+            zoom, cx, cy = self._pixmap_view
+            half_w, half_h = pm.width() / zoom / 2, pm.height() / zoom / 2
+            x0, y0, x1, y1 = cx - half_w, cy - half_h, cx + half_w, cy + half_h
+        s, ox, oy = self._source_transform()
+        target = QRectF(ox + x0 * s, oy + y0 * s, (x1 - x0) * s, (y1 - y0) * s)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, self._zoom is None or self._zoom < 1)
+        painter.drawPixmap(target, pm, QRectF(0, 0, pm.width(), pm.height()))
+        if self._zoom is not None:
+            label = f"{self._zoom * 100:.0f}%"
+            rect = painter.fontMetrics().boundingRect(label).adjusted(-6, -3, 6, 3)
+            rect.moveTopRight(QPoint(self.width() - 8, 8))
+            painter.fillRect(rect, QColor(0, 0, 0, 140))
+            painter.setPen(QColor(255, 255, 255))
+            painter.drawText(rect, Qt.AlignCenter, label)
+
+    def _scaled_pixmap(self, disp_w: int, disp_h: int) -> QPixmap:
+        pm = self.pixmap
+        if self._logical_size(pm) == (disp_w, disp_h):
+            return pm
+        if self._scaled is None:
+            dpr = pm.devicePixelRatioF()
+            self._scaled = pm.scaled(int(disp_w * dpr), int(disp_h * dpr), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self._scaled.setDevicePixelRatio(dpr)
+        return self._scaled
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -178,6 +463,11 @@ class MainWindow(QMainWindow):
                 return os.path.join(os.getcwd(), "output")
 
         # State
+        self._state_loaded = False  # set once the stored settings have been applied
+        self._applying_state = False
+        self.job_queue = None  # JobQueue, loaded with the stored settings
+        self.export_runner = None  # ExportQueueRunner, created by the first export
+        self._export_snapshot = None  # latest ProgressSnapshot of the running job
         self.wm = WatermarkSettings()
         self.exp = ExportSettings(output_dir=_default_output_dir())
 
@@ -192,6 +482,7 @@ class MainWindow(QMainWindow):
         self._debounce.setSingleShot(True)
         self._debounce.setInterval(150)
         self._debounce.timeout.connect(self.preview.update_preview)
+        self._debounce.timeout.connect(self._save_last)
 
         left = QWidget()
         left_layout = QVBoxLayout(left)
@@ -221,6 +512,12 @@ class MainWindow(QMainWindow):
         sp.setStretchFactor(1, 1)
         self.setCentralWidget(sp)
 
+        # The template store is read after the window is first shown
+        QTimer.singleShot(0, self._load_initial_state)
+
+    def _load_initial_state(self):
+        self._refresh_tpl_list()
+        self._load_job_queue()
         # Load last template if exists
         last = tmpl.load_last()
         if last:
@@ -260,6 +557,8 @@ class MainWindow(QMainWindow):
                 pass
             self.preview.set_watermark_settings(self.wm)
             self._apply_state_to_ui()
+            self.preview.update_preview()
+        self._state_loaded = True
 
     # ========== List management ==========
     def add_images(self, paths: List[str]):
@@ -281,7 +580,7 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage(f"已添加 {added} 个文件，总计 {len(self.files)}")
 
     def add_files_dialog(self):
-        files, _ = QFileDialog.getOpenFileNames(self, "选择图片", "", "Images (*.jpg *.jpeg *.png *.bmp *.tif *.tiff)")
+        files, _ = QFileDialog.getOpenFileNames(self, "选择图片", "", "Images (*.jpg *.jpeg *.png *.bmp *.tif *.tiff *.gif *.webp)")
         self.add_images(files)
 
     def add_folder_dialog(self):
@@ -312,6 +611,9 @@ class MainWindow(QMainWindow):
         row = self.list_widget.currentRow()
         if 0 <= row < len(self.files):
             self.preview.set_image_path(self.files[row])
+            # warm the neighbours so arrowing through the list is instant
+            neighbours = [self.files[r] for r in (row + 1, row - 1) if 0 <= r < len(self.files)]
+            shared_cache.prefetch(neighbours, self.preview.display_max_side())
         else:
             self.preview.set_image_path(None)
 
@@ -432,11 +734,14 @@ class MainWindow(QMainWindow):
         el.addLayout(row_out)
 
         row_fmt = QHBoxLayout()
-        self.cmb_fmt = QComboBox(); self.cmb_fmt.addItems(["JPEG", "PNG"])
+        self.cmb_fmt = QComboBox(); self.cmb_fmt.addItems(list(SUPPORTED_OUTPUT_FORMATS))
         self.cmb_fmt.setCurrentText(self.exp.out_format)
         self.sld_quality = QSlider(Qt.Horizontal); self.sld_quality.setRange(0, 100); self.sld_quality.setValue(self.exp.jpeg_quality)
         row_fmt.addWidget(QLabel("格式:")); row_fmt.addWidget(self.cmb_fmt)
         row_fmt.addWidget(QLabel("JPEG质量:")); row_fmt.addWidget(self.sld_quality)
+        self.sp_target_kb = QSpinBox(); self.sp_target_kb.setRange(0, 100000); self.sp_target_kb.setValue(self.exp.target_size_kb)
+        self.sp_target_kb.setToolTip("0 表示不限制；大于 0 时自动搜索不超过该大小的最高 JPEG 质量")
+        row_fmt.addWidget(QLabel("目标大小(KB):")); row_fmt.addWidget(self.sp_target_kb)
         el.addLayout(row_fmt)
 
         row_name = QHBoxLayout()
@@ -449,23 +754,89 @@ class MainWindow(QMainWindow):
         el.addLayout(row_name)
 
         row_resize = QHBoxLayout()
-        self.cmb_resize = QComboBox(); self.cmb_resize.addItems(["none","width","height","percent"]); self.cmb_resize.setCurrentText(self.exp.resize_mode)
+        self.cmb_resize = QComboBox(); self.cmb_resize.addItems(["none","width","height","percent","long_edge"]); self.cmb_resize.setCurrentText(self.exp.resize_mode)
         self.sp_resize = QSpinBox(); self.sp_resize.setRange(0, 10000); self.sp_resize.setValue(self.exp.resize_value)
         row_resize.addWidget(QLabel("缩放方式:")); row_resize.addWidget(self.cmb_resize)
         row_resize.addWidget(QLabel("数值:")); row_resize.addWidget(self.sp_resize)
         el.addLayout(row_resize)
 
+        row_rend = QHBoxLayout()
+        self.ed_renditions = QLineEdit()
+        self.ed_renditions.setPlaceholderText("例如 1600/WEBP/85; w400/JPEG/80/kb=60")
+        self._show_renditions()
+        row_rend.addWidget(QLabel("附加输出:")); row_rend.addWidget(self.ed_renditions)
+        el.addLayout(row_rend)
+
+        row_meta = QHBoxLayout()
+        self.chk_keep_meta = QCheckBox("保留 EXIF/ICC"); self.chk_keep_meta.setChecked(self.exp.keep_metadata)
+        self.chk_strip_gps = QCheckBox("移除 GPS 位置"); self.chk_strip_gps.setChecked(self.exp.strip_gps)
+        self.chk_region = QCheckBox("JPEG 沿用原图量化表"); self.chk_region.setChecked(self.exp.jpeg_region_reencode)
+        self.chk_region.setToolTip("JPEG→JPEG 且不缩放时只在水印所在区块上合成，再用原图的量化表重新编码整张图（忽略质量设置）；\n"
+                                   "其余区域的画质损失很小，但并非完全无损")
+        self.chk_dedup = QCheckBox("重复图片只渲染一次"); self.chk_dedup.setChecked(self.exp.dedup_inputs)
+        self.chk_dedup.setToolTip("导出前按文件内容分组，内容相同的图片只渲染一次，其余文件名以硬链接（或复制）生成")
+        row_meta.addWidget(self.chk_keep_meta); row_meta.addWidget(self.chk_strip_gps); row_meta.addWidget(self.chk_region)
+        self.chk_resume = QCheckBox("跳过已完成（断点续传）"); self.chk_resume.setChecked(self.exp.resume_export)
+        self.chk_resume.setToolTip("输出文件夹中记录了已完成的图片；源文件和设置未变且输出完好时不再重复导出")
+        row_meta.addWidget(self.chk_dedup); row_meta.addWidget(self.chk_resume)
+        el.addLayout(row_meta)
+
+        row_par = QHBoxLayout()
+        self.sp_workers = QSpinBox(); self.sp_workers.setRange(0, 64); self.sp_workers.setValue(self.exp.export_workers)
+        self.sp_workers.setToolTip("同时导出的图片数；0 表示按 CPU 核数")
+        self.sp_mem_budget = QSpinBox(); self.sp_mem_budget.setRange(0, 1024 * 1024); self.sp_mem_budget.setValue(self.exp.memory_budget_mb)
+        self.sp_mem_budget.setToolTip("按图片尺寸预估内存，同时导出的图片总和不超过此值；0 表示可用内存的一半")
+        row_par.addWidget(QLabel("并行导出:")); row_par.addWidget(self.sp_workers)
+        row_par.addWidget(QLabel("内存上限(MB):")); row_par.addWidget(self.sp_mem_budget)
+        el.addLayout(row_par)
+
+        row_archive = QHBoxLayout()
+        self.cmb_archive = QComboBox()
+        for label, value in (("单独文件", ""), ("ZIP 压缩包", "zip"), ("TAR 归档", "tar")):
+            self.cmb_archive.addItem(label, value)
+        self.cmb_archive.setCurrentIndex(max(0, self.cmb_archive.findData(self.exp.archive_format)))
+        self.cmb_archive.setToolTip("压缩包/归档：整批导出直接写入输出文件夹中的一个文件，无需导出后再打包")
+        self.ed_archive_name = QLineEdit(self.exp.archive_name)
+        self.ed_archive_name.setToolTip("压缩包文件名（不含扩展名）")
+        row_archive.addWidget(QLabel("导出为:")); row_archive.addWidget(self.cmb_archive)
+        row_archive.addWidget(QLabel("名称:")); row_archive.addWidget(self.ed_archive_name)
+        el.addLayout(row_archive)
+
         row_btns = QHBoxLayout()
+        self.sp_priority = QSpinBox(); self.sp_priority.setRange(-99, 99); self.sp_priority.setValue(0)
+        self.sp_priority.setToolTip("加入导出队列时的优先级，数值大的先导出")
+        row_btns.addWidget(QLabel("优先级:")); row_btns.addWidget(self.sp_priority)
         self.btn_export_sel = QPushButton("导出选中")
         self.btn_export_all = QPushButton("导出全部")
         row_btns.addWidget(self.btn_export_sel)
         row_btns.addWidget(self.btn_export_all)
         el.addLayout(row_btns)
 
+        # Export queue
+        grp_queue = QGroupBox("导出队列")
+        ql = QVBoxLayout(grp_queue)
+        self.list_jobs = QListWidget(); self.list_jobs.setMaximumHeight(110)
+        self.list_jobs.setToolTip("导出任务按优先级依次在后台以较低的系统优先级运行；暂停的任务重启程序后仍可继续")
+        ql.addWidget(self.list_jobs)
+        row_q = QHBoxLayout()
+        self.btn_job_pause = QPushButton("暂停"); self.btn_job_resume = QPushButton("继续")
+        self.btn_job_up = QPushButton("优先级+"); self.btn_job_down = QPushButton("优先级-")
+        self.btn_job_remove = QPushButton("移除"); self.btn_job_clear = QPushButton("清除已完成")
+        for b in (self.btn_job_pause, self.btn_job_resume, self.btn_job_up, self.btn_job_down,
+                  self.btn_job_remove, self.btn_job_clear):
+            row_q.addWidget(b)
+        ql.addLayout(row_q)
+        self.btn_job_pause.clicked.connect(self.pause_job)
+        self.btn_job_resume.clicked.connect(self.resume_job)
+        self.btn_job_up.clicked.connect(lambda: self.change_job_priority(1))
+        self.btn_job_down.clicked.connect(lambda: self.change_job_priority(-1))
+        self.btn_job_remove.clicked.connect(self.remove_job)
+        self.btn_job_clear.clicked.connect(self.clear_done_jobs)
+
         # Templates
         grp_tpl = QGroupBox("模板")
         tl2 = QHBoxLayout(grp_tpl)
-        self.cmb_tpl = QComboBox(); self._refresh_tpl_list()
+        self.cmb_tpl = QComboBox()
         self.btn_tpl_load = QPushButton("加载")
         self.btn_tpl_save = QPushButton("保存为…")
         self.btn_tpl_delete = QPushButton("删除")
@@ -475,6 +846,7 @@ class MainWindow(QMainWindow):
         layout.addWidget(self.grp_image)
         layout.addWidget(grp_pos)
         layout.addWidget(grp_exp)
+        layout.addWidget(grp_queue)
         layout.addWidget(grp_tpl)
 
         # Connections
@@ -498,11 +870,22 @@ class MainWindow(QMainWindow):
 
         self.cmb_fmt.currentTextChanged.connect(self.on_export_changed)
         self.sld_quality.valueChanged.connect(self.on_export_changed)
+        self.sp_target_kb.valueChanged.connect(self.on_export_changed)
         self.cmb_name_mode.currentTextChanged.connect(self.on_export_changed)
         self.ed_prefix.textChanged.connect(self.on_export_changed)
         self.ed_suffix.textChanged.connect(self.on_export_changed)
         self.cmb_resize.currentTextChanged.connect(self.on_export_changed)
         self.sp_resize.valueChanged.connect(self.on_export_changed)
+        self.ed_renditions.editingFinished.connect(self.on_export_changed)
+        self.chk_keep_meta.toggled.connect(self.on_export_changed)
+        self.chk_strip_gps.toggled.connect(self.on_export_changed)
+        self.chk_region.toggled.connect(self.on_export_changed)
+        self.chk_dedup.toggled.connect(self.on_export_changed)
+        self.chk_resume.toggled.connect(self.on_export_changed)
+        self.sp_workers.valueChanged.connect(self.on_export_changed)
+        self.sp_mem_budget.valueChanged.connect(self.on_export_changed)
+        self.cmb_archive.currentIndexChanged.connect(self.on_export_changed)
+        self.ed_archive_name.editingFinished.connect(self.on_export_changed)
 
         self.btn_export_sel.clicked.connect(self.export_selected)
         self.btn_export_all.clicked.connect(self.export_all)
@@ -557,6 +940,8 @@ class MainWindow(QMainWindow):
             self.ed_out.setText(d)
 
     def on_settings_changed(self):
+        if self._applying_state:
+            return
         # pull from UI to state
         self.wm.text = self.ed_text.text()
         self.wm.text_style.font_path = self.ed_font.text() or None
@@ -575,20 +960,39 @@ class MainWindow(QMainWindow):
         self.wm.rotation = float(self.sp_rot.value())
         self.wm.offset = (self.sp_off_x.value(), self.sp_off_y.value())
 
-        tmpl.save_last(self.wm, self.exp)
+        # persisted together with the debounced preview so typing never waits on disk
         self._debounce.start()
 
+    def _save_last(self):
+        if not self._state_loaded:
+            return  # never overwrite the stored settings with the startup defaults
+        tmpl.save_last(self.wm, self.exp)
+
     def on_export_changed(self):
+        if self._applying_state:
+            return
         self.exp.output_dir = self.ed_out.text()
         self.exp.out_format = self.cmb_fmt.currentText()
         self.exp.jpeg_quality = self.sld_quality.value()
+        self.exp.target_size_kb = self.sp_target_kb.value()
         self.exp.naming_mode = self.cmb_name_mode.currentText()
         self.exp.prefix = self.ed_prefix.text()
         self.exp.suffix = self.ed_suffix.text()
         self.exp.resize_mode = self.cmb_resize.currentText()
         self.exp.resize_value = self.sp_resize.value()
-
-        tmpl.save_last(self.wm, self.exp)
+        if not self.ed_renditions.isReadOnly():
+            self.exp.renditions = _parse_renditions(self.ed_renditions.text())
+        self.exp.keep_metadata = self.chk_keep_meta.isChecked()
+        self.exp.strip_gps = self.chk_strip_gps.isChecked()
+        self.exp.jpeg_region_reencode = self.chk_region.isChecked()
+        self.exp.dedup_inputs = self.chk_dedup.isChecked()
+        self.exp.resume_export = self.chk_resume.isChecked()
+        self.exp.export_workers = self.sp_workers.value()
+        self.exp.memory_budget_mb = self.sp_mem_budget.value()
+        self.exp.archive_format = self.cmb_archive.currentData() or ""
+        self.exp.archive_name = self.ed_archive_name.text().strip() or "watermarked"
+
+        self._save_last()
 
     def export_selected(self):
         rows = [self.list_widget.row(i) for i in self.list_widget.selectedItems()]
@@ -612,24 +1016,126 @@ class MainWindow(QMainWindow):
             return
         self.exp.output_dir = out_dir
 
-        self.worker = ExportWorker(files, self.wm, self.exp)
-        self.worker.progress.connect(self.on_export_progress)
-        self.worker.finished.connect(self.on_export_finished)
-        self.statusBar().showMessage("开始导出…")
-        self.worker.start()
-
-    def on_export_progress(self, cur: int, total: int, path: str, ok: bool, msg: str):
-        base = os.path.basename(path)
-        if ok:
-            self.statusBar().showMessage(f"[{cur}/{total}] 导出成功: {base} -> {msg}")
-        else:
-            self.statusBar().showMessage(f"[{cur}/{total}] 失败: {base} ({msg})")
-
-    def on_export_finished(self, success: int, total: int):
-        self.statusBar().showMessage(f"导出完成: 成功 {success}/{total}")
-        QMessageBox.information(self, "导出", f"导出完成: 成功 {success}/{total}")
+        # the job keeps a snapshot of the current settings; later edits do not affect it
+        label = f"{len(files)} 张 → {os.path.basename(os.path.normpath(out_dir)) or out_dir}"
+        runner = self._export_runner()
+        job = runner.enqueue(files, self.wm, self.exp, self.sp_priority.value(), label)
+        self.statusBar().showMessage("开始导出…" if runner.job is job else "已加入导出队列")
+
+    def _export_runner(self):
+        if self.export_runner is None:
+            from .exporter import ExportQueueRunner
+            self.export_runner = ExportQueueRunner(self.job_queue, self)
+            self.export_runner.changed.connect(self._refresh_job_list)
+            self.export_runner.progress.connect(self.on_export_progress)
+            self.export_runner.job_finished.connect(self.on_export_finished)
+        return self.export_runner
+
+    def _load_job_queue(self):
+        from .jobqueue import JobQueue
+        self.job_queue = JobQueue()
+        self.job_queue.load()
+        self._refresh_job_list()
+
+    def _refresh_job_list(self):
+        from .jobqueue import STATE_LABELS
+        selected = self._selected_job_id()
+        self.list_jobs.clear()
+        for job in self.job_queue.jobs():
+            text = f"[{STATE_LABELS.get(job.state, job.state)}] {job.label}  {job.processed}/{job.total}"
+            if job.failures:
+                text += f"  失败 {len(job.failures)}"
+            text += f"  优先级 {job.priority}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, job.job_id)
+            self.list_jobs.addItem(item)
+            if job.job_id == selected:
+                item.setSelected(True)
+
+    def _selected_job_id(self) -> Optional[str]:
+        items = self.list_jobs.selectedItems()
+        return items[0].data(Qt.UserRole) if items else None
+
+    def pause_job(self):
+        job_id = self._selected_job_id()
+        if job_id:
+            self._export_runner().pause(job_id)
+
+    def resume_job(self):
+        job_id = self._selected_job_id()
+        if job_id:
+            self._export_runner().resume(job_id)
+
+    def change_job_priority(self, delta: int):
+        job = self.job_queue.get(self._selected_job_id() or "")
+        if job is not None:
+            self._export_runner().set_priority(job.job_id, job.priority + delta)
+
+    def remove_job(self):
+        job_id = self._selected_job_id()
+        if job_id and not self._export_runner().remove(job_id):
+            QMessageBox.information(self, "导出队列", "正在导出的任务不能移除，请先暂停")
+
+    def clear_done_jobs(self):
+        self.job_queue.clear_done()
+        self._refresh_job_list()
+
+    def on_export_progress(self, job, snap):
+        from .progress import format_duration
+        self._export_snapshot = snap
+        text = f"导出中 [{snap.done}/{snap.total}]"
+        if snap.failed:
+            text += f" 失败 {snap.failed}"
+        if snap.resumed:
+            text += f" 跳过 {snap.resumed}"
+        text += (f" | {snap.images_per_s:.1f} 张/秒, {snap.mb_per_s:.1f} MB/秒"
+                 f" | 剩余约 {format_duration(snap.eta)}")
+        if snap.last_path:
+            text += f" | {os.path.basename(snap.last_path)}"
+        self.statusBar().showMessage(text)
+
+    def on_export_finished(self, job, result):
+        from .jobqueue import DONE, QUEUED
+        if job.state == QUEUED:
+            self.statusBar().showMessage(f"{job.label}: 让位给优先级更高的任务，剩余 {len(job.files)} 张")
+            return
+        if job.state != DONE:
+            self.statusBar().showMessage(f"{job.label}: 已暂停，剩余 {len(job.files)} 张")
+            return
+        success, total = job.success, job.total
+        status = f"导出完成: 成功 {success}/{total}"
+        snap = self._export_snapshot
+        if snap is not None and snap.finished:
+            from .progress import format_duration
+            status += f"，用时 {format_duration(snap.elapsed)}，{snap.images_per_s:.1f} 张/秒，{snap.mb_per_s:.1f} MB/秒"
+        if result.text_tile_hits + result.text_tile_misses:
+            status += f"（文字水印缓存命中率 {result.text_tile_hit_rate:.0%}）"
+        self.statusBar().showMessage(status)
+        text = f"导出完成: 成功 {success}/{total}"
+        if result.resumed:
+            text += f"（其中 {result.resumed} 张此前已导出，已跳过）"
+        groups = result.duplicate_groups
+        if groups:
+            from .dedup import summarize
+            skipped, listing = summarize(groups)
+            text += f"\n\n内容重复 {len(groups)} 组，少渲染 {skipped} 张（已链接或复制输出）:\n{listing}"
+        failures = job.failures
+        box = QMessageBox(QMessageBox.Warning if failures else QMessageBox.Information, "导出", text, QMessageBox.Ok, self)
+        if failures:
+            box.setInformativeText(f"{len(failures)} 张导出失败，展开详细信息查看失败报告")
+            box.setDetailedText("\n".join(f"{p}\n    {msg}" for p, msg in failures))
+        box.exec_()
 
     def _apply_state_to_ui(self):
+        # widgets emit change signals while being set; keep those handlers from pulling
+        # half-applied widget values back into self.wm/self.exp
+        self._applying_state = True
+        try:
+            self._push_state_to_widgets()
+        finally:
+            self._applying_state = False
+
+    def _push_state_to_widgets(self):
         # wm
         self.cmb_mode.setCurrentIndex(0 if self.wm.mode == "text" else 1)
         self.ed_text.setText(self.wm.text)
@@ -654,11 +1160,36 @@ class MainWindow(QMainWindow):
         self.ed_out.setText(self.exp.output_dir)
         self.cmb_fmt.setCurrentText(self.exp.out_format)
         self.sld_quality.setValue(self.exp.jpeg_quality)
+        self.sp_target_kb.setValue(self.exp.target_size_kb)
         self.cmb_name_mode.setCurrentText(self.exp.naming_mode)
         self.ed_prefix.setText(self.exp.prefix)
         self.ed_suffix.setText(self.exp.suffix)
         self.cmb_resize.setCurrentText(self.exp.resize_mode)
         self.sp_resize.setValue(self.exp.resize_value)
+        self._show_renditions()
+        self.chk_keep_meta.setChecked(self.exp.keep_metadata)
+        self.chk_strip_gps.setChecked(self.exp.strip_gps)
+        self.chk_region.setChecked(self.exp.jpeg_region_reencode)
+        self.chk_dedup.setChecked(self.exp.dedup_inputs)
+        self.chk_resume.setChecked(self.exp.resume_export)
+        self.sp_workers.setValue(self.exp.export_workers)
+        self.sp_mem_budget.setValue(self.exp.memory_budget_mb)
+        self.cmb_archive.setCurrentIndex(max(0, self.cmb_archive.findData(self.exp.archive_format)))
+        self.ed_archive_name.setText(self.exp.archive_name)
+
+    def _show_renditions(self):
+        text = _format_renditions(self.exp.renditions)
+        # renditions the text form cannot express (from a hand-edited template) are kept as they are
+        self.ed_renditions.setReadOnly(text is None)
+        if text is None:
+            self.ed_renditions.setText(f"{len(self.exp.renditions)} 个附加输出（来自模板，无法在此编辑）")
+            self.ed_renditions.setToolTip("这些附加输出的设置无法用文本表示，请在模板文件中修改")
+        else:
+            self.ed_renditions.setText(text)
+            self.ed_renditions.setToolTip(
+                "附加输出：尺寸/格式/质量，多个用分号分隔；与主输出共用一次解码和水印\n"
+                "尺寸：1600 长边像素，w800 宽，h600 高，50% 百分比，full 不缩放\n"
+                "可选：/kb=200 JPEG 体积上限（KB），/suffix=_thumb 自定义文件名后缀（默认 _尺寸）")
 
     def save_template(self):
         name, ok = QFileDialog.getSaveFileName(self, "模板名称(输入文件名即可)", "", "Template (*.json)")
@@ -716,6 +1247,13 @@ class MainWindow(QMainWindow):
         self._apply_state_to_ui()
         self.preview.update_preview()
 
+    def closeEvent(self, e):
+        self._save_last()
+        if self.export_runner is not None:
+            self.export_runner.shutdown()  # the unfinished rest stays in the queue, paused
+        self.preview.shutdown()
+        super().closeEvent(e)
+
     def delete_template(self):
         key = self.cmb_tpl.currentText()
         if not key:
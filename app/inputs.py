@@ -0,0 +1,113 @@
+import io
+import mmap
+import os
+from typing import Optional
+from PIL import Image
+
+# Sources at or above this many bytes are memory-mapped and decoded straight from the
+# page cache instead of through buffered reads. WATERMARK_STUDIO_MMAP_THRESHOLD overrides
+# it (bytes; 0 maps every file, a negative value disables mapping). Smaller files gain
+# nothing from the extra mmap/munmap calls, and for compressed formats decoding dominates
+# either way; see bench/bench_mmap.py.
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def mmap_threshold() -> int:
+    try:
+        return int(os.environ.get("WATERMARK_STUDIO_MMAP_THRESHOLD", DEFAULT_MMAP_THRESHOLD))
+    except ValueError:
+        return DEFAULT_MMAP_THRESHOLD
+
+
+class MemoryReader(io.RawIOBase):
+    """Read-only seekable stream over a buffer, with its own position.
+
+    Reads copy only the requested chunk, so Pillow can decode from bytes in memory or a
+    memory-mapped file without a full copy first. Closing also closes ``owner`` (the mmap).
+    """
+
+    def __init__(self, data, owner=None):
+        self._view = memoryview(data).cast("B")
+        self._owner = owner
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        chunk = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return chunk
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+            if self._owner is not None:
+                self._owner.close()
+                self._owner = None
+        super().close()
+
+
+def map_file(path: str) -> Optional[MemoryReader]:
+    """Read-only mapping of ``path`` as a stream, or None if it cannot be mapped (e.g. empty)."""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+    return MemoryReader(mm, owner=mm)
+
+
+def open_image(path: str, threshold: Optional[int] = None) -> Image.Image:
+    """``Image.open(path)``, memory-mapping the file when it is at least ``threshold`` bytes.
+
+    A mapped image keeps its mapping until release_mapping() or until it is garbage
+    collected. Files below the threshold keep Pillow's own path-based open, which already
+    maps uncompressed formats itself.
+    """
+    if threshold is None:
+        threshold = mmap_threshold()
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = -1
+    reader = map_file(path) if 0 <= threshold <= size and size > 0 else None
+    if reader is None:
+        return Image.open(path)
+    try:
+        im = Image.open(reader)
+    except Exception:
+        reader.close()
+        raise
+    # with a filename Pillow maps uncompressed tiles itself, exactly as for a path open
+    im.filename = path  # type: ignore[attr-defined]
+    return im
+
+
+def release_mapping(im: Image.Image) -> None:
+    """Close the file mapping behind ``im`` (loading its pixels first), if it has one."""
+    fp = getattr(im, "fp", None)
+    if isinstance(fp, MemoryReader) and not fp.closed:
+        im.load()
+        fp.close()
+        im.fp = None
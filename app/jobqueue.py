@@ -0,0 +1,154 @@
+"""Persistent queue of export jobs with priorities and pause/resume.
+
+A job snapshots its file list and settings (templates.serialize layout) when it is
+added, so editing the GUI or loading another template afterwards does not change it.
+The queue is saved next to the templates after every change. Stopping a running job
+keeps the files it had not started, so resuming it, even after a restart, continues
+where it stopped; the output folder's export journal skips anything finished twice over.
+"""
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Tuple
+from . import templates as tmpl
+from .engine import WatermarkSettings, ExportSettings, atomic_output
+
+QUEUED, RUNNING, PAUSED, DONE = "queued", "running", "paused", "done"
+STATE_LABELS = {QUEUED: "排队中", RUNNING: "导出中", PAUSED: "已暂停", DONE: "已完成"}
+
+
+@dataclass
+class ExportJob:
+    job_id: str
+    label: str
+    files: List[str]  # inputs not exported yet
+    settings: Dict  # templates.serialize(wm, exp) at the time the job was added
+    priority: int = 0  # higher runs first
+    state: str = QUEUED
+    seq: int = 0  # insertion order; breaks priority ties
+    total: int = 0
+    success: int = 0
+    failures: List[Tuple[str, str]] = field(default_factory=list)  # (path, error)
+    created: float = 0.0
+
+    def settings_pair(self) -> Tuple[WatermarkSettings, ExportSettings]:
+        return tmpl.deserialize(self.settings)
+
+    @property
+    def processed(self) -> int:
+        return self.total - len(self.files)
+
+
+def queue_file() -> str:
+    return os.path.join(os.path.dirname(tmpl.templates_file()), "export_queue.json")
+
+
+class JobQueue:
+    """Export jobs ordered by priority, then insertion; not thread-safe (GUI thread only)."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or queue_file()
+        self._jobs: Dict[str, ExportJob] = {}
+        self._seq = 0
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for raw in data.get("jobs", []):
+            try:
+                job = ExportJob(**raw)
+            except TypeError:
+                continue
+            job.failures = [tuple(x) for x in job.failures]
+            if job.state in (QUEUED, RUNNING):
+                # nothing starts by itself at launch; the user resumes interrupted work
+                job.state = PAUSED
+            self._jobs[job.job_id] = job
+            self._seq = max(self._seq, job.seq + 1)
+
+    def save(self) -> None:
+        data = {"jobs": [asdict(j) for j in self.jobs()]}
+        try:
+            with atomic_output(self.path) as f:
+                f.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        except OSError:
+            pass  # the queue still works for this session
+
+    def jobs(self) -> List[ExportJob]:
+        """All jobs in run order: by priority, then insertion."""
+        return sorted(self._jobs.values(), key=lambda j: (-j.priority, j.seq))
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self._jobs.get(job_id)
+
+    def add(self, files: List[str], wm: WatermarkSettings, exp: ExportSettings,
+            priority: int = 0, label: str = "") -> ExportJob:
+        job = ExportJob(
+            job_id=uuid.uuid4().hex[:12], label=label or f"{len(files)} 张", files=list(files),
+            settings=tmpl.serialize(wm, exp), priority=priority, seq=self._seq,
+            total=len(files), created=time.time(),
+        )
+        self._seq += 1
+        self._jobs[job.job_id] = job
+        self.save()
+        return job
+
+    def next_job(self) -> Optional[ExportJob]:
+        return next((j for j in self.jobs() if j.state == QUEUED), None)
+
+    def running(self) -> Optional[ExportJob]:
+        return next((j for j in self._jobs.values() if j.state == RUNNING), None)
+
+    def set_priority(self, job_id: str, priority: int) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.priority = priority
+            self.save()
+
+    def pause(self, job_id: str) -> None:
+        """Pause a queued job; a running one is paused by its runner when it stops."""
+        job = self._jobs.get(job_id)
+        if job is not None and job.state == QUEUED:
+            job.state = PAUSED
+            self.save()
+
+    def resume(self, job_id: str) -> None:
+        job = self._jobs.get(job_id)
+        if job is not None and job.state == PAUSED:
+            job.state = QUEUED
+            self.save()
+
+    def remove(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.state == RUNNING:
+            return False
+        del self._jobs[job_id]
+        self.save()
+        return True
+
+    def clear_done(self) -> None:
+        for job in [j for j in self._jobs.values() if j.state == DONE]:
+            del self._jobs[job.job_id]
+        self.save()
+
+    def mark_running(self, job: ExportJob) -> None:
+        job.state = RUNNING
+        self.save()
+
+    def mark_stopped(self, job: ExportJob, success: int, failures: List[Tuple[str, str]],
+                     pending: List[str], requeue: bool = False) -> None:
+        """Record one run of ``job``; ``pending`` are the inputs it did not get to."""
+        job.success += success
+        not_run = set(pending)  # they get their own outcome in a later run
+        job.failures.extend((p, msg) for p, msg in failures if p not in not_run)
+        job.files = list(pending)
+        if not job.files:
+            job.state = DONE
+        else:
+            job.state = QUEUED if requeue else PAUSED
+        self.save()
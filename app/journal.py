@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional
+from .engine import WatermarkSettings, ExportSettings, PARTIAL_SUFFIX, atomic_output
+
+# Append-only record of finished exports, kept in the output folder. One JSON object per
+# line, written only after every output of the item has been renamed into place and
+# fsynced after each append, so a crash loses at most the line being written.
+JOURNAL_NAME = ".watermark_journal.jsonl"
+
+# settings that change how a batch runs but not the bytes it writes
+_NON_OUTPUT_FIELDS = ("resume_export", "dedup_inputs", "export_workers", "memory_budget_mb")
+
+
+def _file_identity(path: Optional[str]):
+    if not path or not isinstance(path, str):  # may come from request JSON (service.py)
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def settings_fingerprint(wm: WatermarkSettings, exp: ExportSettings) -> str:
+    """Hash of everything that determines the exported bytes, including the font and logo files."""
+    exp_data = asdict(exp)
+    for name in _NON_OUTPUT_FIELDS:
+        exp_data.pop(name, None)
+    data = {
+        "wm": asdict(wm),
+        "exp": exp_data,
+        "font": _file_identity(wm.text_style.font_path),
+        "logo": _file_identity(wm.image_style.path),
+    }
+    raw = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class ExportJournal:
+    """Tracks which sources have been fully exported to ``output_dir`` with given settings.
+
+    An item counts as done only if its source is unchanged (mtime, size), the settings
+    fingerprint matches, and every recorded output still exists with its recorded size.
+    """
+
+    def __init__(self, output_dir: str, fingerprint: str):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self.fingerprint = fingerprint
+        # start of the names of this journal's exports' temp files (atomic_output's temp_tag)
+        self.temp_tag = "wm-" + fingerprint[:12] + "."
+        self._entries: Dict[str, Dict] = {}  # abs source path -> latest entry
+        self._fh = None
+
+    def open(self) -> None:
+        """Load the journal and remove temp files an interrupted run with these settings left behind."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._remove_partials()
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._entries[entry["src"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn final line from a crash
+        except OSError:
+            pass
+        if lines > 2 * len(self._entries) + 1000:
+            self._compact()
+
+    def _remove_partials(self) -> None:
+        # only files tagged for this journal: another export may be writing to the folder now
+        prefix = "." + self.temp_tag
+        try:
+            names = os.listdir(self.output_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name.endswith(PARTIAL_SUFFIX):
+                try:
+                    os.remove(os.path.join(self.output_dir, name))
+                except OSError:
+                    pass
+
+    def _compact(self) -> None:
+        with atomic_output(self.path) as f:
+            for entry in self._entries.values():
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def completed(self, src_path: str, size_of: Callable[[str], int] = os.path.getsize) -> Optional[List[str]]:
+        """Outputs of a finished export of ``src_path``, or None if it must be (re)rendered.
+
+        ``size_of`` measures an output, raising OSError if it is missing; an archive
+        sink passes its own, since its outputs are entries rather than files.
+        """
+        entry = self._entries.get(os.path.abspath(src_path))
+        if not entry or entry.get("settings") != self.fingerprint:
+            return None
+        if _file_identity(src_path) != entry.get("source"):
+            return None
+        outputs, sizes = entry.get("outputs") or [], entry.get("sizes") or []
+        if not outputs or len(outputs) != len(sizes):
+            return None
+        for out, size in zip(outputs, sizes):
+            try:
+                if size_of(out) != size:
+                    return None
+            except OSError:
+                return None
+        return outputs
+
+    def record(self, src_path: str, outputs: List[str], size_of: Callable[[str], int] = os.path.getsize) -> None:
+        entry = {
+            "src": os.path.abspath(src_path),
+            "source": _file_identity(src_path),
+            "settings": self.fingerprint,
+            "outputs": outputs,
+            "sizes": [size_of(p) for p in outputs],
+        }
+        if self._fh is None:
+            self._fh = open(self.path, "ab")
+            if self._fh.tell() > 0 and not self._ends_with_newline():
+                self._fh.write(b"\n")  # terminate a torn line so this entry parses
+        self._fh.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._entries[entry["src"]] = entry
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
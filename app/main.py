@@ -1,5 +1,9 @@
 import os
 import sys
+import time
+
+_T0 = time.perf_counter()  # startup clock for WATERMARK_STUDIO_STARTUP_PROBE
+
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import Qt
 
@@ -27,6 +31,16 @@ def main():
     app = QApplication(sys.argv)
     w = MainWindow()
     w.show()
+    if os.environ.get("WATERMARK_STUDIO_STARTUP_PROBE"):
+        # bench/bench_startup.py: report time to the first event-loop turn after show(), then
+        # close the window (closeEvent stops the preview and export threads) and quit
+        from PyQt5.QtCore import QTimer
+
+        def _report():
+            print(f"startup_ms={(time.perf_counter() - _T0) * 1000:.1f}", flush=True)
+            w.close()
+            app.quit()
+        QTimer.singleShot(0, _report)
     sys.exit(app.exec_())
 
 
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import struct
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+# EXIF is carried through as the original bytes. Only the Orientation value, the GPS
+# IFD and the image-structure tags of IFD0 are patched in place, so maker notes and
+# unknown tags survive untouched.
+
+ORIENTATION_TAG = 0x0112
+GPS_IFD_TAG = 0x8825
+_EXIF_HEADER = b"Exif\x00\x00"
+# TIFF field type -> size in bytes
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+# IFD0 tags describing how a TIFF stores its pixels. Copied from a TIFF source into a
+# re-encoded output they point at strips and tiles that are not there, so they go.
+_IMAGE_STRUCTURE_TAGS = frozenset((
+    0x0100, 0x0101,  # ImageWidth, ImageLength
+    0x0102, 0x0103, 0x0106,  # BitsPerSample, Compression, PhotometricInterpretation
+    0x0111, 0x0115, 0x0116, 0x0117,  # StripOffsets, SamplesPerPixel, RowsPerStrip, StripByteCounts
+    0x011C, 0x013D, 0x0140,  # PlanarConfiguration, Predictor, ColorMap
+    0x0142, 0x0143, 0x0144, 0x0145,  # TileWidth, TileLength, TileOffsets, TileByteCounts
+    0x0152, 0x0153, 0x015B,  # ExtraSamples, SampleFormat, JPEGTables
+    0x0201, 0x0202,  # JPEGInterchangeFormat(Length): in IFD0 the old-style TIFF JPEG data
+))
+
+try:
+    _T = Image.Transpose  # type: ignore[attr-defined]
+except Exception:
+    _T = Image  # Pillow < 9.1 keeps the constants on Image
+_ORIENTATION_TRANSPOSE = {
+    2: _T.FLIP_LEFT_RIGHT,
+    3: _T.ROTATE_180,
+    4: _T.FLIP_TOP_BOTTOM,
+    5: _T.TRANSPOSE,
+    6: _T.ROTATE_270,
+    7: _T.TRANSVERSE,
+    8: _T.ROTATE_90,
+}
+
+
+@dataclass
+class SourceMetadata:
+    exif: Optional[bytes] = None
+    icc_profile: Optional[bytes] = None
+    orientation: int = 1
+    size: Tuple[int, int] = (0, 0)  # full-resolution size after orientation
+    n_frames: int = 1  # frames of an animated or multi-page source
+
+
+def _tiff_offset(raw: bytes) -> int:
+    return len(_EXIF_HEADER) if raw.startswith(_EXIF_HEADER) else 0
+
+
+def _ifd0(raw: bytes):
+    """Return (ifd_offset, entry_count, endian, base) of IFD0, or None."""
+    base = _tiff_offset(raw)
+    if len(raw) < base + 8:
+        return None
+    order = raw[base:base + 2]
+    if order == b"II":
+        endian = "<"
+    elif order == b"MM":
+        endian = ">"
+    else:
+        return None
+    ifd = base + struct.unpack_from(endian + "I", raw, base + 4)[0]
+    if ifd + 2 > len(raw):
+        return None
+    return ifd, struct.unpack_from(endian + "H", raw, ifd)[0], endian, base
+
+
+def _find_ifd0_entry(raw: bytes, tag: int):
+    """Return (entry_offset, endian, base) for ``tag`` in IFD0, or None."""
+    found = _ifd0(raw)
+    if not found:
+        return None
+    ifd, count, endian, base = found
+    for i in range(count):
+        entry = ifd + 2 + 12 * i
+        if entry + 12 > len(raw):
+            return None
+        if struct.unpack_from(endian + "H", raw, entry)[0] == tag:
+            return entry, endian, base
+    return None
+
+
+def read_orientation(raw: Optional[bytes]) -> int:
+    if not raw:
+        return 1
+    found = _find_ifd0_entry(raw, ORIENTATION_TAG)
+    if not found:
+        return 1
+    entry, endian, _ = found
+    value = struct.unpack_from(endian + "H", raw, entry + 8)[0]
+    return value if value in _ORIENTATION_TRANSPOSE else 1
+
+
+def _drop_ifd0_tags(buf: bytearray, tags) -> None:
+    """Remove the ``tags`` entries from IFD0 of ``buf`` in place.
+
+    The remaining entries (still in tag order) and the next-IFD offset move up and the
+    freed bytes are zeroed; nothing outside IFD0 moves, so every offset stays valid.
+    """
+    found = _ifd0(buf)
+    if not found:
+        return
+    ifd, count, endian, _ = found
+    end = ifd + 2 + 12 * count
+    if end + 4 > len(buf):
+        return
+    kept = [bytes(buf[e:e + 12]) for e in range(ifd + 2, end, 12)
+            if struct.unpack_from(endian + "H", buf, e)[0] not in tags]
+    if len(kept) == count:
+        return
+    packed = struct.pack(endian + "H", len(kept)) + b"".join(kept) + bytes(buf[end:end + 4])
+    buf[ifd:end + 4] = packed + bytes(end + 4 - ifd - len(packed))
+
+
+def patch_exif(raw: bytes, reset_orientation: bool = True, strip_gps: bool = False,
+               strip_structure: bool = True) -> bytes:
+    """Return ``raw`` with Orientation set to 1, the GPS IFD scrubbed and/or the TIFF
+    image-structure tags dropped from IFD0, without re-serializing."""
+    if not reset_orientation and not strip_gps and not strip_structure:
+        return raw
+    buf = bytearray(raw)
+    if reset_orientation:
+        found = _find_ifd0_entry(raw, ORIENTATION_TAG)
+        if found:
+            entry, endian, _ = found
+            struct.pack_into(endian + "H", buf, entry + 8, 1)
+    if strip_gps:
+        found = _find_ifd0_entry(raw, GPS_IFD_TAG)
+        if found:
+            entry, endian, base = found
+            gps = base + struct.unpack_from(endian + "I", raw, entry + 8)[0]
+            if gps + 2 <= len(buf):
+                count = struct.unpack_from(endian + "H", buf, gps)[0]
+                for i in range(count):
+                    e = gps + 2 + 12 * i
+                    if e + 12 > len(buf):
+                        break
+                    typ, n = struct.unpack_from(endian + "HI", buf, e + 2)
+                    size = _TYPE_SIZES.get(typ, 1) * n
+                    if size > 4:
+                        off = base + struct.unpack_from(endian + "I", buf, e + 8)[0]
+                        end = min(len(buf), off + size)
+                        buf[off:end] = bytes(max(0, end - off))
+                    buf[e:e + 12] = bytes(12)
+                # an empty GPS IFD keeps every other offset in the blob valid
+                struct.pack_into(endian + "H", buf, gps, 0)
+    if strip_structure:
+        # last: the patches above use entry offsets found in ``raw``
+        _drop_ifd0_tags(buf, _IMAGE_STRUCTURE_TAGS)
+    return bytes(buf)
+
+
+# formats whose extra frames are content; the extra frames of a camera JPEG (MPO) are
+# previews or depth maps and are left out like before
+_MULTI_FRAME_FORMATS = ("GIF", "PNG", "WEBP", "TIFF")
+
+
+def read_metadata(im: Image.Image) -> SourceMetadata:
+    raw = im.info.get("exif")
+    if not raw:
+        # formats without a raw EXIF block (e.g. TIFF) expose parsed tags only
+        try:
+            exif = im.getexif()
+            raw = exif.tobytes() if len(exif) else None
+        except Exception:
+            raw = None
+    orientation = read_orientation(raw)
+    w, h = im.size
+    n_frames = getattr(im, "n_frames", 1) if im.format in _MULTI_FRAME_FORMATS else 1
+    return SourceMetadata(exif=raw or None, icc_profile=im.info.get("icc_profile") or None,
+                          orientation=orientation, size=(h, w) if orientation >= 5 else (w, h),
+                          n_frames=n_frames)
+
+
+def apply_orientation(im: Image.Image, orientation: int) -> Image.Image:
+    method = _ORIENTATION_TRANSPOSE.get(orientation)
+    return im.transpose(method) if method is not None else im
+
+
+def save_kwargs(meta: Optional[SourceMetadata], strip_gps: bool = False) -> Dict[str, bytes]:
+    """Keyword arguments for ``Image.save`` carrying ``meta`` into the output.
+
+    Orientation is reset to 1 because pixels are already transposed on load, and the
+    strip/tile layout tags of a TIFF source are dropped since the output is re-encoded.
+    """
+    if meta is None:
+        return {}
+    kwargs: Dict[str, bytes] = {}
+    if meta.exif:
+        kwargs["exif"] = patch_exif(meta.exif, reset_orientation=meta.orientation != 1, strip_gps=strip_gps)
+    if meta.icc_profile:
+        kwargs["icc_profile"] = meta.icc_profile
+    return kwargs
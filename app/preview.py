@@ -0,0 +1,127 @@
+import copy
+import threading
+from typing import Optional, Tuple
+from PIL import Image
+from PyQt5.QtCore import QThread, pyqtSignal
+from .cache import shared_cache
+from .engine import (
+    WatermarkSettings, prepare_watermark, composite_tile, watermark_bbox, scale_watermark_settings, _LANCZOS
+)
+from .pyramid import ImagePyramid, render_view
+from .utils import qimage_from_pil
+
+# (zoom in device pixels per source pixel, center x, center y in source pixels)
+View = Tuple[float, float, float]
+
+
+class PreviewRenderer(QThread):
+    """Renders previews off the GUI thread.
+
+    Each request carries a generation number. Only the newest request is kept; a
+    render that falls behind a newer request is abandoned at the next stage
+    boundary, so stale frames are never emitted. Sources come from the shared
+    decoded-image cache and are fitted to the requested display box, with the
+    watermark scaled to match, so the GUI can draw the result without rescaling.
+    A request with a ``view`` renders just that viewport of the zoomed image instead,
+    from the image pyramid of the source (see pyramid.py).
+    """
+    # generation, QImage or None on failure, watermark box or None (fitted renders only),
+    # (full-resolution source size, view or None)
+    rendered = pyqtSignal(int, object, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cond = threading.Condition()
+        self._pending = None
+        self._latest = 0
+        self._stopping = False
+        # last display-fitted base: (cached source image, box, fitted RGBA); dragging reuses it
+        self._fitted: Optional[Tuple[Image.Image, Tuple[int, int], Image.Image]] = None
+        # pyramid of the last source shown zoomed; its levels are reused while panning
+        self._pyramid: Optional[ImagePyramid] = None
+
+    def request(self, generation: int, path: str, wm: Optional[WatermarkSettings],
+                max_side: Optional[int] = None, box: Optional[Tuple[int, int]] = None,
+                view: Optional[View] = None):
+        # snapshot the settings: the GUI keeps mutating its copy while we render
+        snapshot = copy.deepcopy(wm) if wm else None
+        with self._cond:
+            self._pending = (generation, path, snapshot, max_side, box, view)
+            self._latest = generation
+            self._cond.notify()
+
+    def cancel(self, generation: int):
+        """Drop any queued or running render older than ``generation``."""
+        with self._cond:
+            self._pending = None
+            self._latest = generation
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.wait()
+
+    def _stale(self, generation: int) -> bool:
+        return self._stopping or generation != self._latest
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                generation, path, wm, max_side, box, view = self._pending
+                self._pending = None
+            wm_box = None
+            size = None
+            try:
+                src, meta = shared_cache.get(path, max_side)
+                size = meta.size
+                if self._stale(generation):
+                    continue
+                if view is not None:
+                    frame = self._render_view(generation, path, meta.size, wm, box, view)
+                    if frame is None:
+                        continue
+                    qimg = qimage_from_pil(frame)
+                    if not self._stale(generation):
+                        self.rendered.emit(generation, qimg, None, (size, view))
+                    continue
+                frame = self._fit(src, box).copy()
+                if wm:
+                    if meta.size[0] and frame.width != meta.size[0]:
+                        wm = scale_watermark_settings(wm, frame.width / meta.size[0])
+                    prepared = prepare_watermark(frame.size, wm)
+                    if prepared:
+                        composite_tile(frame, *prepared)
+                        wm_box = watermark_bbox(frame.size, prepared)
+                if self._stale(generation):
+                    continue
+                qimg = qimage_from_pil(frame)
+            except Exception:
+                qimg = None
+            if not self._stale(generation):
+                self.rendered.emit(generation, qimg, wm_box, (size, None))
+
+    def _render_view(self, generation: int, path: str, full_size: Tuple[int, int],
+                     wm: Optional[WatermarkSettings], box: Tuple[int, int], view: View) -> Optional[Image.Image]:
+        pyr = self._pyramid
+        if pyr is None or pyr.full_size != full_size or not pyr.matches(path):
+            pyr = self._pyramid = ImagePyramid(path, full_size)
+        zoom, cx, cy = view
+        return render_view(pyr, wm, zoom, (cx, cy), box, lambda: self._stale(generation))
+
+    def _fit(self, src: Image.Image, box: Optional[Tuple[int, int]]) -> Image.Image:
+        """``src`` as RGBA scaled to fit ``box``; the cached source itself is never modified."""
+        if self._fitted and self._fitted[0] is src and self._fitted[1] == box:
+            return self._fitted[2]
+        fitted = src.convert("RGBA")
+        if box:
+            scale = min(box[0] / src.width, box[1] / src.height)
+            size = (max(1, int(src.width * scale)), max(1, int(src.height * scale)))
+            if size != fitted.size:
+                fitted = fitted.resize(size, _LANCZOS)
+        self._fitted = (src, box, fitted)
+        return fitted
@@ -0,0 +1,129 @@
+"""Aggregated batch progress: counts, throughput and ETA, emitted at a bounded rate.
+
+run_batch reports every file; a GUI only needs a few updates per second. The aggregator
+takes the per-file callbacks on the exporting thread and calls ``emit`` with a
+ProgressSnapshot at most once per ``interval`` seconds, plus once at the end. Between
+files, ``heartbeat`` (called by a timer on any thread) emits the same counts with the
+elapsed time brought up to date, so a long file does not freeze the display.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional
+from .batch import RESUMED_MESSAGE
+
+DEFAULT_INTERVAL = 0.25
+
+
+@dataclass
+class ProgressSnapshot:
+    done: int
+    total: int
+    failed: int
+    resumed: int
+    bytes_done: int  # source bytes of the files exported so far (resumed files excluded)
+    bytes_total: int  # source bytes of the files still to export plus bytes_done
+    elapsed: float  # seconds
+    exported: int  # files actually processed, i.e. done minus resumed
+    last_path: str = ""
+    finished: bool = False
+
+    @property
+    def images_per_s(self) -> float:
+        return self.exported / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes_done / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left, from the byte rate so far (large files cost more); None until known."""
+        if self.finished:
+            return 0.0
+        if self.bytes_done > 0 and self.elapsed > 0:
+            return max(0.0, (self.bytes_total - self.bytes_done) * self.elapsed / self.bytes_done)
+        if self.exported and self.elapsed > 0:
+            return (self.total - self.done) * self.elapsed / self.exported
+        return None
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m:02d}:{s:02d}"
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ProgressAggregator:
+    """Folds run_batch's per-file callbacks into throttled ProgressSnapshots.
+
+    Pass ``update`` as run_batch's ``on_progress``, call ``heartbeat`` every ``interval``
+    seconds from a timer and ``finish`` afterwards.
+    """
+
+    def __init__(self, files: List[str], emit: Callable[[ProgressSnapshot], None],
+                 interval: float = DEFAULT_INTERVAL, clock: Callable[[], float] = time.monotonic):
+        self._emit = emit
+        self._interval = interval
+        self._clock = clock
+        self._start = clock()
+        self._last_emit = None  # type: Optional[float]
+        self._lock = threading.Lock()  # heartbeat runs on the timer's thread
+        self.snapshot = ProgressSnapshot(0, len(files), 0, 0, 0, sum(_file_size(p) for p in files), 0.0, 0)
+
+    def update(self, current: int, total: int, path: str, ok: bool, msg: str) -> None:
+        size = _file_size(path)
+        with self._lock:
+            s = self.snapshot
+            s.done, s.total, s.last_path = current, total, path
+            if ok and msg.startswith(RESUMED_MESSAGE):  # no work done, so kept out of the rates
+                s.resumed += 1
+                s.bytes_total -= size
+            else:
+                s.exported += 1
+                s.bytes_done += size
+                if not ok:
+                    s.failed += 1
+            snap = self._due(self._interval)
+        if snap is not None:
+            self._emit(snap)
+
+    def heartbeat(self) -> None:
+        """Emit the current counts with up-to-date elapsed time, unless an update was just emitted."""
+        with self._lock:
+            # half an interval: a timer firing a little early must not skip a beat
+            snap = None if self.snapshot.finished else self._due(self._interval / 2)
+        if snap is not None:
+            self._emit(snap)
+
+    def finish(self) -> ProgressSnapshot:
+        with self._lock:
+            self.snapshot.elapsed = self._clock() - self._start
+            self.snapshot.finished = True
+            final = self._copy()
+        self._emit(final)
+        return final
+
+    def _due(self, min_gap: float) -> Optional[ProgressSnapshot]:
+        # under the lock: a copy to emit if min_gap seconds have passed since the last one
+        now = self._clock()
+        self.snapshot.elapsed = now - self._start
+        if self._last_emit is not None and now - self._last_emit < min_gap:
+            return None
+        self._last_emit = now
+        return self._copy()
+
+    def _copy(self) -> ProgressSnapshot:
+        # the receiver may live on another thread; never hand out the object being updated
+        return replace(self.snapshot)
@@ -0,0 +1,164 @@
+"""Zoomed preview rendering from a lazily built image pyramid.
+
+Level 0 is the full-resolution source; each further level halves the previous one.
+A zoomed view is drawn from the coarsest level that is still at least as sharp as the
+zoom, cut into fixed-size tiles of that level. Only the tiles inside the viewport are
+cropped and watermarked, and each is cached, so panning renders just the newly exposed
+tiles and moving the watermark renders just the tiles it touches. The watermark is
+prepared for the level's size the same way the fitted preview prepares it for its own
+size; at level 0 (zoom 100 % and above) the pixels are exactly what the export writes.
+"""
+import math
+import os
+from typing import Callable, Dict, Optional, Tuple
+from PIL import Image
+from .cache import shared_cache
+from .engine import (
+    WatermarkSettings, _TileCache, composite_tile, prepare_watermark, scale_watermark_settings, watermark_bbox,
+)
+
+TILE = 256  # tile side in level pixels
+MAX_ZOOM = 8.0  # device pixels per source pixel
+
+_Resampling = getattr(Image, "Resampling", Image)
+_BILINEAR = _Resampling.BILINEAR
+_NEAREST = _Resampling.NEAREST
+
+# Watermarked (or plain) level tiles, keyed by source identity, level, tile index and,
+# for tiles the watermark touches, the watermark settings.
+_view_tiles = _TileCache(max_entries=384, max_bytes=96 * 1024 * 1024)
+
+
+def view_cache_stats() -> Dict[str, float]:
+    return _view_tiles.stats()
+
+
+class ImagePyramid:
+    """Downsampled levels of one source, built on first use and kept for reuse.
+
+    Level 0 is served by the shared decoded-image cache. A missing level is reduced
+    from the nearest finer level already built; when there is none yet it is decoded
+    straight at its size (JPEG draft mode), which beats decoding at full resolution.
+    Not thread-safe: one pyramid belongs to one renderer thread.
+    """
+
+    def __init__(self, path: str, full_size: Tuple[int, int]):
+        self.path = path
+        self.full_size = full_size
+        self.key = _identity(path)
+        self._levels: Dict[int, Image.Image] = {}
+        w, h = full_size
+        self.max_level = max(0, (max(w, h) - 1).bit_length() - 1)
+
+    def matches(self, path: str) -> bool:
+        """True while ``path`` is still the file this pyramid was built from."""
+        return self.key == _identity(path)
+
+    def level_size(self, k: int) -> Tuple[int, int]:
+        f = 1 << k
+        return (self.full_size[0] + f - 1) // f, (self.full_size[1] + f - 1) // f
+
+    def level_for(self, zoom: float) -> int:
+        """Coarsest level with at least ``zoom`` pixels per source pixel of detail."""
+        if zoom >= 1.0:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1.0 / zoom))))
+
+    def level(self, k: int) -> Image.Image:
+        if k == 0:
+            return shared_cache.get(self.path)[0]
+        im = self._levels.get(k)
+        if im is not None:
+            return im
+        size = self.level_size(k)
+        finer = max((j for j in self._levels if j < k), default=None)
+        if finer is None and shared_cache.peek(self.path) is not None:
+            finer = 0
+        if finer is not None:
+            im = _reducible(self.level(finer)).reduce(1 << (k - finer))
+        else:
+            im = _reducible(shared_cache.get(self.path, max(size))[0])
+            if im.size != size:
+                im = im.resize(size, _BILINEAR)
+        self._levels[k] = im
+        return im
+
+
+def _identity(path: str) -> tuple:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+
+def _reducible(im: Image.Image) -> Image.Image:
+    return im if im.mode in ("L", "LA", "RGB", "RGBA") else im.convert("RGBA")
+
+
+def _watermark_key(wm: Optional[WatermarkSettings]) -> Optional[str]:
+    return repr(wm) if wm else None
+
+
+def render_view(pyramid: ImagePyramid, wm: Optional[WatermarkSettings], zoom: float,
+                center: Tuple[float, float], out_size: Tuple[int, int],
+                should_stop: Optional[Callable[[], bool]] = None) -> Optional[Image.Image]:
+    """RGBA image of ``out_size`` showing the source at ``zoom`` around ``center``.
+
+    ``zoom`` is output pixels per full-resolution source pixel and ``center`` is in
+    full-resolution source pixels. Areas outside the source stay transparent. Returns
+    None when ``should_stop`` turns true between tile rows.
+    """
+    k = pyramid.level_for(zoom)
+    lw, lh = pyramid.level_size(k)
+    scale = lw / pyramid.full_size[0]  # level pixels per source pixel
+    f = zoom / scale  # output pixels per level pixel
+    out_w, out_h = out_size
+    vx0 = center[0] * scale - out_w / f / 2
+    vy0 = center[1] * scale - out_h / f / 2
+    vx1, vy1 = vx0 + out_w / f, vy0 + out_h / f
+    out = Image.new("RGBA", out_size, (0, 0, 0, 0))
+    # visible part of the level
+    cx0, cy0, cx1, cy1 = max(0.0, vx0), max(0.0, vy0), min(float(lw), vx1), min(float(lh), vy1)
+    if cx1 <= cx0 or cy1 <= cy0:
+        return out
+
+    prepared = bbox = None
+    if wm:
+        lwm = scale_watermark_settings(wm, scale) if k else wm
+        prepared = prepare_watermark((lw, lh), lwm)
+        bbox = watermark_bbox((lw, lh), prepared)
+    wm_key = _watermark_key(wm)
+
+    tx0, ty0 = int(cx0) // TILE, int(cy0) // TILE
+    tx1, ty1 = (math.ceil(cx1) - 1) // TILE, (math.ceil(cy1) - 1) // TILE
+    rx0, ry0 = tx0 * TILE, ty0 * TILE
+    region = Image.new("RGBA", (min(lw, (tx1 + 1) * TILE) - rx0, min(lh, (ty1 + 1) * TILE) - ry0))
+    source = None
+    for ty in range(ty0, ty1 + 1):
+        if should_stop is not None and should_stop():
+            return None
+        for tx in range(tx0, tx1 + 1):
+            rect = (tx * TILE, ty * TILE, min(lw, (tx + 1) * TILE), min(lh, (ty + 1) * TILE))
+            touched = bbox is not None and not (
+                bbox[2] <= rect[0] or bbox[0] >= rect[2] or bbox[3] <= rect[1] or bbox[1] >= rect[3])
+            key = (pyramid.key, k, tx, ty, wm_key if touched else None)
+            hit = _view_tiles.get(key)
+            if hit is not None:
+                tile = hit[0]
+            else:
+                if source is None:
+                    source = pyramid.level(k)
+                tile = source.crop(rect).convert("RGBA")
+                if touched:
+                    wm_tile, (px, py) = prepared
+                    composite_tile(tile, wm_tile, (px - rect[0], py - rect[1]))
+                _view_tiles.put(key, (tile,))
+            region.paste(tile, (rect[0] - rx0, rect[1] - ry0))
+
+    # scale the visible part into place; beyond 100 % show the pixels as they are
+    dx0, dy0 = int(round((cx0 - vx0) * f)), int(round((cy0 - vy0) * f))
+    dx1, dy1 = int(round((cx1 - vx0) * f)), int(round((cy1 - vy0) * f))
+    if dx1 <= dx0 or dy1 <= dy0:
+        return out
+    part = region.resize((dx1 - dx0, dy1 - dy0), _NEAREST if f > 1 else _BILINEAR,
+                         box=(cx0 - rx0, cy0 - ry0, cx1 - rx0, cy1 - ry0))
+    out.paste(part, (dx0, dy0))
+    return out
@@ -0,0 +1,301 @@
+"""Memory-aware admission for parallel exports.
+
+Each job's peak memory and work are estimated from the image header alone (dimensions,
+mode and frame count, no decode). Jobs are started largest first, so a big panorama at
+the end of a list does not keep one core busy after the rest have finished, and only
+while the memory estimates of the jobs in flight stay within a budget. A job larger
+than the whole budget still runs, alone, so a batch never stalls on it. Exports run
+on threads: Pillow releases the GIL while decoding, resizing and encoding, and the
+budget then covers one process's memory.
+"""
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional, Tuple
+from PIL import Image
+from .engine import (
+    WatermarkSettings, ExportSettings, ANIMATED_OUTPUT_FORMATS, export_renditions, frame_window, resized_size,
+    _OUTPUT_BUFFER_BYTES,
+)
+from .metadata import read_metadata
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from .sinks import OutputSink
+
+MB = 1024 * 1024
+# per-job memory the estimate does not model: metadata, encoder state, Python objects
+_JOB_OVERHEAD = 16 * MB
+# rough upper bound of encoded bytes per output pixel, for sizing the output buffer
+_ENCODED_BYTES_PER_PIXEL = {"PNG": 4, "JPEG": 1, "WEBP": 1}
+# budget when free memory cannot be determined
+_FALLBACK_BUDGET = 1024 * MB
+
+# (ok, output paths, message) — the same triple run_batch reports per file
+ExportOutcome = Tuple[bool, List[str], str]
+
+# niceness added to background export threads (POSIX scale, 19 = lowest)
+BACKGROUND_NICE = 10
+_thread_state = threading.local()
+
+
+@dataclass
+class JobEstimate:
+    path: str
+    size: Tuple[int, int]  # (0, 0) when the header could not be read
+    mode: str
+    file_bytes: int
+    peak_bytes: int
+    work: int = 0  # relative export cost: pixels decoded plus pixels encoded
+    frames: int = 1
+
+
+def available_memory() -> Optional[int]:
+    """Bytes of memory available to new allocations without swapping, or None if unknown."""
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            return None
+    elif sys.platform == "win32":
+        import ctypes
+
+        class _MemoryStatusEx(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong)] + [
+                (name, ctypes.c_ulonglong) for name in (
+                    "ullTotalPhys", "ullAvailPhys", "ullTotalPageFile", "ullAvailPageFile",
+                    "ullTotalVirtual", "ullAvailVirtual", "ullAvailExtendedVirtual")
+            ]
+
+        status = _MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return int(status.ullAvailPhys)
+        return None
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def memory_budget(exp: ExportSettings) -> int:
+    """Bytes the jobs in flight may use: ``exp.memory_budget_mb``, or half of the free memory."""
+    if exp.memory_budget_mb > 0:
+        return exp.memory_budget_mb * MB
+    free = available_memory()
+    return free // 2 if free else _FALLBACK_BUDGET
+
+
+def worker_count(exp: ExportSettings) -> int:
+    return exp.export_workers if exp.export_workers > 0 else (os.cpu_count() or 1)
+
+
+def pixel_bytes(mode: str) -> int:
+    """Bytes per pixel Pillow allocates for ``mode``; RGB is stored padded to 4 bytes."""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def estimate_peak_bytes(size: Tuple[int, int], mode: str, exp: ExportSettings, frames: int = 1) -> int:
+    """Rough peak memory of exporting a ``size`` image in ``mode`` under ``exp``.
+
+    Mirrors export_renditions: the decoded source stays referenced while the RGBA
+    watermarked copy is made, every resized rendition is held until encoding, and a JPEG
+    encode converts its rendition to RGB first. A multi-frame source has frame_window()
+    frames in flight and keeps every frame of its animated renditions until the
+    animation is encoded (counted for PNG and WebP renditions, multi-page TIFFs included).
+    Every export thread also keeps an output buffer for its whole life
+    (engine._thread_output_buffer), grown to the largest set of outputs it has encoded;
+    it is counted here since each job in flight occupies one such thread.
+    """
+    w, h = size
+    px = w * h
+    src = px * pixel_bytes(mode)
+    per_frame = px * 4
+    kept = 0  # per frame, for animations
+    jpeg_px = 0
+    encoded = 0
+    for r in exp.all_renditions():
+        rw, rh = resized_size(size, r)
+        if (rw, rh) != (w, h):
+            per_frame += rw * rh * 4
+        if frames > 1 and r.out_format in ANIMATED_OUTPUT_FORMATS:
+            kept += rw * rh * 4
+        if r.out_format == "JPEG":
+            jpeg_px = max(jpeg_px, rw * rh)
+        encoded += rw * rh * _ENCODED_BYTES_PER_PIXEL.get(r.out_format, 4)
+    peak = src + per_frame * frame_window(frames) + kept * frames
+    # an EXIF-rotated source is transposed on load, briefly holding two decodes
+    peak = max(peak + jpeg_px * 4, src * 2)
+    return peak + _JOB_OVERHEAD + max(_OUTPUT_BUFFER_BYTES, encoded * frames)
+
+
+def estimate_job(path: str, exp: ExportSettings) -> JobEstimate:
+    """Estimate from the header only; Image.open does not decode pixels."""
+    try:
+        file_bytes = os.path.getsize(path)
+    except OSError:
+        file_bytes = 0
+    try:
+        with Image.open(path) as im:
+            size, mode = im.size, im.mode
+            frames = read_metadata(im).n_frames
+    except Exception:
+        # the export reports the real error; it fails before allocating much
+        return JobEstimate(path, (0, 0), "", file_bytes, _JOB_OVERHEAD + _OUTPUT_BUFFER_BYTES)
+    return JobEstimate(path, size, mode, file_bytes, estimate_peak_bytes(size, mode, exp, frames),
+                       estimate_work(size, exp) * frames, frames)
+
+
+def estimate_work(size: Tuple[int, int], exp: ExportSettings) -> int:
+    w, h = size
+    work = w * h  # decode and watermark
+    for r in exp.all_renditions():
+        rw, rh = resized_size(size, r)
+        work += rw * rh  # resize and encode
+    return work
+
+
+def plan_jobs(paths: List[str], exp: ExportSettings, controller: "AdmissionController",
+              largest_first: bool = True) -> List[Tuple[int, JobEstimate]]:
+    """(position in ``paths``, estimate) in the order the jobs should start.
+
+    Largest estimated work first, ties in list order, so the plan depends only on the
+    inputs and settings. With one worker the order cannot change the total time, so
+    the headers are not read and the list order is kept.
+    """
+    if controller.max_workers == 1:
+        return [(k, JobEstimate(p, (0, 0), "", 0, 0)) for k, p in enumerate(paths)]
+    jobs = [(k, estimate_job(p, exp)) for k, p in enumerate(paths)]
+    if largest_first:
+        jobs.sort(key=lambda kj: (-kj[1].work, kj[0]))
+    return jobs
+
+
+class AdmissionController:
+    """Tracks the estimated bytes of the jobs in flight against a budget."""
+
+    def __init__(self, budget_bytes: int, max_workers: int):
+        self.budget_bytes = max(1, budget_bytes)
+        self.max_workers = max(1, max_workers)
+        self.in_use = 0
+        self.running = 0
+        self.peak_in_use = 0  # highest admitted total, for reporting
+        self.max_running = 0
+
+    @classmethod
+    def for_settings(cls, exp: ExportSettings) -> "AdmissionController":
+        return cls(memory_budget(exp), worker_count(exp))
+
+    def try_admit(self, cost: int) -> bool:
+        if self.running >= self.max_workers:
+            return False
+        if self.running and self.in_use + cost > self.budget_bytes:
+            return False
+        self.in_use += cost
+        self.running += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.max_running = max(self.max_running, self.running)
+        return True
+
+    def release(self, cost: int) -> None:
+        self.in_use -= cost
+        self.running -= 1
+
+
+def lower_thread_priority() -> bool:
+    """Run the calling thread at background priority; returns False where unsupported.
+
+    Linux schedules threads individually and new threads inherit the niceness of the
+    thread that starts them; Windows threads do not, so export_parallel's pool threads
+    call this again when started from a lowered thread. Elsewhere only the whole process
+    could be reniced, which would slow the GUI as well, so nothing is changed.
+    """
+    lowered = False
+    if sys.platform.startswith("linux"):
+        try:
+            tid = threading.get_native_id()
+            nice = os.getpriority(os.PRIO_PROCESS, tid)
+            os.setpriority(os.PRIO_PROCESS, tid, min(19, nice + BACKGROUND_NICE))
+            lowered = True
+        except (OSError, AttributeError):
+            pass
+    elif sys.platform == "win32":
+        import ctypes
+        THREAD_PRIORITY_BELOW_NORMAL = -1
+        kernel32 = ctypes.windll.kernel32
+        lowered = bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_BELOW_NORMAL))
+    _thread_state.lowered = lowered
+    return lowered
+
+
+def _pool_thread_start() -> None:
+    if sys.platform == "win32":
+        lower_thread_priority()
+    else:
+        _thread_state.lowered = True  # inherited from the starting thread
+
+
+def _export_one(path: str, wm: WatermarkSettings, exp: ExportSettings,
+                sink: Optional["OutputSink"] = None, executor: Optional["Executor"] = None) -> ExportOutcome:
+    try:
+        outs = export_renditions(path, wm, exp, sink, executor)
+        return True, outs, "; ".join(outs)
+    except Exception as e:
+        return False, [], str(e)
+
+
+def export_parallel(jobs: List[JobEstimate], wm: WatermarkSettings, exp: ExportSettings,
+                    controller: AdmissionController,
+                    should_stop: Optional[Callable[[], bool]] = None,
+                    sink: Optional["OutputSink"] = None) -> Iterator[Tuple[int, ExportOutcome]]:
+    """Export ``jobs`` into ``sink`` (default: the output folder), yielding (position in
+    ``jobs``, outcome) in completion order.
+
+    Jobs are admitted in list order (see plan_jobs); when the next one does not fit the
+    budget, no smaller job overtakes it, so a large image cannot be starved by a stream
+    of small ones. The frames of multi-frame sources are rendered on the same pool, so
+    the thread count never exceeds the worker count. With one worker the exports run
+    inline, in order. Once ``should_stop()`` returns True no further job is started;
+    running ones finish.
+    """
+    stop = should_stop or (lambda: False)
+    if controller.max_workers == 1:
+        controller.max_running = 1 if jobs else 0
+        for k, job in enumerate(jobs):
+            if stop():
+                return
+            yield k, _export_one(job.path, wm, exp, sink)
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    queue = deque(range(len(jobs)))
+    running = {}
+    background = getattr(_thread_state, "lowered", False)
+    pool = ThreadPoolExecutor(max_workers=controller.max_workers, thread_name_prefix="wm-export",
+                              initializer=_pool_thread_start if background else None)
+    try:
+        while queue or running:
+            if stop():
+                queue.clear()
+                if not running:
+                    break
+            while queue and controller.try_admit(jobs[queue[0]].peak_bytes):
+                k = queue.popleft()
+                running[pool.submit(_export_one, jobs[k].path, wm, exp, sink, pool)] = k
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                k = running.pop(fut)
+                controller.release(jobs[k].peak_bytes)
+                yield k, fut.result()
+    finally:
+        # leaving early (e.g. the consumer raised): drop queued jobs, let running ones finish
+        pool.shutdown(wait=True, cancel_futures=True)
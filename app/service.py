@@ -0,0 +1,482 @@
+"""Headless local HTTP watermarking service.
+
+    python -m app.service [--host 127.0.0.1] [--port 8765] [--workers N] [--queue 64]
+
+POST /watermark
+    Body: the source image bytes. Settings come from ``?template=<name>`` (a saved
+    template) or ``?settings=<json>`` (the ``templates.serialize`` layout, URL-encoded);
+    with neither, default settings are used. A JSON body
+    ``{"image": <base64>, "template": <name>, "settings": {...}}`` is accepted too.
+    Responds with the encoded primary output (format, quality and resize from the
+    settings); extra renditions and JPEG region mode are export-only.
+GET /metrics
+    Prometheus text format: request counts, latency quantiles, queue depth, batch sizes.
+GET /healthz
+
+Requests go through a bounded queue; when it is full the service answers 503 with
+Retry-After instead of piling up work. A dispatcher thread drains the queue in small
+batches into a process pool, and each worker process keeps the parsed settings and the
+prepared watermark tile of recently used templates, so a run of same-size images with one
+template renders the watermark once.
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 256 * 1024 * 1024
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# worker result: ok, encoded bytes or error message, content type, template cache hit
+JobResult = Tuple[bool, object, str, bool]
+
+
+class BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------------------------------- worker process side
+
+_SETTINGS_CACHE_SIZE = 32
+_settings_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _lru_get(cache: OrderedDict, key):
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _lru_put(cache: OrderedDict, key, value, limit: int) -> None:
+    cache[key] = value
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def _tile_misses() -> int:
+    from .engine import cache_stats
+    return sum(s["misses"] for s in cache_stats().values())
+
+
+def _render_job(data: bytes, key: str, settings: Dict) -> JobResult:
+    from dataclasses import replace
+    from . import templates as tmpl
+    from .engine import _thread_output_buffer, export_bytes
+
+    parsed = _lru_get(_settings_cache, key)
+    if parsed is None:
+        wm, exp = tmpl.deserialize(settings)
+        # the response carries one image: the primary output, rendered the normal way
+        parsed = (wm, replace(exp, renditions=[], jpeg_region_reencode=False))
+        _lru_put(_settings_cache, key, parsed, _SETTINGS_CACHE_SIZE)
+    wm, exp = parsed
+
+    # the engine keeps watermark tiles per process, so same-template requests reuse them
+    misses = _tile_misses()
+    outputs = export_bytes(data, wm, exp, _thread_output_buffer())
+    hit = _tile_misses() == misses
+    try:
+        # multi-frame sources in a format without animation give one output per frame
+        first = outputs[0]
+        return True, bytes(first.data), CONTENT_TYPES.get(first.out_format, "application/octet-stream"), hit
+    finally:
+        for o in outputs:
+            o.data.release()
+
+
+def _process_batch(jobs: List[Tuple[bytes, str, Dict]]) -> List[JobResult]:
+    results = []
+    for data, key, settings in jobs:
+        try:
+            results.append(_render_job(data, key, settings))
+        except Exception as e:
+            results.append((False, str(e), "", False))
+    return results
+
+
+# ---------------------------------------------------------------- service process side
+
+class _Job:
+    __slots__ = ("data", "key", "settings", "done", "result")
+
+    def __init__(self, data: bytes, key: str, settings: Dict):
+        self.data = data
+        self.key = key
+        self.settings = settings
+        self.done = threading.Event()
+        self.result: Optional[JobResult] = None
+
+
+class ServiceMetrics:
+    """Counters and a sliding latency window, rendered in Prometheus text format."""
+
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self.requests: Dict[int, int] = {}
+        self.rejected = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self._latencies = deque(maxlen=window)
+
+    def observe(self, status: int, seconds: Optional[float] = None) -> None:
+        with self._lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+            if status == 503:
+                self.rejected += 1
+            if seconds is not None:
+                self.latency_sum += seconds
+                self.latency_count += 1
+                self._latencies.append(seconds)
+
+    def observe_batch(self, results: List[JobResult]) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batched_jobs += len(results)
+            for ok, _, _, hit in results:
+                if ok:
+                    if hit:
+                        self.cache_hits += 1
+                    else:
+                        self.cache_misses += 1
+
+    def render(self, queue_depth: int, queue_limit: int, inflight: int) -> str:
+        with self._lock:
+            lat = sorted(self._latencies)
+            lines = [
+                "# TYPE watermark_requests_total counter",
+                *(f'watermark_requests_total{{status="{s}"}} {n}' for s, n in sorted(self.requests.items())),
+                "# TYPE watermark_rejected_total counter",
+                f"watermark_rejected_total {self.rejected}",
+                "# TYPE watermark_latency_seconds summary",
+            ]
+            for q in (0.5, 0.9, 0.99):
+                value = lat[min(len(lat) - 1, int(q * len(lat)))] if lat else 0.0
+                lines.append(f'watermark_latency_seconds{{quantile="{q}"}} {value:.6f}')
+            lines += [
+                f"watermark_latency_seconds_sum {self.latency_sum:.6f}",
+                f"watermark_latency_seconds_count {self.latency_count}",
+                "# TYPE watermark_queue_depth gauge",
+                f"watermark_queue_depth {queue_depth}",
+                "# TYPE watermark_queue_limit gauge",
+                f"watermark_queue_limit {queue_limit}",
+                "# TYPE watermark_batches_inflight gauge",
+                f"watermark_batches_inflight {inflight}",
+                "# TYPE watermark_batches_total counter",
+                f"watermark_batches_total {self.batches}",
+                "# TYPE watermark_batched_jobs_total counter",
+                f"watermark_batched_jobs_total {self.batched_jobs}",
+                "# TYPE watermark_template_cache_hits_total counter",
+                f"watermark_template_cache_hits_total {self.cache_hits}",
+                "# TYPE watermark_template_cache_misses_total counter",
+                f"watermark_template_cache_misses_total {self.cache_misses}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+class WatermarkService:
+    """Bounded job queue feeding a process pool in small batches.
+
+    ``submit`` never blocks: a full queue raises ``queue.Full`` so the HTTP layer can
+    answer 503. The dispatcher keeps at most ``2 * workers`` batches in the pool; when
+    they are all busy it stops draining, the queue fills, and clients are pushed back.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 64,
+                 batch_size: int = 8, batch_wait: float = 0.002):
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.queue_size = queue_size
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.metrics = ServiceMetrics()
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=queue_size)
+        self._slots = threading.BoundedSemaphore(2 * self.workers)
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._templates: Optional[Tuple[float, Dict]] = None  # (store mtime, templates)
+        self._templates_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._dispatcher = threading.Thread(target=self._dispatch, name="dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self) -> None:
+        if self._dispatcher is not None:
+            self._queue.put(None)
+            self._dispatcher.join()
+            self._dispatcher = None
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def render_metrics(self) -> str:
+        return self.metrics.render(self.queue_depth(), self.queue_size, self._inflight)
+
+    # settings -------------------------------------------------------------------
+
+    def resolve_settings(self, template: Optional[str], settings: Optional[Dict]) -> Tuple[str, Dict]:
+        """(cache key, serialized settings) for a request."""
+        if settings is not None:
+            if not isinstance(settings, dict):
+                raise BadRequest(400, "settings must be a JSON object")
+            data = settings
+        elif template:
+            data = self._template_store().get(template)
+            if data is None:
+                raise BadRequest(404, f"unknown template: {template}")
+        else:
+            from . import templates as tmpl
+            from .engine import WatermarkSettings, ExportSettings
+            data = tmpl.serialize(WatermarkSettings(), ExportSettings())
+        from .journal import _file_identity
+        try:
+            # font and logo file identities are part of the key, so edited assets are re-prepared
+            wm = data.get("wm") or {}
+            assets = [_file_identity((wm.get("text_style") or {}).get("font_path")),
+                      _file_identity((wm.get("image_style") or {}).get("path"))]
+            raw = json.dumps([data, assets], sort_keys=True, ensure_ascii=False)
+        except (AttributeError, TypeError, ValueError) as e:
+            raise BadRequest(400, f"invalid settings: {e}")
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest(), data
+
+    def _template_store(self) -> Dict:
+        from . import templates as tmpl
+        try:
+            mtime = os.path.getmtime(tmpl.templates_file())
+        except OSError:
+            mtime = 0.0
+        with self._templates_lock:
+            if self._templates is None or self._templates[0] != mtime:
+                self._templates = (mtime, tmpl.list_templates())
+            return self._templates[1]
+
+    # jobs -----------------------------------------------------------------------
+
+    def submit(self, data: bytes, key: str, settings: Dict) -> _Job:
+        job = _Job(data, key, settings)
+        self._queue.put_nowait(job)  # raises queue.Full
+        return job
+
+    def _dispatch(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)  # handle the shutdown after this batch
+                    break
+                batch.append(nxt)
+            # same-template jobs next to each other reuse the worker's prepared tile
+            batch.sort(key=lambda j: j.key)
+            self._slots.acquire()
+            with self._inflight_lock:
+                self._inflight += 1
+            pool = self._pool
+            try:
+                fut = pool.submit(_process_batch, [(j.data, j.key, j.settings) for j in batch])
+            except (BrokenProcessPool, RuntimeError) as e:
+                # a worker died since the last batch: fail this one and keep serving
+                self._release_slot()
+                self._replace_pool(pool)
+                self._complete(batch, [(False, f"worker failed: {e}", "", False)] * len(batch))
+                continue
+            fut.add_done_callback(lambda f, b=batch, p=pool: self._finish(b, p, f))
+
+    def _finish(self, batch: List[_Job], pool: ProcessPoolExecutor, fut) -> None:
+        self._release_slot()
+        try:
+            results = fut.result()
+        except Exception as e:  # worker crashed
+            if isinstance(e, BrokenProcessPool):
+                self._replace_pool(pool)
+            results = [(False, f"worker failed: {e}", "", False)] * len(batch)
+        self._complete(batch, results)
+
+    def _release_slot(self) -> None:
+        with self._inflight_lock:
+            self._inflight -= 1
+        self._slots.release()
+
+    def _replace_pool(self, broken: ProcessPoolExecutor) -> None:
+        """Swap a broken pool for a fresh one; every batch that saw it break calls this."""
+        with self._pool_lock:
+            if self._pool is not broken:  # already replaced, or the service is stopping
+                return
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        # may run on the broken pool's own management thread, so don't wait for it
+        broken.shutdown(wait=False)
+
+    def _complete(self, batch: List[_Job], results: List[JobResult]) -> None:
+        self.metrics.observe_batch(results)
+        for job, result in zip(batch, results):
+            job.result = result
+            job.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "WatermarkStudio"
+    service: WatermarkService  # set by make_server
+    request_timeout = 120.0
+
+    def log_message(self, fmt, *args):  # quiet by default; errors still go to log_error
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "text/plain; charset=utf-8",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send(200, self.service.render_metrics().encode("utf-8"), "text/plain; version=0.0.4")
+        elif path == "/healthz":
+            self._send(200, b"ok\n")
+        else:
+            self._send(404, b"not found\n")
+
+    def do_POST(self):
+        t0 = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != "/watermark":
+            self._send(404, b"not found\n")
+            return
+        try:
+            data, key, settings = self._read_request(url.query)
+        except BadRequest as e:
+            self.service.metrics.observe(e.status)
+            self._send(e.status, (str(e) + "\n").encode("utf-8"))
+            return
+        try:
+            job = self.service.submit(data, key, settings)
+        except queue.Full:
+            self.service.metrics.observe(503)
+            self._send(503, b"queue full, retry later\n", headers={"Retry-After": "1"})
+            return
+        if not job.done.wait(self.request_timeout):
+            self.service.metrics.observe(504)
+            self._send(504, b"timed out\n")
+            return
+        ok, payload, content_type, _ = job.result
+        elapsed = time.perf_counter() - t0
+        if ok:
+            self.service.metrics.observe(200, elapsed)
+            self._send(200, payload, content_type, {"X-Render-Ms": f"{elapsed * 1000:.1f}"})
+        else:
+            self.service.metrics.observe(422, elapsed)
+            self._send(422, (str(payload) + "\n").encode("utf-8"))
+
+    def _read_request(self, query: str) -> Tuple[bytes, str, Dict]:
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise BadRequest(411, "Content-Length required")
+        if length <= 0:
+            raise BadRequest(400, "empty body")
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(413, "image too large")
+        body = self.rfile.read(length)
+        params = parse_qs(query)
+        template = params.get("template", [None])[0]
+        settings = None
+        if "settings" in params:
+            settings = _parse_json(params["settings"][0])
+        if self.headers.get("Content-Type", "").split(";")[0].strip() == "application/json":
+            doc = _parse_json(body)
+            if not isinstance(doc, dict) or "image" not in doc:
+                raise BadRequest(400, 'JSON body needs an "image" field (base64)')
+            try:
+                body = base64.b64decode(doc["image"], validate=True)
+            except (binascii.Error, TypeError, ValueError):
+                raise BadRequest(400, "image is not valid base64")
+            template = doc.get("template", template)
+            settings = doc.get("settings", settings)
+        key, data = self.service.resolve_settings(template, settings)
+        return body, key, data
+
+
+def _parse_json(raw):
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise BadRequest(400, f"invalid JSON: {e}")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default listen backlog of 5 resets bursts of clients before they can get a 503
+    request_queue_size = 128
+
+
+def make_server(service: WatermarkService, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """HTTP server bound to ``host:port`` (port 0 picks a free one) serving ``service``."""
+    handler = type("Handler", (_Handler,), {"service": service})
+    return _Server((host, port), handler)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Local HTTP watermarking service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--workers", type=int, default=None, help="worker processes (default: CPUs - 1)")
+    ap.add_argument("--queue", type=int, default=64, help="max queued requests before answering 503")
+    ap.add_argument("--batch", type=int, default=8, help="max requests handed to a worker at once")
+    args = ap.parse_args(argv)
+
+    service = WatermarkService(args.workers, args.queue, args.batch)
+    service.start()
+    server = make_server(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Watermark service on http://{host}:{port} ({service.workers} workers)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
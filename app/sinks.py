@@ -0,0 +1,379 @@
+"""Where finished outputs go: the output folder, or one ZIP/TAR archive in it.
+
+export_renditions hands every encoded output to a sink by file name. DirectorySink
+writes each as its own file, as exports always have. The archive sinks stream every
+output of a batch into a single archive, so a deliverable needs no second pass to
+zip thousands of files. Export threads call ``write`` concurrently; the entries are
+queued to one writer thread, the only one touching the archive. JPEG, PNG and WebP
+data is already compressed and is stored as it is.
+
+An archive is built in a hidden temp file next to its final name and renamed over it
+by ``close``, like any other output. Each archive records the settings fingerprint of
+the batch that wrote it (ZIP comment, TAR global PAX header). With ``append`` an
+existing archive with the same fingerprint is continued, which is how a stopped or
+resumed batch adds the rest of its outputs: the new archive gets this run's entries,
+then on ``close`` every old entry this run did not write again, so each name occurs
+once. An archive written with other settings is replaced, never mixed in.
+"""
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Set
+from .engine import ExportSettings, PARTIAL_SUFFIX, atomic_output, _FILE_MODE
+
+ARCHIVE_EXTS = {"zip": ".zip", "tar": ".tar"}
+# compressing these again costs time and saves next to nothing
+PRECOMPRESSED_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+# entries waiting for the writer; a full queue makes export threads wait for the disk
+_QUEUE_DEPTH = 32
+# the settings fingerprint goes in the TAR global header's standard "comment" record,
+# which readers ignore (a vendor keyword makes GNU tar warn on every extraction)
+_PAX_COMMENT = "watermark-settings="
+
+
+class OutputSink(ABC):
+    """Destination of finished outputs; ``write`` is safe to call from several threads.
+
+    Outputs are identified by the location ``write`` returns (a path for folders,
+    ``archive/name`` for archives), which is what batches report and journal.
+    """
+
+    @abstractmethod
+    def write(self, name: str, data) -> str:
+        """Store ``data`` (bytes-like, not kept after the call) as ``name``; returns its location."""
+
+    @abstractmethod
+    def alias(self, src: str, dst: str) -> None:
+        """Make location ``dst`` a copy of the already written ``src`` (deduplicated inputs)."""
+
+    @abstractmethod
+    def size_of(self, location: str) -> int:
+        """Size in bytes of the output at ``location``; OSError when it does not exist."""
+
+    def close(self) -> None:
+        """Finish the outputs; raises if any of them could not be written."""
+
+    def abort(self) -> None:
+        """Give up: discard anything not finished yet."""
+
+
+class DirectorySink(OutputSink):
+    """Each output is a file in ``root``, written atomically (temp files named with ``temp_tag``)."""
+
+    def __init__(self, root: str, temp_tag: str = ""):
+        self.root = root
+        self.temp_tag = temp_tag
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, name: str, data) -> str:
+        path = os.path.join(self.root, name)
+        with atomic_output(path, self.temp_tag) as f:
+            f.write(data)
+        return path
+
+    def alias(self, src: str, dst: str) -> None:
+        from .dedup import link_or_copy
+        link_or_copy(src, dst)
+
+    def size_of(self, location: str) -> int:
+        return os.path.getsize(location)
+
+
+class ArchiveSink(OutputSink):
+    """Outputs as entries of one archive at ``path``, added by a single writer thread.
+
+    ``fingerprint`` identifies the settings of the batch; with ``append`` the entries of
+    an existing archive at ``path`` written with the same fingerprint are kept.
+    ``temp_tag`` starts the temp file's name, as for atomic_output.
+    """
+
+    def __init__(self, path: str, fingerprint: str = "", append: bool = False, temp_tag: str = ""):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._sizes: Dict[str, int] = {}  # entry name -> size, including queued entries
+        self._written: Set[str] = set()  # entries added this run; writer thread only
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=_QUEUE_DEPTH)
+        self._error: Optional[BaseException] = None
+        self._has_base = False
+        out_dir, name = os.path.split(path)
+        fd, self._tmp = tempfile.mkstemp(prefix="." + temp_tag + name + ".", suffix=PARTIAL_SUFFIX,
+                                         dir=out_dir or ".")
+        self._file = os.fdopen(fd, "w+b")
+        try:
+            if append and os.path.exists(path):
+                try:
+                    base = self._open_base()
+                except Exception:
+                    base = None  # unreadable: start over
+                if base is not None:
+                    self._has_base = True
+                    self._sizes.update(base)
+            self._open()
+        except BaseException:
+            self._discard()
+            raise
+        self._writer = threading.Thread(target=self._run, name="archive-writer", daemon=True)
+        self._writer.start()
+
+    # format-specific parts, only ever called on the writer thread (or, before it
+    # starts and after it ends, from __init__ and close)
+    @abstractmethod
+    def _open(self) -> None:
+        """Start the new archive on self._file, recording self.fingerprint in it."""
+
+    @abstractmethod
+    def _open_base(self) -> Optional[Dict[str, int]]:
+        """Open the archive at self.path for reading; returns its entry sizes, or None
+        (and leaves nothing open) when it was written with another fingerprint."""
+
+    @abstractmethod
+    def _add(self, name: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _link(self, src: str, dst: str) -> None:
+        """Entry ``dst`` with the data of ``src``, which this run already added."""
+
+    @abstractmethod
+    def _read_base(self, name: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def _carry_over(self, skip: Set[str]) -> None:
+        """Copy every entry of the base archive whose name is not in ``skip``."""
+
+    @abstractmethod
+    def _close_base(self) -> None:
+        ...
+
+    @abstractmethod
+    def _finish(self) -> None:
+        ...
+
+    def location(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def write(self, name: str, data) -> str:
+        self._raise_error()
+        data = bytes(data)  # the caller reuses its buffer once this returns
+        with self._lock:
+            self._sizes[name] = len(data)
+        self._queue.put(("add", name, data))
+        return self.location(name)
+
+    def alias(self, src: str, dst: str) -> None:
+        self._raise_error()
+        src_name, dst_name = os.path.basename(src), os.path.basename(dst)
+        with self._lock:
+            self._sizes[dst_name] = self._sizes[src_name]
+        self._queue.put(("link", src_name, dst_name))
+
+    def size_of(self, location: str) -> int:
+        if os.path.dirname(location) != self.path:
+            raise FileNotFoundError(location)
+        with self._lock:
+            size = self._sizes.get(os.path.basename(location))
+        if size is None:
+            raise FileNotFoundError(location)
+        return size
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise OSError(f"writing {self.path} failed: {self._error}")
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so export threads never block on a dead writer
+            op, a, b = item
+            try:
+                if op == "add":
+                    self._add(a, b)
+                    self._written.add(a)
+                else:
+                    if a in self._written:
+                        self._link(a, b)
+                    else:  # output of a resumed item, only in the base archive
+                        self._add(b, self._read_base(a))
+                    self._written.add(b)
+            except BaseException as e:
+                self._error = e
+
+    def _stop_writer(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def close(self) -> None:
+        self._stop_writer()
+        try:
+            self._raise_error()
+            if self._has_base:
+                self._carry_over(self._written)
+                self._close_base()
+                self._has_base = False
+            self._finish()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.chmod(self._tmp, _FILE_MODE)
+            os.replace(self._tmp, self.path)
+        except BaseException:
+            self._discard()
+            raise
+
+    def abort(self) -> None:
+        self._stop_writer()
+        self._discard()
+
+    def _discard(self) -> None:
+        try:
+            self._finish()  # closes the archive object; the temp file goes anyway
+        except Exception:
+            pass
+        if self._has_base:
+            try:
+                self._close_base()
+            except Exception:
+                pass
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+
+class ZipSink(ArchiveSink):
+    def _open(self) -> None:
+        import zipfile
+        self._zip = zipfile.ZipFile(self._file, "w", allowZip64=True)
+        self._zip.comment = self.fingerprint.encode("ascii")
+
+    def _open_base(self) -> Optional[Dict[str, int]]:
+        import zipfile
+        base = zipfile.ZipFile(self.path)
+        if base.comment != self.fingerprint.encode("ascii"):
+            base.close()
+            return None
+        self._base = base
+        return {info.filename: info.file_size for info in base.infolist()}
+
+    def _add(self, name: str, data: bytes) -> None:
+        import zipfile
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        stored = name.lower().endswith(PRECOMPRESSED_EXTS)
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        info.external_attr = _FILE_MODE << 16
+        self._zip.writestr(info, data)
+
+    def _link(self, src: str, dst: str) -> None:
+        # ZIP has no links; the entry is read back from the archive being written
+        self._add(dst, self._zip.read(src))
+
+    def _read_base(self, name: str) -> bytes:
+        return self._base.read(name)
+
+    def _carry_over(self, skip: Set[str]) -> None:
+        skip = set(skip)
+        for info in self._base.infolist():
+            if info.filename not in skip:
+                skip.add(info.filename)
+                self._zip.writestr(info, self._base.read(info))
+
+    def _close_base(self) -> None:
+        self._base.close()
+
+    def _finish(self) -> None:
+        self._zip.close()
+
+
+class TarSink(ArchiveSink):
+    def _open(self) -> None:
+        import tarfile
+        self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT,
+                                 pax_headers={"comment": _PAX_COMMENT + self.fingerprint})
+
+    def _open_base(self) -> Optional[Dict[str, int]]:
+        import tarfile
+        base = tarfile.open(self.path, "r:")
+        members = {m.name: m for m in base.getmembers()}  # also reads the global header
+        if base.pax_headers.get("comment") != _PAX_COMMENT + self.fingerprint:
+            base.close()
+            return None
+        self._base = base
+        return {name: (members[m.linkname].size if m.islnk() and m.linkname in members else m.size)
+                for name, m in members.items()}
+
+    def _entry(self, name: str):
+        import tarfile
+        info = tarfile.TarInfo(name)
+        info.mtime = int(time.time())
+        info.mode = _FILE_MODE
+        return info
+
+    def _add(self, name: str, data: bytes) -> None:
+        info = self._entry(name)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def _link(self, src: str, dst: str) -> None:
+        import tarfile
+        info = self._entry(dst)
+        info.type = tarfile.LNKTYPE
+        info.linkname = src
+        self._tar.addfile(info)
+
+    def _read_base(self, name: str) -> bytes:
+        member = self._base.getmember(name)
+        with self._base.extractfile(member) as f:  # follows hard links
+            return f.read()
+
+    def _carry_over(self, skip: Set[str]) -> None:
+        # in archive order, so a link still follows its target (kept or written this run)
+        skip = set(skip)
+        for m in self._base.getmembers():
+            if m.name in skip:
+                continue
+            skip.add(m.name)
+            if m.isreg():
+                with self._base.extractfile(m) as f:
+                    self._tar.addfile(m, f)
+            else:
+                self._tar.addfile(m)
+
+    def _close_base(self) -> None:
+        self._base.close()
+
+    def _finish(self) -> None:
+        self._tar.close()  # writes the end-of-archive blocks; self._file stays open
+
+
+def archive_path(exp: ExportSettings) -> str:
+    return os.path.join(exp.output_dir, (exp.archive_name or "watermarked") + ARCHIVE_EXTS[exp.archive_format])
+
+
+def open_sink(exp: ExportSettings, fingerprint: str = "", temp_tag: str = "") -> OutputSink:
+    """Sink for a batch exported under ``exp``: the output folder, or an archive in it.
+
+    ``fingerprint`` is the batch's settings fingerprint (journal.settings_fingerprint).
+    An existing archive is continued when ``exp.resume_export`` is set and it was
+    written with the same fingerprint, like an output folder that already holds earlier
+    exports; otherwise it is replaced. Temp files are named with ``temp_tag``
+    (ExportJournal.temp_tag).
+    """
+    if not exp.archive_format:
+        return DirectorySink(exp.output_dir, temp_tag)
+    os.makedirs(exp.output_dir, exist_ok=True)
+    cls = ZipSink if exp.archive_format == "zip" else TarSink
+    return cls(archive_path(exp), fingerprint, append=exp.resume_export, temp_tag=temp_tag)
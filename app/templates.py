@@ -3,7 +3,7 @@ import os
 import sys
 from dataclasses import asdict
 from typing import Dict, Optional, Tuple
-from .engine import WatermarkSettings, ExportSettings, TextStyle, ImageStyle
+from .engine import WatermarkSettings, ExportSettings, TextStyle, ImageStyle, Rendition
 
 
 def _user_data_dir(app_name: str = "WatermarkStudio") -> str:
@@ -23,7 +23,22 @@ def _user_data_dir(app_name: str = "WatermarkStudio") -> str:
     return path
 
 
-TEMPLATES_FILE = os.path.join(_user_data_dir(), "templates.json")
+_templates_file: Optional[str] = None
+
+
+def templates_file() -> str:
+    """Path of the template store; the user data dir is created on first use, not at import."""
+    global _templates_file
+    if _templates_file is None:
+        _templates_file = os.path.join(_user_data_dir(), "templates.json")
+    return _templates_file
+
+
+def __getattr__(name: str):
+    # TEMPLATES_FILE used to be computed at import time
+    if name == "TEMPLATES_FILE":
+        return templates_file()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _empty_store():
@@ -31,18 +46,20 @@ def _empty_store():
 
 
 def _load_store() -> Dict:
-    if not os.path.exists(TEMPLATES_FILE):
+    path = templates_file()
+    if not os.path.exists(path):
         return _empty_store()
     try:
-        with open(TEMPLATES_FILE, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
         return _empty_store()
 
 
 def _save_store(store: Dict) -> None:
-    os.makedirs(os.path.dirname(TEMPLATES_FILE), exist_ok=True)
-    with open(TEMPLATES_FILE, "w", encoding="utf-8") as f:
+    path = templates_file()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
         json.dump(store, f, ensure_ascii=False, indent=2)
 
 
@@ -91,6 +108,27 @@ def deserialize(data: Dict) -> Tuple[WatermarkSettings, ExportSettings]:
         jpeg_quality=exp_data.get("jpeg_quality", 90),
         resize_mode=exp_data.get("resize_mode", "none"),
         resize_value=exp_data.get("resize_value", 0),
+        target_size_kb=exp_data.get("target_size_kb", 0),
+        jpeg_region_reencode=exp_data.get("jpeg_region_reencode", False),
+        keep_metadata=exp_data.get("keep_metadata", True),
+        strip_gps=exp_data.get("strip_gps", False),
+        dedup_inputs=exp_data.get("dedup_inputs", False),
+        resume_export=exp_data.get("resume_export", False),
+        export_workers=exp_data.get("export_workers", 0),
+        memory_budget_mb=exp_data.get("memory_budget_mb", 0),
+        archive_format=exp_data.get("archive_format", ""),
+        archive_name=exp_data.get("archive_name", "watermarked"),
+        renditions=[
+            Rendition(
+                suffix=r.get("suffix", ""),
+                out_format=r.get("out_format", "JPEG"),
+                quality=r.get("quality", 90),
+                resize_mode=r.get("resize_mode", "none"),
+                resize_value=r.get("resize_value", 0),
+                target_size_kb=r.get("target_size_kb", 0),
+            )
+            for r in exp_data.get("renditions", [])
+        ],
     )
     return wm, exp
 
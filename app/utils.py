@@ -1,9 +1,12 @@
+import ctypes
 import os
 from typing import Tuple, Optional
 from PIL import Image
+from .inputs import open_image
+from .metadata import read_metadata, apply_orientation
 
-SUPPORTED_INPUT_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
-SUPPORTED_OUTPUT_FORMATS = ("JPEG", "PNG")
+SUPPORTED_INPUT_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".gif", ".webp")
+SUPPORTED_OUTPUT_FORMATS = ("JPEG", "PNG", "WEBP")
 
 # Pillow resampling compatibility
 try:
@@ -22,27 +25,88 @@ def ensure_dir(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def qpixmap_from_pil(img: Image.Image):
-    # Convert a PIL Image to QPixmap without PIL.ImageQt to avoid compatibility issues
-    from PyQt5.QtGui import QPixmap, QImage
+def _pillow_version() -> Tuple[int, ...]:
+    parts = []
+    for p in Image.__version__.split(".")[:2]:
+        if not p.isdigit():
+            break
+        parts.append(int(p))
+    return tuple(parts)
+
+
+# unsafe_ptrs is internal Pillow API; the line-pointer layout below is the one Pillow
+# 9 and 10 use. Other versions take the tobytes() copy in qimage_from_pil.
+_SHARED_ROWS = (9,) <= _pillow_version() < (11,)
+
+
+def _shared_rgba_rows(img: Image.Image) -> Optional[int]:
+    """Address of an RGBA image's pixels if Pillow keeps every row in one contiguous block.
+
+    Large images are split across Pillow's memory blocks and return None, as does any
+    Pillow version outside the range _SHARED_ROWS was checked against.
+    """
+    if not _SHARED_ROWS:
+        return None
+    try:
+        addr = dict(img.im.unsafe_ptrs).get("image")
+    except Exception:
+        return None  # Pillow builds without unsafe_ptrs
+    w, h = img.size
+    if not addr or not w or not h:
+        return None
+    lines = (ctypes.c_void_p * h).from_address(addr)
+    first = lines[0]
+    stride = 4 * w
+    if any(lines[y] != first + y * stride for y in range(h)):
+        return None
+    return first
+
+
+def qimage_from_pil(img: Image.Image):
+    # QImage is safe to build off the GUI thread, unlike QPixmap.
+    # The result may borrow memory from ``img`` (or a bytes copy); the owner is kept
+    # alive as an attribute of the returned wrapper, so do not hand Qt-side shallow
+    # copies of it to code that outlives the wrapper.
+    from PyQt5.QtGui import QImage
+    if img.mode == "RGB":
+        # packed RGB copy: no detour through RGBA
+        w, h = img.size
+        buf = img.tobytes()
+        qimg = QImage(buf, w, h, 3 * w, QImage.Format_RGB888)
+        qimg._owner = buf
+        return qimg
     if img.mode != "RGBA":
         img = img.convert("RGBA")
     w, h = img.size
+    addr = _shared_rgba_rows(img)
+    if addr is not None:
+        from PyQt5 import sip
+        qimg = QImage(sip.voidptr(addr), w, h, 4 * w, QImage.Format_RGBA8888)
+        qimg._owner = img
+        return qimg
     buf = img.tobytes("raw", "RGBA")
     qimg = QImage(buf, w, h, 4 * w, QImage.Format_RGBA8888)
-    return QPixmap.fromImage(qimg.copy())
+    qimg._owner = buf
+    return qimg
+
+
+def qpixmap_from_pil(img: Image.Image):
+    # Convert a PIL Image to QPixmap without PIL.ImageQt to avoid compatibility issues
+    from PyQt5.QtGui import QPixmap
+    return QPixmap.fromImage(qimage_from_pil(img))
 
 
 def pil_from_qimage(qimage) -> Image.Image:
-    # Convert a QImage to PIL Image without PIL.ImageQt
+    # Convert a QImage to PIL Image without PIL.ImageQt; the result is a read-only view
+    # of the QImage pixels (Pillow copies on first write) and keeps the QImage alive
     from PyQt5.QtGui import QImage
     qimg = qimage.convertToFormat(QImage.Format_RGBA8888)
     w, h = qimg.width(), qimg.height()
-    ptr = qimg.bits()
-    ptr.setsize(qimg.byteCount())
-    data = bytes(ptr)
-    im = Image.frombuffer("RGBA", (w, h), data, "raw", "RGBA", 0, 1)
-    return im.copy()
+    ptr = qimg.constBits()
+    ptr.setsize(qimg.bytesPerLine() * h)
+    im = Image.frombuffer("RGBA", (w, h), ptr, "raw", "RGBA", qimg.bytesPerLine(), 1)
+    im._qimage_owner = qimg
+    return im
 
 
 def clamp(val: float, lo: float, hi: float) -> float:
@@ -60,9 +124,10 @@ def scale_to_fit(img: Image.Image, max_w: int, max_h: int) -> Image.Image:
 
 def make_thumbnail(path: str, size: Tuple[int, int] = (120, 120)) -> Optional[Image.Image]:
     try:
-        with Image.open(path) as im:
-            im = im.convert("RGBA")
+        with open_image(path) as im:
+            orientation = read_metadata(im).orientation
+            # shrink first: lets JPEG decode at a reduced scale instead of full resolution
             im.thumbnail(size, _LANCZOS)
-            return im
+            return apply_orientation(im, orientation).convert("RGBA")
     except Exception:
         return None
@@ -0,0 +1,378 @@
+"""Watch a hot folder and watermark new or changed images as they land.
+
+    python -m app.watch HOT_DIR --output OUT [--template NAME] [--recursive] [--existing]
+
+New files are noticed through inotify on Linux (via ctypes, no extra package) and by
+scandir polling elsewhere or when inotify is unavailable. A file is exported once it has
+settled: after the writer closed it (inotify) or once its size and mtime stop changing
+for ``settle`` seconds (polling), so half-written files from tethering software or
+network copies are not picked up. Repeated events for one path collapse into one
+pending entry, and a file whose size and mtime were already exported is skipped; the
+output folder's export journal carries that across restarts. Exports run on one
+persistent thread pool, and the font, text tile and logo are prepared once at start-up
+and then served from the engine caches.
+"""
+import argparse
+import ctypes
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .engine import WatermarkSettings, ExportSettings, PARTIAL_SUFFIX, prepare_watermark, export_renditions
+from .journal import ExportJournal, settings_fingerprint
+from .sinks import DirectorySink
+from .utils import is_image_file
+
+DEFAULT_SETTLE = 0.3  # seconds without change before a polled file counts as written
+CLOSED_SETTLE = 0.05  # after close-write: only guards against an immediate reopen
+DEFAULT_POLL_INTERVAL = 0.25
+
+FileIdentity = Tuple[int, int]  # size, mtime_ns
+
+
+def _identity(path: str) -> Optional[FileIdentity]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _walk_files(root: str, recursive: bool) -> Iterable[str]:
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry.path
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+        except OSError:
+            continue
+
+
+class PollingWatcher:
+    """Rescans the folder every ``interval`` seconds and reports new or changed files."""
+
+    def __init__(self, root: str, recursive: bool = False, interval: float = DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.recursive = recursive
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, FileIdentity]:
+        snapshot = {}
+        for path in _walk_files(self.root, self.recursive):
+            ident = _identity(path)
+            if ident is not None:
+                snapshot[path] = ident
+        return snapshot
+
+    def poll(self, timeout: float) -> List[Tuple[str, bool]]:
+        """(path, closed) of the changes seen within ``timeout`` seconds; never closed here."""
+        wait = self._next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(0.0, timeout))
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_scan = time.monotonic() + self.interval
+        current = self._scan()
+        changed = [(p, False) for p, ident in current.items() if self._snapshot.get(p) != ident]
+        self._snapshot = current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify through ctypes; raises OSError where it is unavailable."""
+
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    _IN_NONBLOCK = 0o4000
+    _IN_CLOEXEC = 0o2000000
+    _MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; then len bytes of name
+
+    def __init__(self, root: str, recursive: bool = False):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available in this libc")
+        self._libc = libc
+        self.root = root
+        self.recursive = recursive
+        self._dirs: Dict[int, str] = {}
+        self._fd = libc.inotify_init1(self._IN_NONBLOCK | self._IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        self._dirs[wd] = path
+
+    def _watch_tree(self, path: str) -> None:
+        self._watch(path)
+        if self.recursive:
+            stack = [path]
+            while stack:
+                try:
+                    with os.scandir(stack.pop()) as it:
+                        for entry in it:
+                            if entry.is_dir(follow_symlinks=False):
+                                self._watch(entry.path)
+                                stack.append(entry.path)
+                except OSError:
+                    continue
+
+    def poll(self, timeout: float) -> List[Tuple[str, bool]]:
+        """(path, closed) for the events of the next ``timeout`` seconds; closed = writer is done."""
+        ready, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events: List[Tuple[str, bool]] = []
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            name = data[offset + self._EVENT.size: offset + self._EVENT.size + length].split(b"\0", 1)[0]
+            offset += self._EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                # events were dropped: report everything and let the caller's identity check sort it out
+                events.extend((p, False) for p in _walk_files(self.root, self.recursive))
+                continue
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            parent = self._dirs.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & self.IN_ISDIR:
+                if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # files can land before the new directory's watch exists
+                    try:
+                        self._watch_tree(path)
+                    except OSError:
+                        pass
+                    events.extend((p, False) for p in _walk_files(path, True))
+                continue
+            events.append((path, bool(mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO))))
+        return events
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def make_watcher(root: str, recursive: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 force_polling: bool = False):
+    if not force_polling:
+        try:
+            return InotifyWatcher(root, recursive)
+        except OSError:
+            pass
+    return PollingWatcher(root, recursive, poll_interval)
+
+
+class SettleTracker:
+    """Pending paths, released once they stop changing; repeated events just refresh them."""
+
+    def __init__(self, settle: float = DEFAULT_SETTLE, closed_settle: float = CLOSED_SETTLE):
+        self.settle = settle
+        self.closed_settle = closed_settle
+        self._pending: Dict[str, Tuple[Optional[FileIdentity], float, bool]] = {}  # ident, since, closed
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def touch(self, path: str, now: float, closed: bool = False) -> None:
+        self._pending[path] = (_identity(path), now, closed)
+
+    def ready(self, now: float) -> List[Tuple[str, FileIdentity]]:
+        out = []
+        for path, (ident, since, closed) in list(self._pending.items()):
+            current = _identity(path)
+            if current is None:
+                del self._pending[path]  # deleted or renamed away before it settled
+                continue
+            if current != ident:
+                self._pending[path] = (current, now, False)
+                continue
+            if now - since < (self.closed_settle if closed else self.settle):
+                continue
+            try:
+                # a writer on Windows keeps the file locked until it is done
+                with open(path, "rb"):
+                    pass
+            except OSError:
+                continue
+            del self._pending[path]
+            out.append((path, current))
+        return out
+
+
+class FolderWatcher:
+    """Feeds settled images from ``root`` to a persistent export pool until stopped."""
+
+    def __init__(self, root: str, wm: WatermarkSettings, exp: ExportSettings, recursive: bool = False,
+                 settle: float = DEFAULT_SETTLE, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 workers: int = 0, force_polling: bool = False, log: Callable[[str], None] = print):
+        from .scheduler import worker_count
+        self.root = os.path.abspath(root)
+        self.wm = wm
+        self.exp = exp
+        self.recursive = recursive
+        self.tracker = SettleTracker(settle)
+        self.poll_interval = poll_interval
+        self.workers = workers or worker_count(exp)
+        self.force_polling = force_polling
+        self.log = log
+        self.exported = 0
+        self.failed = 0
+        self._exclude = os.path.abspath(exp.output_dir) if exp.output_dir else None
+        self._done: Dict[str, FileIdentity] = {}  # identity of each path's last export
+
+    def _candidate(self, path: str) -> bool:
+        name = os.path.basename(path)
+        if name.startswith((".", "~")) or name.endswith(PARTIAL_SUFFIX) or not is_image_file(path):
+            return False
+        if self._exclude:
+            try:
+                if os.path.commonpath([os.path.abspath(path), self._exclude]) == self._exclude:
+                    return False  # our own outputs, when the output folder is inside the hot folder
+            except ValueError:
+                pass  # different drives
+        return True
+
+    def _warm_up(self) -> None:
+        # font loading, text rasterization and logo decoding happen here, not on the first photo
+        from PIL import Image
+        Image.init()
+        try:
+            prepare_watermark((1000, 1000), self.wm)
+        except Exception as e:
+            self.log(f"watermark warm-up failed: {e}")
+
+    def run(self, existing: bool = False, stop: Optional[threading.Event] = None) -> None:
+        """Watch until ``stop`` is set (or KeyboardInterrupt); with ``existing``, also export what is already there."""
+        from concurrent.futures import ThreadPoolExecutor
+        stop = stop or threading.Event()
+        os.makedirs(self.exp.output_dir, exist_ok=True)
+        self._warm_up()
+        watcher = make_watcher(self.root, self.recursive, self.poll_interval, self.force_polling)
+        self.log(f"watching {self.root} ({type(watcher).__name__}, {self.workers} workers) -> {self.exp.output_dir}")
+        journal = ExportJournal(self.exp.output_dir, settings_fingerprint(self.wm, self.exp))
+        journal.open()
+        sink = DirectorySink(self.exp.output_dir, journal.temp_tag)
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wm-watch")
+        running: Dict[str, Tuple["object", FileIdentity]] = {}  # path -> (future, identity)
+        if existing:
+            now = time.monotonic()
+            for path in _walk_files(self.root, self.recursive):
+                if self._candidate(path):
+                    self.tracker.touch(path, now, closed=True)
+        try:
+            while not stop.is_set():
+                busy = running or len(self.tracker)
+                for path, closed in watcher.poll(0.02 if busy else 0.5):
+                    if self._candidate(path):
+                        self.tracker.touch(path, time.monotonic(), closed)
+                for path, ident in self.tracker.ready(time.monotonic()):
+                    if path in running:
+                        self.tracker.touch(path, time.monotonic())  # changed mid-export: again afterwards
+                    elif self._done.get(path) != ident:
+                        if self.exp.resume_export and journal.completed(path) is not None:
+                            self._done[path] = ident
+                            continue
+                        running[path] = (pool.submit(export_renditions, path, self.wm, self.exp, sink), ident)
+                for path, (fut, ident) in list(running.items()):
+                    if fut.done():
+                        del running[path]
+                        self._finish(path, ident, fut, journal)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for path, (fut, ident) in running.items():
+                self._finish(path, ident, fut, journal)
+            pool.shutdown(wait=True)
+            watcher.close()
+            journal.close()
+
+    def _finish(self, path: str, ident: FileIdentity, fut, journal: ExportJournal) -> None:
+        try:
+            outs = fut.result()
+        except Exception as e:
+            self.failed += 1
+            self.log(f"failed: {path}: {e}")
+            return
+        self._done[path] = ident
+        self.exported += 1
+        try:
+            journal.record(path, outs)
+        except OSError:
+            pass
+        # landing-to-output latency, measured from the source's last write
+        latency = time.time() - ident[1] / 1e9
+        self.log(f"{os.path.basename(path)} -> {'; '.join(outs)} ({latency * 1000:.0f} ms)")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Watermark images as they arrive in a folder")
+    ap.add_argument("watch_dir")
+    ap.add_argument("--output", help="output folder (default: the template's)")
+    ap.add_argument("--template", help="saved template name (default: last GUI settings)")
+    ap.add_argument("--recursive", action="store_true", help="also watch subfolders")
+    ap.add_argument("--existing", action="store_true", help="also export images already in the folder")
+    ap.add_argument("--settle", type=float, default=DEFAULT_SETTLE,
+                    help="seconds a polled file must stay unchanged before export")
+    ap.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    ap.add_argument("--polling", action="store_true", help="use scandir polling even where inotify works")
+    ap.add_argument("--workers", type=int, default=0, help="parallel exports (default: export settings)")
+    args = ap.parse_args(argv)
+
+    from . import templates as tmpl
+    loaded = tmpl.load_template(args.template) if args.template else tmpl.load_last()
+    if args.template and loaded is None:
+        print(f"unknown template: {args.template}", file=sys.stderr)
+        return 2
+    wm, exp = loaded or (WatermarkSettings(), ExportSettings())
+    if args.output:
+        exp.output_dir = args.output
+    if not exp.output_dir:
+        print("no output folder: pass --output", file=sys.stderr)
+        return 2
+    exp.output_dir = os.path.abspath(exp.output_dir)
+    watcher = FolderWatcher(args.watch_dir, wm, exp, args.recursive, args.settle, args.poll_interval,
+                            args.workers, args.polling, log=lambda m: print(m, flush=True))
+    watcher.run(existing=args.existing)
+    print(f"exported {watcher.exported}, failed {watcher.failed}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+"""Buffered vs memory-mapped source reading (app/inputs.py).
+
+Writes synthetic images of several sizes and formats into --dir (point it at the disk
+you care about, e.g. an NVMe scratch folder or /dev/shm), then times a full decode
+through Image.open(path) and through inputs.open_image(path, threshold=0). Files are
+read several times each, so the numbers reflect the warm page cache, as when the same
+source is opened for the thumbnail, the preview and the export.
+
+    python bench/bench_mmap.py [--dir /dev/shm] [--sides 1000,2000,4000,8000] [--repeat 5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image  # noqa: E402
+from app.inputs import open_image, release_mapping  # noqa: E402
+
+FORMATS = {
+    "JPEG": (".jpg", {"format": "JPEG", "quality": 90}),
+    "PNG": (".png", {"format": "PNG", "compress_level": 1}),
+    "TIFF": (".tif", {"format": "TIFF"}),
+    "TIFF-deflate": (".tif", {"format": "TIFF", "compression": "tiff_deflate"}),
+}
+
+
+def synthetic(side: int) -> Image.Image:
+    # smooth gradients plus noise: compresses like a photo rather than like a flat fill
+    w, h = side, side * 3 // 4
+    grad = Image.linear_gradient("L").resize((w, h))
+    noise = Image.effect_noise((w, h), 40)
+    return Image.merge("RGB", (grad, noise, grad.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+
+def time_decode(open_fn, path: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        im = open_fn(path)
+        im.load()
+        release_mapping(im)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def time_read(path: str, repeat: int, mapped: bool) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        if mapped:
+            from app.inputs import map_file
+            r = map_file(path)
+            while r.read(1 << 16):
+                pass
+            r.close()
+        else:
+            with open(path, "rb") as f:
+                while f.read(1 << 16):
+                    pass
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dir", default=None, help="where to write the test files (default: system temp)")
+    ap.add_argument("--sides", default="1000,2000,4000,8000")
+    ap.add_argument("--formats", default=",".join(FORMATS))
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_mmap_", dir=args.dir)
+    try:
+        print(f"{'format':<13}{'side':>6}{'file MB':>9}{'read buf':>10}{'read mmap':>10}"
+              f"{'decode buf':>12}{'decode mmap':>12}{'mmap/buf':>10}")
+        for side in (int(s) for s in args.sides.split(",")):
+            im = synthetic(side)
+            for name in args.formats.split(","):
+                ext, kwargs = FORMATS[name]
+                path = os.path.join(work, f"{name}_{side}{ext}")
+                im.save(path, **kwargs)
+                mb = os.path.getsize(path) / 1e6
+                read_buf = time_read(path, args.repeat, mapped=False)
+                read_map = time_read(path, args.repeat, mapped=True)
+                buf = time_decode(Image.open, path, args.repeat)
+                mapped = time_decode(lambda p: open_image(p, threshold=0), path, args.repeat)
+                print(f"{name:<13}{side:>6}{mb:>9.1f}{read_buf * 1000:>9.1f}m{read_map * 1000:>9.1f}m"
+                      f"{buf * 1000:>11.1f}m{mapped * 1000:>11.1f}m{mapped / buf:>10.2f}")
+                os.remove(path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
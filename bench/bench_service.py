@@ -0,0 +1,89 @@
+"""Load test for the local HTTP watermarking service (app/service.py).
+
+Starts the service in-process on a free localhost port, sends concurrent POSTs of a
+sample image, and prints throughput, client latency, 503 counts and the /metrics page.
+
+    python bench/bench_service.py [--image picture/picture1.jpg] [--requests 200] [--clients 8]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.service import WatermarkService, make_server  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--image", default=os.path.join(ROOT, "picture", "picture1.jpg"))
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--queue", type=int, default=16)
+    ap.add_argument("--batch", type=int, default=8)
+    args = ap.parse_args()
+
+    with open(args.image, "rb") as f:
+        payload = f.read()
+    service = WatermarkService(args.workers, args.queue, args.batch)
+    service.start()
+    server = make_server(service, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:%d" % server.server_address[1]
+
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            req = urllib.request.Request(base + "/watermark", data=payload, method="POST")
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=120) as resp:
+                    resp.read()
+                    status = resp.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+                if status == 503:
+                    time.sleep(float(e.headers.get("Retry-After", "1")) / 10)
+            except (urllib.error.URLError, ConnectionError) as e:
+                status = type(e).__name__
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    ok = statuses.get(200, 0)
+    print(f"{ok} ok in {wall:.2f}s = {ok / wall:.1f} images/s with {service.workers} workers; statuses {statuses}")
+    if latencies:
+        lat = sorted(latencies)
+        print(f"client latency: p50 {statistics.median(lat) * 1000:.0f} ms, "
+              f"p95 {lat[int(0.95 * (len(lat) - 1))] * 1000:.0f} ms")
+    with urllib.request.urlopen(base + "/metrics") as resp:
+        print(resp.read().decode("utf-8"))
+    server.shutdown()
+    service.stop()
+
+
+if __name__ == "__main__":
+    main()
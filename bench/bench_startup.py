@@ -0,0 +1,93 @@
+"""Startup-time budget check for Watermark Studio.
+
+Launches the app N times with WATERMARK_STUDIO_STARTUP_PROBE set (it prints
+``startup_ms=...`` once the window is shown and quits), reports the median, and
+lists the slowest imports from ``python -X importtime``. Exits 1 when the median
+exceeds the budget or when a module that should be deferred is imported at startup.
+
+    python bench/bench_startup.py [--runs 5] [--budget-ms 1500]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once the user renders text, adjusts opacity, exports or prefetches
+DEFERRED_MODULES = ("PIL.ImageFont", "PIL.ImageDraw", "PIL.ImageEnhance", "app.exporter", "concurrent.futures")
+
+
+def _env():
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["WATERMARK_STUDIO_STARTUP_PROBE"] = "1"
+    return env
+
+
+def measure_once():
+    """(in-process ms to first frame, wall-clock ms including interpreter start)."""
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "app.main"], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, timeout=60)
+    wall = (time.perf_counter() - t0) * 1000
+    m = re.search(r"startup_ms=([\d.]+)", out.stdout)
+    if not m:
+        raise RuntimeError(f"no startup probe output (exit {out.returncode}):\n{out.stderr}")
+    return float(m.group(1)), wall
+
+
+def import_profile():
+    """[(cumulative_us, module)] for ``import app.gui``, slowest first."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.gui"],
+                         cwd=ROOT, env=_env(), capture_output=True, text=True, timeout=60)
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(.*)$", line)
+        if m:
+            rows.append((int(m.group(1)), m.group(2).strip()))
+    rows.sort(reverse=True)
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=1500.0)
+    ap.add_argument("--top", type=int, default=15)
+    args = ap.parse_args()
+
+    probes, walls = [], []
+    for _ in range(args.runs):
+        probe, wall = measure_once()
+        probes.append(probe)
+        walls.append(wall)
+    median = statistics.median(probes)
+    print(f"startup (to first frame): median {median:.0f} ms, min {min(probes):.0f} ms over {args.runs} runs")
+    print(f"process wall clock:       median {statistics.median(walls):.0f} ms")
+
+    rows = import_profile()
+    print(f"\nslowest imports (cumulative, import app.gui):")
+    for us, name in rows[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = {name for _, name in rows}
+    eager = [m for m in DEFERRED_MODULES if m in loaded]
+    if eager:
+        print(f"\nFAIL: imported at startup but should be deferred: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL: median startup {median:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print(f"\nOK: within {args.budget_ms:.0f} ms budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
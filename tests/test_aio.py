@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+from PIL import Image
+
+from app.aio import watermark_batch
+from app.engine import ExportSettings, WatermarkSettings
+
+
+def _collect(paths, exp):
+    async def run():
+        return [r async for r in watermark_batch(paths, WatermarkSettings(), exp, concurrency=2)]
+    return asyncio.run(asyncio.wait_for(run(), timeout=30))
+
+
+def test_watermark_batch_exports_every_path(tmp_path):
+    src = tmp_path / "a.png"
+    Image.new("RGB", (32, 24), "red").save(src)
+    results = _collect([str(src), str(tmp_path / "missing.png")], ExportSettings(output_dir=str(tmp_path / "out")))
+    assert sorted((r.index, r.ok) for r in results) == [(0, True), (1, False)]
+
+
+def test_watermark_batch_reraises_failing_iterator(tmp_path):
+    src = tmp_path / "a.png"
+    Image.new("RGB", (32, 24), "red").save(src)
+
+    def paths():
+        yield str(src)
+        raise RuntimeError("listing failed")
+
+    with pytest.raises(RuntimeError, match="listing failed"):
+        _collect(paths(), ExportSettings(output_dir=str(tmp_path / "out")))
@@ -0,0 +1,25 @@
+from PIL import Image
+
+from app.batch import run_batch
+from app.engine import ExportSettings, WatermarkSettings
+
+
+def _sources(tmp_path, n=3):
+    files = []
+    for i in range(n):
+        p = tmp_path / f"src{i}.png"
+        Image.new("RGB", (32, 24), (i * 60, 90, 160)).save(p)
+        files.append(str(p))
+    return files
+
+
+def test_reexport_redoes_finished_files_unless_resuming(tmp_path):
+    files = _sources(tmp_path)
+    exp = ExportSettings(output_dir=str(tmp_path / "out"))
+    assert run_batch(files, WatermarkSettings(), exp).success == 3
+    again = run_batch(files, WatermarkSettings(), exp)
+    assert (again.success, again.resumed) == (3, 0)
+
+    exp.resume_export = True
+    resumed = run_batch(files, WatermarkSettings(), exp)
+    assert (resumed.success, resumed.resumed) == (3, 3)
@@ -0,0 +1,66 @@
+import json
+import multiprocessing
+import os
+import time
+
+from PIL import Image
+
+from app.distributed import collect_results, requeue_stale, run_worker, submit_job
+from app.engine import ExportSettings, WatermarkSettings
+
+
+def _job(tmp_path, n_files, chunk):
+    src = tmp_path / "src"
+    src.mkdir()
+    files = []
+    for i in range(n_files):
+        path = src / f"{i:02d}.png"
+        Image.new("RGB", (32, 24), (i * 20, 40, 40)).save(path)
+        files.append(str(path))
+    exp = ExportSettings(output_dir=str(tmp_path / "out"), out_format="PNG")
+    return submit_job(str(tmp_path / "shared"), files, WatermarkSettings(), exp, chunk=chunk), files
+
+
+def _quiet(*args):
+    pass
+
+
+def _worker(job_dir, worker_id):
+    run_worker(job_dir, worker_id, poll=0.05, log=_quiet)
+
+
+def test_workers_process_every_file_once(tmp_path):
+    job_dir, files = _job(tmp_path, 10, chunk=2)
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_worker, args=(job_dir, f"w{i}")) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(120)
+        assert p.exitcode == 0
+
+    assert sorted(os.listdir(os.path.join(job_dir, "done"))) == [f"{n:06d}.json" for n in range(5)]
+    assert os.listdir(os.path.join(job_dir, "todo")) == []
+    assert os.listdir(os.path.join(job_dir, "claimed")) == []
+    results = collect_results(job_dir)
+    assert [r["index"] for r in results] == list(range(10))
+    assert [r["src"] for r in results] == files
+    assert all(r["ok"] for r in results)
+    assert len(os.listdir(tmp_path / "out")) == 10
+
+
+def test_requeue_stale_returns_an_abandoned_claim(tmp_path):
+    job_dir, _ = _job(tmp_path, 4, chunk=2)
+    claim = os.path.join(job_dir, "claimed", "000000.json@dead-worker")
+    os.rename(os.path.join(job_dir, "todo", "000000.json"), claim)
+    old = time.time() - 600
+    os.utime(claim, (old, old))
+    # a live claim next to it stays where it is
+    live = os.path.join(job_dir, "claimed", "000001.json@busy-worker")
+    os.rename(os.path.join(job_dir, "todo", "000001.json"), live)
+
+    assert requeue_stale(job_dir, stale_after=60) == 1
+    assert os.listdir(os.path.join(job_dir, "claimed")) == ["000001.json@busy-worker"]
+    assert os.listdir(os.path.join(job_dir, "todo")) == ["000000.json"]
+    with open(os.path.join(job_dir, "todo", "000000.json"), encoding="utf-8") as f:
+        assert json.load(f)["attempts"] == 1
@@ -0,0 +1,25 @@
+import io
+
+from PIL import Image
+
+from app.engine import ExportSettings, Rendition, WatermarkSettings, export_bytes
+
+
+def _png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 40, 40)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_export_bytes_reports_jpeg_format():
+    outputs = export_bytes(_png_bytes(), WatermarkSettings(), ExportSettings(out_format="JPEG"))
+    assert [(o.name_tail, o.out_format) for o in outputs] == [(".jpg", "JPEG")]
+    assert Image.open(io.BytesIO(bytes(outputs[0].data))).format == "JPEG"
+
+
+def test_export_bytes_reports_each_rendition_format():
+    exp = ExportSettings(out_format="JPEG", renditions=[Rendition(suffix="_web", out_format="WEBP")])
+    outputs = export_bytes(_png_bytes(), WatermarkSettings(), exp)
+    for o in outputs:
+        assert Image.open(io.BytesIO(bytes(o.data))).format == o.out_format
+    assert [o.out_format for o in outputs] == ["JPEG", "WEBP"]
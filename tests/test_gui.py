@@ -0,0 +1,29 @@
+from app.engine import Rendition
+from app.gui import _format_renditions, _parse_renditions
+
+
+def test_renditions_text_round_trips_every_field():
+    renditions = [
+        Rendition(suffix="_1600", out_format="WEBP", quality=85, resize_mode="long_edge", resize_value=1600),
+        Rendition(suffix="_thumb", out_format="JPEG", quality=80, resize_mode="width", resize_value=400,
+                  target_size_kb=60),
+        Rendition(suffix="_h300", out_format="PNG", quality=90, resize_mode="height", resize_value=300),
+        Rendition(suffix="_50pct", out_format="JPEG", quality=70, resize_mode="percent", resize_value=50),
+        Rendition(suffix="_copy", out_format="JPEG", quality=95),
+    ]
+    text = _format_renditions(renditions)
+    assert text == ("1600/WEBP/85; w400/JPEG/80/kb=60/suffix=_thumb; h300/PNG/90; "
+                    "50%/JPEG/70; full/JPEG/95/suffix=_copy")
+    assert _parse_renditions(text) == renditions
+
+
+def test_renditions_text_keeps_the_short_form():
+    assert _parse_renditions("1600/webp/85; 400/JPEG/80; bad; 0/JPEG/80") == [
+        Rendition(suffix="_1600", out_format="WEBP", quality=85, resize_mode="long_edge", resize_value=1600),
+        Rendition(suffix="_400", out_format="JPEG", quality=80, resize_mode="long_edge", resize_value=400),
+    ]
+
+
+def test_inexpressible_renditions_have_no_text_form():
+    assert _format_renditions([Rendition(suffix="", out_format="JPEG")]) is None
+    assert _format_renditions([Rendition(suffix="_a;b", resize_mode="long_edge", resize_value=100)]) is None
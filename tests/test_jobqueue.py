@@ -0,0 +1,34 @@
+from PIL import Image
+
+from app.batch import run_batch
+from app.engine import ExportSettings, WatermarkSettings
+from app.jobqueue import DONE, PAUSED, JobQueue
+
+
+def _run(queue, job, stop_after=None):
+    wm, exp = job.settings_pair()
+    seen = []
+    result = run_batch(job.files, wm, exp, lambda *a: seen.append(a),
+                       lambda: stop_after is not None and len(seen) >= stop_after)
+    queue.mark_stopped(job, result.success, result.failures, result.pending)
+    return result
+
+
+def test_stop_and_resume_records_no_failures(tmp_path):
+    files = []
+    for i in range(8):
+        p = tmp_path / f"src{i}.png"
+        Image.new("RGB", (32, 24), (i * 30, 90, 160)).save(p)
+        files.append(str(p))
+    queue = JobQueue(str(tmp_path / "queue.json"))
+    exp = ExportSettings(output_dir=str(tmp_path / "out"), export_workers=1)
+    job = queue.add(files, WatermarkSettings(), exp)
+
+    first = _run(queue, job, stop_after=3)
+    assert first.stopped and len(first.pending) == 5
+    assert first.failures == []
+    assert job.state == PAUSED and job.failures == []
+
+    second = _run(queue, job)
+    assert second.success == 5
+    assert job.state == DONE and job.success == 8 and job.failures == []
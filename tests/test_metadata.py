@@ -0,0 +1,39 @@
+import io
+
+from PIL import Image
+
+from app.engine import ExportSettings, WatermarkSettings, export_bytes
+from app.metadata import ORIENTATION_TAG, patch_exif
+
+_STRUCTURE = (0x0100, 0x0101, 0x0102, 0x0103, 0x0106, 0x0111, 0x0115, 0x0116, 0x0117)
+
+
+def _tiff_bytes():
+    exif = Image.Exif()
+    exif[0x010F] = "Maker"  # Make
+    exif[0x0110] = "Model"  # Model
+    exif[ORIENTATION_TAG] = 1
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (10, 120, 200)).save(buf, "TIFF", exif=exif)
+    return buf.getvalue()
+
+
+def test_jpeg_export_of_tiff_drops_strip_tags():
+    outputs = export_bytes(_tiff_bytes(), WatermarkSettings(), ExportSettings(out_format="JPEG"))
+    exif = Image.open(io.BytesIO(bytes(outputs[0].data))).getexif()
+    assert not [t for t in _STRUCTURE if t in exif]
+    assert exif[0x010F] == "Maker" and exif[0x0110] == "Model"
+
+
+def test_patch_exif_keeps_other_tags_and_offsets():
+    exif = Image.Exif()
+    exif[0x0100] = 640
+    exif[0x0111] = 8
+    exif[0x010E] = "a description longer than four bytes"
+    exif[0x0131] = "software"
+    exif[ORIENTATION_TAG] = 6
+    raw = exif.tobytes()
+    patched = Image.Exif()
+    patched.load(patch_exif(raw))
+    assert dict(patched) == {0x010E: "a description longer than four bytes", 0x0131: "software",
+                             ORIENTATION_TAG: 1}
@@ -0,0 +1,58 @@
+import io
+import os
+import threading
+import urllib.request
+
+from PIL import Image
+
+from app.engine import ExportSettings, WatermarkSettings, export_bytes
+from app.service import WatermarkService, make_server
+
+
+def _png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 40, 40)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _run(service, data, key, settings):
+    job = service.submit(data, key, settings)
+    assert job.done.wait(60)
+    return job.result
+
+
+def test_service_recovers_from_a_dead_worker():
+    service = WatermarkService(workers=1, batch_wait=0)
+    service.start()
+    try:
+        key, settings = service.resolve_settings(None, None)
+        assert _run(service, _png_bytes(), key, settings)[0]
+        # a worker exiting underneath the pool breaks it for every later submit
+        service._pool.submit(os._exit, 1).exception(60)
+        _run(service, _png_bytes(), key, settings)  # may fail with the broken pool
+        ok, payload, content_type, _ = _run(service, _png_bytes(), key, settings)
+        assert ok, payload
+        assert content_type == "image/jpeg"
+        assert service.render_metrics().count("watermark_batches_inflight 0") == 1
+    finally:
+        service.stop()
+
+
+def test_post_returns_the_engine_output():
+    service = WatermarkService(workers=1, batch_wait=0)
+    service.start()
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        host, port = server.server_address[:2]
+        req = urllib.request.Request(f"http://{host}:{port}/watermark", data=_png_bytes(), method="POST")
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            assert resp.status == 200
+            assert resp.headers["Content-Type"] == "image/jpeg"
+            body = resp.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+    expected = export_bytes(_png_bytes(), WatermarkSettings(), ExportSettings())[0]
+    assert body == bytes(expected.data)
@@ -0,0 +1,50 @@
+import tarfile
+import zipfile
+
+from PIL import Image
+
+from app.batch import run_batch
+from app.engine import ExportSettings, WatermarkSettings
+
+
+def _sources(tmp_path, n=3):
+    paths = []
+    for i in range(n):
+        p = tmp_path / f"src{i}.png"
+        Image.new("RGB", (40, 30), (i * 60, 80, 120)).save(p)
+        paths.append(str(p))
+    return paths
+
+
+def _names(path, fmt):
+    if fmt == "zip":
+        with zipfile.ZipFile(path) as z:
+            return [i.filename for i in z.infolist()]
+    with tarfile.open(path) as t:
+        return t.getnames()
+
+
+def test_reexport_with_changed_settings_rewrites_archive(tmp_path):
+    files = _sources(tmp_path)
+    for fmt in ("zip", "tar"):
+        out = tmp_path / ("out_" + fmt)
+        exp = ExportSettings(output_dir=str(out), archive_format=fmt, archive_name="delivery",
+                             resume_export=True)
+        assert run_batch(files, WatermarkSettings(), exp).success == 3
+        exp.jpeg_quality = 60  # different settings fingerprint, same output names
+        assert run_batch(files, WatermarkSettings(), exp).success == 3
+        names = _names(str(out / ("delivery." + fmt)), fmt)
+        assert len(names) == 3
+        assert len(set(names)) == len(names)
+
+
+def test_resumed_archive_keeps_each_name_once(tmp_path):
+    files = _sources(tmp_path)
+    out = tmp_path / "out"
+    exp = ExportSettings(output_dir=str(out), archive_format="zip", archive_name="delivery",
+                         resume_export=True)
+    assert run_batch(files[:2], WatermarkSettings(), exp).success == 2
+    result = run_batch(files, WatermarkSettings(), exp)
+    assert (result.success, result.resumed) == (3, 2)
+    names = _names(str(out / "delivery.zip"), "zip")
+    assert sorted(names) == sorted(set(names)) and len(names) == 3
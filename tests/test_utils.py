@@ -0,0 +1,37 @@
+import gc
+
+import pytest
+from PIL import Image
+
+from app import utils
+
+
+def _pixels(qimg):
+    from PyQt5.QtGui import QImage
+    qimg = qimg.convertToFormat(QImage.Format_RGBA8888)
+    ptr = qimg.constBits()
+    ptr.setsize(qimg.bytesPerLine() * qimg.height())
+    return bytes(ptr)
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_qimage_from_pil_matches_the_source(monkeypatch, shared):
+    monkeypatch.setattr(utils, "_SHARED_ROWS", shared and utils._SHARED_ROWS)
+    img = Image.linear_gradient("L").resize((37, 23)).convert("RGBA")
+    expected = img.tobytes("raw", "RGBA")
+    qimg = utils.qimage_from_pil(img)
+    if shared:
+        # the borrowed pixels stay valid after the caller drops its image
+        assert qimg._owner is img or not utils._SHARED_ROWS
+    del img
+    gc.collect()
+    assert (qimg.width(), qimg.height()) == (37, 23)
+    assert _pixels(qimg) == expected
+
+
+def test_shared_rows_only_on_checked_pillow_versions():
+    img = Image.new("RGBA", (8, 8))
+    if not utils._SHARED_ROWS:
+        assert utils._shared_rgba_rows(img) is None
+    else:
+        assert utils._shared_rgba_rows(img) is not None
@@ -5,6 +5,8 @@ from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
 from PIL.ExifTags import TAGS
 import piexif
+from app.inputs import open_image, release_mapping
+from app.metadata import read_metadata, apply_orientation, save_kwargs
 
 
 def get_exif_date(image_path):
@@ -125,13 +127,21 @@ def calculate_position(base_width, base_height, text_width, text_height, positio
         return base_width - text_width - padding, base_height - text_height - padding
 
 
-def add_watermark_to_image(image_path, output_path, font_size, color, position):
+def add_watermark_to_image(image_path, output_path, font_size, color, position, strip_gps=False):
     """
     给单张图片添加水印并保存到 output_path
+    按 EXIF 方向摆正后再加水印；EXIF/ICC 原样写入输出，可选移除 GPS
     """
     try:
-        image = Image.open(image_path).convert("RGBA")
-        date_str, source = get_exif_date(image_path)
+        source = open_image(image_path)
+        try:
+            meta = read_metadata(source)
+            image = apply_orientation(source, meta.orientation).convert("RGBA")
+        finally:
+            # 大文件以内存映射打开，像素读入后立即释放映射
+            release_mapping(source)
+            source.close()
+        date_str, date_source = get_exif_date(image_path)
         if not date_str:
             print(f"Skipping {os.path.basename(image_path)}: no date available")
             return False
@@ -169,8 +179,8 @@ def add_watermark_to_image(image_path, output_path, font_size, color, position):
         result = Image.alpha_composite(image, watermark)
         # 确保目录存在
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        result.convert("RGB").save(output_path)
-        print(f"Processed: {os.path.basename(image_path)} -> {os.path.basename(output_path)} (date source: {source})")
+        result.convert("RGB").save(output_path, **save_kwargs(meta, strip_gps))
+        print(f"Processed: {os.path.basename(image_path)} -> {os.path.basename(output_path)} (date source: {date_source})")
         return True
 
     except Exception as e:
@@ -178,7 +188,7 @@ def add_watermark_to_image(image_path, output_path, font_size, color, position):
         return False
 
 
-def process_images(input_path, font_size, color, position):
+def process_images(input_path, font_size, color, position, strip_gps=False):
     if not os.path.exists(input_path):
         print(f"Error: Path {input_path} does not exist")
         return
@@ -203,7 +213,7 @@ def process_images(input_path, font_size, color, position):
     for file_path in files:
         output_filename = f"watermarked_{os.path.basename(file_path)}"
         output_path = os.path.join(output_dir, output_filename)
-        if add_watermark_to_image(file_path, output_path, font_size, color, position):
+        if add_watermark_to_image(file_path, output_path, font_size, color, position, strip_gps):
             success_count += 1
 
     print(f"\nCompleted! Successfully processed {success_count} images. Output directory: {output_dir}")
@@ -218,10 +228,11 @@ def main():
     parser.add_argument("--position", type=str, default="bottom-right",
                         choices=["top-left", "top-right", "bottom-left", "bottom-right", "center"],
                         help="Watermark position, default is bottom-right")
+    parser.add_argument("--strip_gps", action="store_true", help="Remove GPS location from the copied EXIF")
     args = parser.parse_args()
 
     color = parse_color(args.color)
-    process_images(args.input_path, args.font_size, color, args.position)
+    process_images(args.input_path, args.font_size, color, args.position, args.strip_gps)
 
 
 if __name__ == "__main__":